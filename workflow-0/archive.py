@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import zlib
+import time
+
+import numpy as np
+
+from collect import get_idx
+
+
+# A results archive stores docking results (`.out` lines or `.sdf` records) in
+# independently compressed chunks, with an index which maps each ligand
+# position to its chunk and to its offset within the uncompressed chunk.
+# Reading the results for a few ligands thus only decompresses the chunks
+# which contain them, instead of the whole result file.
+#
+# An archive `<name>.arc` consists of three files:
+#
+#   <name>.arc            : gzip members, one per chunk - `zcat <name>.arc`
+#                           returns all records, in the order they were added
+#   <name>.arc.chunks.npy : file offset and compressed size of each chunk
+#   <name>.arc.index.npy  : `(pos, chunk, off, len)` for each record, sorted
+#                           by position
+#
+# The index files are replaced atomically after the data are appended, so an
+# interrupted append leaves a consistent archive (plus some unused bytes).
+# Like `collect.py`, records which are already in the archive take precedence
+# over newly added records for the same position.
+
+# uncompressed size of a chunk: bounds the work for reading a single record
+CHUNK_SIZE = 256 * 1024
+
+INDEX_DTYPE = np.dtype([('pos', '<i8'), ('chunk', '<i4'),
+                        ('off', '<i4'), ('len', '<i4')])
+
+
+# ------------------------------------------------------------------------------
+#
+def compress(data):
+
+    comp = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return comp.compress(data) + comp.flush()
+
+
+# ------------------------------------------------------------------------------
+#
+def decompress(data):
+
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+# ------------------------------------------------------------------------------
+#
+def read_out(fname):
+    '''
+    iterate over the `[pos, record]` pairs of a `.out` result file
+    '''
+
+    with open(fname, 'rb') as fin:
+        for line in fin:
+            idx = get_idx(line.decode())
+            if idx is not None:
+                yield idx, line
+
+
+# ------------------------------------------------------------------------------
+#
+def read_sdf(fname, tag):
+    '''
+    iterate over the `[pos, record]` pairs of an `.sdf` file, where the ligand
+    position is given by the SD data item `tag`
+    '''
+
+    key    = ('<%s>' % tag).encode()
+    record = list()
+    pos    = None
+    is_key = False
+
+    with open(fname, 'rb') as fin:
+        for line in fin:
+
+            record.append(line)
+
+            if is_key:
+                try:
+                    pos = int(line)
+                except ValueError:
+                    pos = None
+                is_key = False
+
+            elif line.startswith(b'>') and key in line:
+                is_key = True
+
+            elif line.startswith(b'$$$$'):
+                if pos is not None:
+                    yield pos, b''.join(record)
+                record = list()
+                pos    = None
+
+
+# ------------------------------------------------------------------------------
+#
+class Archive(object):
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, fname):
+
+        self._fname  = fname
+        self._cname  = '%s.chunks.npy' % fname
+        self._iname  = '%s.index.npy'  % fname
+
+        if os.path.isfile(self._iname):
+            self._chunks = np.load(self._cname)
+            self._index  = np.load(self._iname, mmap_mode='r')
+        else:
+            self._chunks = np.zeros((0, 2), dtype=np.int64)
+            self._index  = np.zeros(0, dtype=INDEX_DTYPE)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __len__(self):
+
+        return len(self._index)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def n_chunks(self):
+
+        return len(self._chunks)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def positions(self):
+        '''
+        return a sorted array with all ligand positions in the archive
+        '''
+
+        return np.array(self._index['pos'])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _commit(self, chunks, index):
+        '''
+        Store the new chunk table and the index.  The index is sorted by
+        position, and only the first record per position is kept - the
+        existing index comes first in `index`, so existing records win.
+        '''
+
+        order = np.argsort(index['pos'], kind='stable')
+        index = index[order]
+        if len(index):
+            uniq  = np.concatenate(([True], index['pos'][1:] !=
+                                            index['pos'][:-1]))
+            index = index[uniq]
+
+        for fname, data in [[self._cname, chunks], [self._iname, index]]:
+            with open('%s.tmp' % fname, 'wb') as fout:
+                np.save(fout, data)
+            os.rename('%s.tmp' % fname, fname)
+
+        self._chunks = chunks
+        self._index  = np.load(self._iname, mmap_mode='r')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def append(self, records):
+        '''
+        Add the given `[pos, record]` pairs to the archive, where `record` is
+        a bytes object.  Return the number of records added.
+        '''
+
+        chunks = [self._chunks]
+        index  = [np.array(self._index)]
+        buf    = list()
+        size   = 0
+        n      = 0
+
+        with open(self._fname, 'ab') as fout:
+
+            offset = fout.tell()
+
+            def flush():
+
+                nonlocal offset, buf, size
+
+                if not buf:
+                    return
+
+                chunk = self.n_chunks + sum([len(c) for c in chunks[1:]])
+                data  = compress(b''.join([rec for _, rec in buf]))
+                entry = np.zeros(len(buf), dtype=INDEX_DTYPE)
+                off   = 0
+                for i, (pos, rec) in enumerate(buf):
+                    entry[i] = (pos, chunk, off, len(rec))
+                    off     += len(rec)
+
+                fout.write(data)
+                chunks.append(np.array([[offset, len(data)]], dtype=np.int64))
+                index.append(entry)
+
+                offset += len(data)
+                buf     = list()
+                size    = 0
+
+            for pos, rec in records:
+                buf.append([pos, rec])
+                size += len(rec)
+                n    += 1
+                if size >= CHUNK_SIZE:
+                    flush()
+            flush()
+
+        self._commit(np.concatenate(chunks), np.concatenate(index))
+
+        return n
+
+
+    # --------------------------------------------------------------------------
+    #
+    def merge(self, other):
+        '''
+        Append all chunks of another archive without recompressing them.
+        Records for positions which exist in this archive are not indexed.
+        Return the number of records in the other archive.
+        '''
+
+        if not len(other):
+            return 0
+
+        base  = self.n_chunks
+
+        with open(self._fname, 'ab') as fout:
+            offset = fout.tell()
+            with open(other._fname, 'rb') as fin:
+                for start, size in other._chunks:
+                    fin.seek(start)
+                    fout.write(fin.read(size))
+
+        # the chunks are written back to back
+        chunks        = np.array(other._chunks)
+        chunks[:, 0]  = offset + np.concatenate(([0],
+                                                 np.cumsum(chunks[:-1, 1])))
+
+        entries           = np.array(other._index)
+        entries['chunk'] += base
+
+        self._commit(np.concatenate([self._chunks, chunks]),
+                     np.concatenate([np.array(self._index), entries]))
+
+        return len(other)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def get(self, positions):
+        '''
+        Return a dict `{pos: record}` for all given positions found in the
+        archive.  Each chunk is read and decompressed at most once.
+        '''
+
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        keys      = self._index['pos']
+        idx       = np.searchsorted(keys, positions)
+        found     = idx < len(keys)
+        found[found] = keys[idx[found]] == positions[found]
+        entries   = np.array(self._index[idx[found]])
+
+        ret = dict()
+        if not len(entries):
+            return ret
+
+        entries = entries[np.argsort(entries['chunk'], kind='stable')]
+
+        with open(self._fname, 'rb') as fin:
+            for chunk in np.unique(entries['chunk']):
+                start, size = self._chunks[chunk]
+                fin.seek(start)
+                data = decompress(fin.read(size))
+                for entry in entries[entries['chunk'] == chunk]:
+                    off = entry['off']
+                    ret[int(entry['pos'])] = data[off:off + entry['len']]
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def records(self):
+        '''
+        iterate over all indexed `[pos, record]` pairs, in chunk order
+        '''
+
+        index  = np.array(self._index)
+        index  = index[np.lexsort((index['off'], index['chunk']))]
+        bounds = np.searchsorted(index['chunk'], np.arange(self.n_chunks + 1))
+
+        with open(self._fname, 'rb') as fin:
+            for chunk, (start, size) in enumerate(self._chunks):
+                entries = index[bounds[chunk]:bounds[chunk + 1]]
+                if not len(entries):
+                    continue
+                fin.seek(start)
+                data = decompress(fin.read(size))
+                for entry in entries:
+                    off = entry['off']
+                    yield int(entry['pos']), data[off:off + entry['len']]
+
+
+# ------------------------------------------------------------------------------
+#
+def usage(msg=None):
+
+    if msg:
+        print('error: %s' % msg)
+
+    print('usage: %s add   <archive> <file.out>' % sys.argv[0])
+    print('       %s add   <archive> <file.sdf> <tag>' % sys.argv[0])
+    print('       %s merge <archive> <archive> ...' % sys.argv[0])
+    print('       %s get   <archive> <pos | pos_file>' % sys.argv[0])
+    print('       %s stat  <archive>' % sys.argv[0])
+    sys.exit(1)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    if len(sys.argv) < 3:
+        usage()
+
+    mode  = sys.argv[1]
+    arc   = Archive(sys.argv[2])
+    start = time.time()
+
+    if mode == 'add':
+
+        if len(sys.argv) < 4:
+            usage()
+
+        fname = sys.argv[3]
+        if fname.endswith('.sdf'):
+            if len(sys.argv) < 5:
+                usage('sdf files need the SD tag which holds the position')
+            n = arc.append(read_sdf(fname, sys.argv[4]))
+        else:
+            n = arc.append(read_out(fname))
+
+        print('added %d records (%d ligands in %d chunks) [%.1fs]'
+              % (n, len(arc), arc.n_chunks, time.time() - start))
+
+    elif mode == 'merge':
+
+        for fname in sys.argv[3:]:
+            n = arc.merge(Archive(fname))
+            print('merged %s: %d records' % (fname, n))
+
+        print('%d ligands in %d chunks [%.1fs]'
+              % (len(arc), arc.n_chunks, time.time() - start))
+
+    elif mode == 'get':
+
+        if len(sys.argv) < 4:
+            usage()
+
+        # positions are given directly or as a file with one position per
+        # line (further columns, like scores, are ignored)
+        if os.path.isfile(sys.argv[3]):
+            positions = list()
+            with open(sys.argv[3], 'r') as fin:
+                for line in fin:
+                    elems = line.split()
+                    if elems:
+                        positions.append(int(elems[0]))
+        else:
+            positions = [int(sys.argv[3])]
+
+        recs = arc.get(positions)
+        for pos in positions:
+            if pos in recs:
+                sys.stdout.buffer.write(recs[pos])
+
+        sys.stderr.write('%d / %d found [%.3fs]\n'
+                         % (len(recs), len(set(positions)),
+                            time.time() - start))
+
+    elif mode == 'stat':
+
+        size = os.path.getsize(sys.argv[2]) if arc.n_chunks else 0
+        pos  = arc.positions()
+        print('ligands: %10d' % len(arc))
+        print('chunks : %10d' % arc.n_chunks)
+        print('size   : %10.1f MB' % (size / 1024 / 1024))
+        if len(pos):
+            print('range  : %10d - %d' % (pos[0], pos[-1]))
+
+    else:
+        usage('unknown mode %s' % mode)
+
+
+# ------------------------------------------------------------------------------
+
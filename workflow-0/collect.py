@@ -4,20 +4,70 @@ import os
 import sys
 import glob
 import time
+import heapq
+import shutil
+import tempfile
 
-data = dict()
-sids = sys.argv[1:]
+import multiprocessing as mp
 
-if len(sids) == 1 and os.path.isfile(sids[0]):
-    data[sids[0][:-4]] = set()
 
-print()
-for sid in sids:
-  # print(sid)
-    oeb = None
-    smi = None
+# The results of all sessions are merged into one `<receptor>.out` file per
+# receptor, sorted and deduplicated by ligand index.  To keep memory bounded,
+# each session is turned into sorted runs of at most `RUN_SIZE` lines (one
+# process per session), and the runs are then k-way merged with the existing
+# (sorted) `.out` file, `FAN_IN` files at a time.
+
+RUN_SIZE = 1024 * 1024
+FAN_IN   = 256
+
+
+# ------------------------------------------------------------------------------
+#
+def get_idx(line):
+    '''
+    return the ligand index of a result line, or `None` for invalid lines
+    '''
+
+    if 'SMILES invalid' in line:
+        return None
+    try:
+        return int(line.split(None, 1)[0])
+    except:
+        return None
+
+
+# ------------------------------------------------------------------------------
+#
+def write_run(tmp, oeb, lines):
+    '''
+    sort `lines` by index and write them into a new run file
+    '''
+
+    fd, fname = tempfile.mkstemp(dir=tmp, prefix='%s.' % oeb, suffix='.run')
+    with os.fdopen(fd, 'w') as fout:
+        for _, line in sorted(lines, key=lambda x: x[0]):
+            fout.write(line)
+
+    return fname
+
+
+# ------------------------------------------------------------------------------
+#
+def collect_session(args):
+    '''
+    Turn the unit outputs of one session into sorted runs.  Return the session
+    id, the receptor names found, and a dict `{oeb: [n_lines, [run, ...]]}`.
+    '''
+
+    sid, tmp = args
+
+    runs  = dict()
+    lines = dict()
+    oebs  = set()
+
     for task in sorted(glob.glob('%s/pilot.*/unit.*/unit.*.sh' % sid)):
-        uid = os.path.basename(task)[:-3]
+        oeb = None
+        smi = None
         with open(task, 'r') as fin:
             for line in fin.readlines():
                 idx1 = line.find('theta_dock')
@@ -26,8 +76,7 @@ for sid in sids:
                 if idx2 < 0: idx2 = len(line)
                 try:
                     elems = line[idx1:idx2].split()
-                    smi, oeb             = elems[2], elems[3]
-                    idx_start, idx_count = elems[5], elems[6]
+                    smi, oeb = elems[2], elems[3]
                 except:
                     print(line[idx1:idx2])
                     raise
@@ -36,59 +85,160 @@ for sid in sids:
           # print('skip %s' % task)
             continue
         oeb = oeb.strip('"')
-        smi = smi.strip('"')
         oeb = os.path.basename(oeb)
-        smi = os.path.basename(smi)
         oeb = oeb[:-4]
-        smi = smi[:-4]
-
-        idx_start = idx_start.strip('"')
-        idx_count = idx_count.strip('"')
-        idx_start = int(idx_start)
-        idx_count = int(idx_count)
+        oebs.add(oeb)
 
-        if oeb not in data:
-            data[oeb] = set()
+        if oeb not in runs:
+            runs[oeb]  = [0, list()]
+            lines[oeb] = list()
 
-        cnt = 0
         with open('%s/STDOUT' % os.path.dirname(task), 'r') as fin:
-            for line in fin.readlines():
+            for line in fin:
                 if 'test,pl_pro' not in line:
                   # print('skip line:', line.strip())
                     continue
-                data[oeb].add(line)
-                cnt += 1
-      # print('    ', uid, oeb, smi, idx_start, idx_count, cnt)
-    if not oeb: print(sid)
-    else      : print(sid, oeb, len(data[oeb]))
-
-print()
-for oeb in data:
+                idx = get_idx(line)
+                if idx is None:
+                    continue
+                lines[oeb].append([idx, line])
+                runs[oeb][0] += 1
+
+                if len(lines[oeb]) >= RUN_SIZE:
+                    runs[oeb][1].append(write_run(tmp, oeb, lines[oeb]))
+                    lines[oeb] = list()
+
+    for oeb in lines:
+        if lines[oeb]:
+            runs[oeb][1].append(write_run(tmp, oeb, lines[oeb]))
+
+    return sid, oebs, runs
+
+
+# ------------------------------------------------------------------------------
+#
+def read_sorted(fname):
+    '''
+    iterate over the `[idx, line]` pairs of a file sorted by index
+    '''
+
+    with open(fname, 'r') as fin:
+        for line in fin:
+            idx = get_idx(line)
+            if idx is not None:
+                yield idx, line
+
+
+# ------------------------------------------------------------------------------
+#
+def merge(fnames, fout, dedup=True):
+    '''
+    k-way merge the given sorted files into `fout`.  If `dedup` is set, only the
+    first line for each index is kept, where earlier files take precedence.
+    Return the number of lines written.
+    '''
+
+    n    = 0
+    last = None
+    for idx, line in heapq.merge(*[read_sorted(f) for f in fnames],
+                                 key=lambda x: x[0]):
+        if dedup and idx == last:
+            continue
+        fout.write(line)
+        last = idx
+        n   += 1
+
+    return n
+
+
+# ------------------------------------------------------------------------------
+#
+def merge_runs(tmp, oeb, fnames):
+    '''
+    Merge all runs for a receptor into the (sorted) `<oeb>.out` file.  If there
+    are more than `FAN_IN` inputs, the runs are merged in several passes.
+    '''
+
     fname = '%s.out' % oeb
+    tname = '%s.tmp' % oeb
+
+    # the existing results come first so that they take precedence on
+    # duplicated indexes
     if os.path.exists(fname):
         print('+ %s' % fname)
-        with open(fname, 'r') as fin:
-            for line in fin.readlines():
-                data[oeb].add(line)
+        fnames = [fname] + fnames
+
+    while len(fnames) > FAN_IN:
+        merged = list()
+        for i in range(0, len(fnames), FAN_IN):
+            batch = fnames[i:i + FAN_IN]
+            fd, pname = tempfile.mkstemp(dir=tmp, prefix='%s.' % oeb,
+                                         suffix='.run')
+            with os.fdopen(fd, 'w') as fout:
+                merge(batch, fout, dedup=False)
+            merged.append(pname)
+        fnames = merged
 
-print()
-for oeb in data:
-    tname = '%s.tmp' % oeb
-    fname = '%s.out' % oeb
     print('write %s' % tname)
-    with open(tname, 'a') as fout:
-        valid = list()
-        for line in list(data[oeb]):
-            if 'SMILES invalid' not in line:
-                try:
-                    cnt = int(line.split()[0])
-                except:
-                    continue
-                valid.append([cnt, line])
+    with open(tname, 'w') as fout:
+        n = merge(fnames, fout)
+    os.rename(tname, fname)
+
+    return n
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    sids  = sys.argv[1:]
+    runs  = dict()
+    start = time.time()
+    tmp   = tempfile.mkdtemp(dir='.', prefix='collect.')
+
+    try:
+        # an existing `.out` file as only argument is re-sorted (older
+        # versions did not guarantee sorted output)
+        if len(sids) == 1 and os.path.isfile(sids[0]):
+            oeb   = sids[0][:-4]
+            lines = list()
+            runs[oeb] = list()
+            with open(sids[0], 'r') as fin:
+                for line in fin:
+                    idx = get_idx(line)
+                    if idx is not None:
+                        lines.append([idx, line])
+                    if len(lines) >= RUN_SIZE:
+                        runs[oeb].append(write_run(tmp, oeb, lines))
+                        lines = list()
+            if lines:
+                runs[oeb].append(write_run(tmp, oeb, lines))
+            os.rename(sids[0], '%s.bak' % sids[0])
+            sids = list()
+
+        print()
+        # sessions are merged in the given order (earlier sessions take
+        # precedence on duplicated indexes), independent of completion order
+        with mp.Pool() as pool:
+            for sid, oebs, sruns in pool.imap(collect_session,
+                                              [[sid, tmp] for sid in sids]):
+                if not oebs:
+                    print(sid)
+                for oeb in oebs:
+                    print(sid, oeb, sruns[oeb][0])
+                    if oeb not in runs:
+                        runs[oeb] = list()
+                    runs[oeb] += sruns[oeb][1]
+
+        print()
+        for oeb in runs:
+            n = merge_runs(tmp, oeb, runs[oeb])
+            print('%s: %d' % (oeb, n))
 
-        for entry in sorted(valid, key=lambda x: x[0]):
-            fout.write(entry[1])
-    os.system('mv %s %s' % (tname, fname))
+    finally:
+        shutil.rmtree(tmp)
 
-print()
+    print()
+    print('%.1fs' % (time.time() - start))
+    print()
 
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+# Turn the missing ligands of a receptor into new work: either a balanced
+# specfile for `theta_dock_rp_loop.py` / `frontera_remote_rp_loop.py`, or a work
+# list for the wf0 masters.
+#
+# The missing ligands are read from a `.gaps` file (as written by `check.py`),
+# or are computed from a `.out` result file.  For a specfile, the missing
+# ligands are split into `n_pilots * n_tasks` chunks of about equal cost (see
+# `plan.py`): large gaps are split over several tasks, and small gaps are
+# merged into one task.  As a chunk can span several gaps, a task can have
+# several ranges - `theta_dock.sh` reads the lines `uid, uid + uids, ...` of
+# the specfile, so the ranges of task `uid` are written to those lines, and
+# tasks with fewer ranges are padded with empty lines.
+#
+# The work list has one `idx_0 - idx_1` line (inclusive) per gap.  When copied
+# to `<results>/<smiles>/<receptor>.todo`, the wf0 masters only dock the
+# listed ligands (see `wf0_oe_frontera/wf0_master.py`).
+
+import sys
+
+import numpy as np
+
+import plan
+import ligand_coverage
+
+
+# ------------------------------------------------------------------------------
+#
+def read_gaps(fname):
+    '''
+    return a `[n, 2]` array with the (inclusive) ranges in a `.gaps` file
+    '''
+
+    gaps = list()
+    with open(fname, 'r') as fin:
+        for line in fin:
+            elems = line.replace('-', ' ').split()
+            if not elems:
+                continue
+            first = int(elems[0])
+            last  = int(elems[1]) if len(elems) > 1 else first
+            gaps.append([first, last])
+
+    return np.array(gaps, dtype=np.int64).reshape(-1, 2)
+
+
+# ------------------------------------------------------------------------------
+#
+def get_gaps(fname, tot):
+    '''
+    return the gaps from a `.gaps` file, or from the coverage of a `.out` file
+    '''
+
+    if fname.endswith('.out'):
+        mask, _, _ = ligand_coverage.coverage(fname, tot)
+        return ligand_coverage.find_gaps(mask)
+
+    return read_gaps(fname)
+
+
+# ------------------------------------------------------------------------------
+#
+def expand(gaps):
+    '''
+    return an array with all positions in the given ranges
+    '''
+
+    if not len(gaps):
+        return np.zeros(0, dtype=np.int64)
+
+    return np.concatenate([np.arange(first, last + 1) for first, last in gaps])
+
+
+# ------------------------------------------------------------------------------
+#
+def to_ranges(positions):
+    '''
+    return the `[first, last]` runs of consecutive values in a sorted array
+    '''
+
+    if not len(positions):
+        return list()
+
+    cuts   = np.flatnonzero(np.diff(positions) != 1) + 1
+    firsts = np.concatenate(([0], cuts))
+    lasts  = np.concatenate((cuts, [len(positions)])) - 1
+
+    return [[int(positions[f]), int(positions[l])]
+            for f, l in zip(firsts, lasts)]
+
+
+# ------------------------------------------------------------------------------
+#
+def schedule(smiles, gaps, n_chunks, history=None):
+    '''
+    Split the ligands in `gaps` into `n_chunks` chunks of about equal cost.
+    Return a list of chunks, each a list of `[first, last]` ranges, and the
+    expected cost for each chunk.
+    '''
+
+    positions = expand(gaps)
+    costs     = plan.ligand_costs(smiles, positions, history)
+    chunks    = list()
+    loads     = list()
+
+    for first, last in plan.partition(costs, n_chunks):
+        chunks.append(to_ranges(positions[first:last + 1]))
+        loads.append(float(costs[first:last + 1].sum()))
+
+    return chunks, loads
+
+
+# ------------------------------------------------------------------------------
+#
+def write_specfile(fname, chunks, uids):
+    '''
+    Write the ranges of chunk `uid` to the specfile lines `uid + n * uids`.
+    The trailing empty line terminates all tasks: `theta_dock.sh` reads past
+    the end of the specfile as its last line.
+    '''
+
+    assert(len(chunks) <= uids), [len(chunks), uids]
+
+    rows = max([len(chunk) for chunk in chunks] + [0])
+
+    with open(fname, 'w') as fout:
+        for row in range(rows):
+            for uid in range(uids):
+                if uid < len(chunks) and row < len(chunks[uid]):
+                    fout.write('%10d - %10d\n' % tuple(chunks[uid][row]))
+                else:
+                    fout.write('\n')
+        fout.write('\n')
+
+
+# ------------------------------------------------------------------------------
+#
+def write_worklist(fname, gaps):
+
+    with open(fname, 'w') as fout:
+        for first, last in gaps:
+            fout.write('%10d - %10d\n' % (first, last))
+
+
+# ------------------------------------------------------------------------------
+#
+def usage(msg=None):
+
+    if msg:
+        print('error: %s' % msg)
+
+    print('usage: %s spec <gaps|out> <smi_file> <n_pilots> <n_tasks> '
+          '<specfile> [session ...]' % sys.argv[0])
+    print('       %s work <gaps|out> <smi_file> <worklist>' % sys.argv[0])
+    sys.exit(1)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    if len(sys.argv) < 5:
+        usage()
+
+    mode      = sys.argv[1]
+    gap_fname = sys.argv[2]
+    smi_fname = sys.argv[3]
+
+    if mode == 'work':
+
+        tot  = ligand_coverage.count_ligands(smi_fname)
+        gaps = get_gaps(gap_fname, tot)
+
+        write_worklist(sys.argv[4], gaps)
+        print('missing: %10d in %d gaps' % (int((gaps[:, 1] - gaps[:, 0] + 1)
+                                                .sum()), len(gaps)))
+        print('wrote %d ranges to %s' % (len(gaps), sys.argv[4]))
+
+    elif mode == 'spec':
+
+        if len(sys.argv) < 7:
+            usage()
+
+        n_pilots = int(sys.argv[4])
+        n_tasks  = int(sys.argv[5])    # tasks per pilot
+        specfile =     sys.argv[6]
+        sids     =     sys.argv[7:]    # sessions with profiles to learn from
+
+        smiles   = plan.read_smiles(smi_fname)
+        history  = plan.read_history(sids)
+        gaps     = get_gaps(gap_fname, len(smiles))
+        uids     = n_pilots * n_tasks
+
+        assert(not len(gaps) or gaps[-1, 1] < len(smiles)), gaps[-1]
+
+        chunks, loads = schedule(smiles, gaps, uids, history)
+        write_specfile(specfile, chunks, uids)
+
+        print('missing: %10d in %d gaps' % (int((gaps[:, 1] - gaps[:, 0] + 1)
+                                                .sum()), len(gaps)))
+        print('history: %10d' % len(history))
+
+        for p in range(n_pilots):
+            chunk = loads[p * n_tasks:(p + 1) * n_tasks]
+            if chunk:
+                print('pilot %3d: %4d tasks  load %12.1f  [%10.1f - %10.1f]'
+                      % (p, len(chunk), sum(chunk), min(chunk), max(chunk)))
+
+        print('wrote %d ranges for %d tasks to %s'
+              % (sum([len(chunk) for chunk in chunks]), len(chunks), specfile))
+
+    else:
+        usage('unknown mode %s' % mode)
+
+
+# ------------------------------------------------------------------------------
+
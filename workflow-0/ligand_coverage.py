@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# Ligand coverage of docking result files, shared by the `check.py` scripts of
+# workflow-0 and workflow-1: which ligand indexes of a smiles file are found in
+# a result file, and which runs of indexes are missing.
+
+import numpy as np
+
+
+# bytes per parsing block, and mask elements per gap search block - both bound
+# the memory used on top of the coverage mask (one byte per ligand)
+BLOCK_BYTES = 64 * 1024 * 1024
+BLOCK       = 64 * 1024 * 1024
+
+# longest ligand index (digits) accepted when parsing result files
+MAX_DIGITS  = 18
+
+
+# ------------------------------------------------------------------------------
+#
+def count_lines(fname):
+    '''
+    return the number of lines in a file (a last line without newline counts)
+    '''
+
+    n    = 0
+    last = b'\n'
+    with open(fname, 'rb') as fin:
+        while True:
+            data = fin.read(16 * 1024 * 1024)
+            if not data:
+                break
+            n   += data.count(b'\n')
+            last = data[-1:]
+    if last != b'\n':
+        n += 1
+    return n
+
+
+# ------------------------------------------------------------------------------
+#
+def count_ligands(fname):
+    '''
+    return the number of ligands in a smiles file: all lines but the header
+    '''
+
+    return max(count_lines(fname) - 1, 0)
+
+
+# ------------------------------------------------------------------------------
+#
+def parse_indexes(data):
+    '''
+    Return the leading integers of all lines in `data` (bytes of complete,
+    newline terminated lines) as int64 array.  Blank lines are skipped.  The
+    lines are parsed with numpy, one digit position at a time for all lines,
+    so the cost per line is a few vector operations instead of Python calls.
+    '''
+
+    buf    = np.frombuffer(data, dtype=np.uint8)
+    nls    = np.flatnonzero(buf == ord('\n'))
+    starts = np.empty(len(nls), dtype=np.int64)
+    starts[0]  = 0
+    starts[1:] = nls[:-1] + 1
+
+    neg    = buf[starts] == ord('-')
+    starts = starts + neg
+    vals   = np.zeros(len(starts), dtype=np.int64)
+    size   = np.zeros(len(starts), dtype=np.int64)
+    alive  = np.ones (len(starts), dtype=bool)    # still within the digits
+
+    for pos in range(MAX_DIGITS + 1):
+        digit  = buf.take(starts + pos, mode='clip') - np.uint8(ord('0'))
+        alive &= digit < 10
+        if not alive.any():
+            break
+        size  += alive
+        np.multiply(vals, 10,    out=vals, where=alive)
+        np.add     (vals, digit, out=vals, where=alive)
+
+    # the digits must be followed by white space (the newline at the latest)
+    ends = buf.take(starts + size, mode='clip')
+    bad  = (ends > ord(' ')) | (size > MAX_DIGITS)
+
+    # lines without digits must be blank
+    empty = size == 0
+    if empty.any():
+        for i in np.flatnonzero(empty):
+            if data[starts[i] - neg[i]:nls[i]].strip():
+                bad[i] = True
+
+    if bad.any():
+        raise ValueError('failed: %s' % _line(data, starts[bad][0]))
+
+    vals[neg] *= -1
+
+    return vals[~empty]
+
+
+# ------------------------------------------------------------------------------
+#
+def _line(data, pos):
+
+    first = data.rfind(b'\n', 0, pos) + 1
+    return data[first:data.index(b'\n', pos)]
+
+
+# ------------------------------------------------------------------------------
+#
+def read_indexes(fname):
+    '''
+    iterate over the ligand indexes in a result file, as int64 arrays (one per
+    block of `BLOCK_BYTES` bytes)
+    '''
+
+    rest = b''
+    with open(fname, 'rb') as fin:
+        while True:
+            data = fin.read(BLOCK_BYTES)
+            if not data:
+                break
+            data = rest + data
+            cut  = data.rfind(b'\n') + 1
+            rest = data[cut:]
+            if cut:
+                yield parse_indexes(data[:cut])
+
+    if rest:
+        yield parse_indexes(rest + b'\n')
+
+
+# ------------------------------------------------------------------------------
+#
+def coverage(fname, tot):
+    '''
+    Return a boolean mask of length `tot` with all ligand indexes found in the
+    result file, the number of duplicated indexes, and the number of distinct
+    indexes outside of `[0, tot)`.
+    '''
+
+    mask  = np.zeros(tot, dtype=bool)
+    dup   = 0
+    extra = set()
+
+    for idx in read_indexes(fname):
+
+        if not len(idx):
+            continue
+
+        idx.sort()
+        uniq = np.concatenate(([True], idx[1:] != idx[:-1]))
+        dup += len(idx) - int(uniq.sum())
+        idx  = idx[uniq]
+
+        out = (idx < 0) | (idx >= tot)
+        if out.any():
+            new   = set(idx[out].tolist())
+            dup  += len(new & extra)
+            extra.update(new)
+            idx   = idx[~out]
+
+        dup      += int(mask[idx].sum())
+        mask[idx] = True
+
+    return mask, dup, len(extra)
+
+
+# ------------------------------------------------------------------------------
+#
+def find_gaps(mask):
+    '''
+    Return a `[n, 2]` array with the first and last index (inclusive) of all
+    runs of missing indexes in the coverage mask.  The mask is scanned in
+    blocks of `BLOCK` elements.
+    '''
+
+    starts = list()
+    stops  = list()
+    prev   = 0    # was the last element of the previous block missing?
+
+    for off in range(0, len(mask), BLOCK):
+
+        miss  = ~mask[off:off + BLOCK]
+        edges = np.diff(miss.view(np.int8), prepend=np.int8(prev))
+
+        starts.append(np.flatnonzero(edges ==  1) + off)
+        stops .append(np.flatnonzero(edges == -1) + off - 1)
+
+        prev = int(miss[-1])
+
+    if prev:
+        stops.append(np.array([len(mask) - 1]))
+
+    if not starts:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    return np.stack([np.concatenate(starts), np.concatenate(stops)], axis=1)
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,616 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import threading
+import subprocess
+import collections
+
+import multiprocessing as mp
+
+import zmq
+import msgpack
+
+
+# A local stand-in for the `rp.task_overlay.Master` / `Worker` classes, as
+# used by the wf0 masters and workers: the master `submit`s workers and
+# `request`s work items, `result_cb` receives the completed requests (and can
+# return new ones), and workers `register_call` the methods which serve the
+# requests.  Both sides have a `_uid`, `_cfg`, `_log` and `_prof`.
+#
+# Instead of an agent and its ZMQ queues, the workers are local processes
+# (started by `submit`) which connect to a ZMQ ROUTER socket of the master over
+# IPC.  A worker sends its results together with the request for up to
+# `msg_batch` new work items (see the wf0 configs), and the master replies with
+# the next work items (msgpack encoded).  Work is thus pulled by idle workers,
+# like from the task overlay queues.  This allows to run and to measure the
+# request path without a pilot (see `overlay_bench.py`).  The work items held
+# by a worker which dies are handed out again to the remaining workers.
+#
+# Work items use the task overlay format:
+#
+#   {'uid': 'request.000001', 'mode': 'call',
+#    'data': {'method': 'dock', 'kwargs': {...}}}
+#
+# Only the `call` mode is supported.
+#
+# The wf0 scripts run on this backend if `WF0_OVERLAY=local` is set and this
+# directory is in the `PYTHONPATH`, for example in a `wf0_oe_frontera` sandbox:
+#
+#   WF0_OVERLAY=local PYTHONPATH=.. ./wf0_master.py 0
+#
+# The master then starts its workers from the task description it passes to
+# `submit` (`executable` and `arguments`, plus the worker config file, like the
+# agent does).  `pre_exec` commands and staging directives are not executed.
+
+NEW    = 'NEW'
+DONE   = 'DONE'
+FAILED = 'FAILED'
+
+
+# ------------------------------------------------------------------------------
+#
+class Config(dict):
+    '''
+    A dict with attribute access to its keys (nested dicts included), as the
+    wf0 workers expect from the task overlay config.  Missing keys read as
+    `None`.
+    '''
+
+    def __getattr__(self, key):
+
+        if key.startswith('__'):
+            raise AttributeError(key)
+
+        val = self.get(key)
+        if isinstance(val, dict) and not isinstance(val, Config):
+            val = Config(val)
+            self[key] = val
+        return val
+
+
+    def __setattr__(self, key, val):
+
+        self[key] = val
+
+
+# ------------------------------------------------------------------------------
+#
+def as_dict(cfg):
+    '''
+    convert a (nested) config into plain dicts and lists
+    '''
+
+    if hasattr(cfg, 'as_dict'):
+        cfg = cfg.as_dict()
+
+    if isinstance(cfg, dict):
+        return {key: as_dict(val) for key, val in cfg.items()}
+
+    if isinstance(cfg, (list, tuple)):
+        return [as_dict(val) for val in cfg]
+
+    return cfg
+
+
+# ------------------------------------------------------------------------------
+#
+class Task(object):
+    '''
+    A worker started from a task description, with the process interface used
+    by `Master.run` (`is_alive`, `join`, `terminate`).
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, descr, cfg):
+
+        fname = '%s.cfg' % cfg['uid']
+        with open(fname, 'w') as fout:
+            json.dump(cfg, fout)
+
+        env = dict(os.environ)
+        env.update(descr.get('environment') or dict())
+
+        cmd = [descr['executable']] + \
+              [str(arg) for arg in descr.get('arguments') or list()] + \
+              [fname]
+
+        self._proc = subprocess.Popen(cmd, env=env)
+
+
+    def is_alive(self):
+
+        return self._proc.poll() is None
+
+
+    def join(self, timeout=None):
+
+        try:
+            self._proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            pass
+
+
+    def terminate(self):
+
+        self._proc.terminate()
+        self._proc.wait()
+
+
+# ------------------------------------------------------------------------------
+#
+class Profiler(object):
+    '''
+    Write profile events in the RP format if `RADICAL_PROFILE` is set:
+
+        time,event,comp,thread,uid,state,msg
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, name):
+
+        self._name    = name
+        self._enabled = bool(os.environ.get('RADICAL_PROFILE'))
+        self._handle  = None
+
+        if self._enabled:
+            self._handle = open('%s.prof' % name, 'a')
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def enabled(self):
+
+        return self._enabled
+
+
+    # --------------------------------------------------------------------------
+    #
+    def prof(self, event, uid=None, state=None, msg=None, ts=None, comp=None):
+
+        if not self._enabled:
+            return
+
+        if ts is None:
+            ts = time.time()
+
+        self._handle.write('%.7f,%s,%s,%s,%s,%s,%s\n'
+                           % (ts, event, comp or self._name,
+                              threading.current_thread().name,
+                              uid or '', state or '', msg or ''))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def close(self):
+
+        if self._handle:
+            self._handle.close()
+            self._handle = None
+
+
+# ------------------------------------------------------------------------------
+#
+def get_logger(name):
+    '''
+    log to `<name>.log` if `RADICAL_LOG_LVL` is set, otherwise log warnings
+    and errors to stderr
+    '''
+
+    log = logging.getLogger(name)
+    if not log.handlers:
+        level = os.environ.get('RADICAL_LOG_LVL')
+        if level: handler = logging.FileHandler('%s.log' % name)
+        else    : handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(
+                                '%(created).3f : %(name)s : %(levelname)s : '
+                                '%(message)s'))
+        log.addHandler(handler)
+        log.setLevel((level or 'WARNING').upper())
+        log.propagate = False
+
+    return log
+
+
+# ------------------------------------------------------------------------------
+#
+class Request(object):
+    '''
+    a work item and its result, as passed to `Master.result_cb`
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, work):
+
+        self.uid     = work['uid']
+        self.work    = work
+        self.state   = NEW
+        self.result  = None
+
+        # timestamps: submitted to the master, sent to a worker, completed
+        self.t_submit = time.time()
+        self.t_sent   = None
+        self.t_done   = None
+
+
+# ------------------------------------------------------------------------------
+#
+class Master(object):
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, cfg=None):
+
+        if cfg is None:
+            cfg = dict()
+
+        self._cfg     = cfg
+        self._uid     = 'master.%03d' % cfg.get('idx', 0)
+        self._log     = get_logger(self._uid)
+        self._prof    = Profiler(self._uid)
+
+        # the socket is bound in `run`, after the workers are forked
+        self._addr    = 'ipc://%s/%s.%d.sock' % (tempfile.gettempdir(),
+                                                 self._uid, os.getpid())
+        self._workers = list()                 # worker processes
+        self._wuids   = list()                 # worker uids (ZMQ identities)
+        self._pending = collections.deque()    # requests not yet sent
+        self._open    = dict()                 # requests not yet completed
+        self._cnt     = 0
+
+        self._prof.prof('master_start', uid=self._uid)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def submit(self, descr=None, count=1, cores=1, gpus=0, worker=None):
+        '''
+        Start `count` workers, each with the master config plus the worker
+        `uid`, `cores`, `gpus` and the master address.  Like in the task
+        overlay, a worker is started by running `descr['executable']` with
+        `descr['arguments']` and the name of its config file.  Alternatively,
+        a worker class can be given as `worker`, which is then run in a process
+        forked from the master.
+        '''
+
+        if descr is None:
+            descr = dict()
+
+        assert(worker or descr.get('executable')), 'no worker given'
+
+        pctx = mp.get_context('fork')
+        for _ in range(count):
+
+            cfg          = as_dict(self._cfg)
+            cfg['uid']   = '%s.worker.%04d' % (self._uid, len(self._workers))
+            cfg['addr']  = self._addr
+            cfg['cores'] = cores
+            cfg['gpus']  = gpus
+
+            if worker:
+                proc = pctx.Process(target=_worker_main, args=[worker, cfg],
+                                    name=cfg['uid'])
+                proc.daemon = True
+                proc.start()
+
+            else:
+                proc = Task(descr, cfg)
+
+            self._workers.append(proc)
+            self._wuids.append(cfg['uid'].encode())
+
+        self._log.debug('submitted %d workers', count)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def request(self, reqs):
+        '''
+        queue one or more work items, return the respective requests
+        '''
+
+        if isinstance(reqs, dict):
+            reqs = [reqs]
+
+        ret = list()
+        for work in reqs:
+
+            if 'uid' not in work:
+                work['uid'] = 'request.%06d' % self._cnt
+            self._cnt += 1
+
+            req = Request(work)
+            self._open[req.uid] = req
+            self._pending.append(req)
+            ret.append(req)
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def create_work_items(self):
+        '''
+        overload to submit the initial requests
+        '''
+
+        pass
+
+
+    # --------------------------------------------------------------------------
+    #
+    def result_cb(self, requests):
+        '''
+        overload to handle completed requests - new work items can be returned
+        '''
+
+        return list()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def run(self):
+        '''
+        Create the initial work items and serve the workers until all requests
+        are completed, then terminate the workers.
+        '''
+
+        self._prof.prof('master_run_start', uid=self._uid)
+
+        zctx = zmq.Context()
+        sock = zctx.socket(zmq.ROUTER)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.bind(self._addr)
+
+        self.create_work_items()
+
+        idle   = collections.deque()     # `[ident, n]` of waiting workers
+        sent   = dict()                  # requests in flight per worker
+        gone   = set()                   # workers which terminated or died
+        n_term = 0
+        check  = time.time()
+
+        try:
+            while n_term < len(self._workers):
+
+                # requests held by dead workers are handed out again
+                if time.time() - check > 1.0:
+                    n_term += self._reap(idle, sent, gone)
+                    check   = time.time()
+                    if n_term >= len(self._workers):
+                        break
+
+                if sock.poll(1000):
+
+                    ident, data = sock.recv_multipart()
+                    msg         = msgpack.unpackb(data, raw=False)
+
+                    if ident in gone:
+                        continue
+
+                    sent[ident] = list()
+                    if msg['res']:
+                        self._collect(msg['res'])
+
+                    idle.append([ident, msg['n']])
+
+                # hand out pending work items to idle workers
+                while idle and self._pending:
+                    ident, n = idle.popleft()
+                    now      = time.time()
+                    work     = list()
+                    while self._pending and len(work) < n:
+                        req        = self._pending.popleft()
+                        req.t_sent = now
+                        work.append(req.work)
+                        sent[ident].append(req)
+                    sock.send_multipart([ident, msgpack.packb(
+                                               {'work': work},
+                                               use_bin_type=True)])
+
+                # all done: let the waiting workers go
+                if not self._open:
+                    while idle:
+                        ident, _ = idle.popleft()
+                        sock.send_multipart([ident, msgpack.packb(
+                                                   {'term': True},
+                                                   use_bin_type=True)])
+                        gone.add(ident)
+                        n_term += 1
+
+            if self._open:
+                self._log.error('all workers are gone, %d requests open',
+                                len(self._open))
+
+        finally:
+            for proc in self._workers:
+                proc.join(timeout=1)
+                if proc.is_alive():
+                    proc.terminate()
+
+            sock.close()
+            zctx.term()
+
+            path = self._addr[len('ipc://'):]
+            if os.path.exists(path):
+                os.unlink(path)
+
+        self._prof.prof('master_run_stop', uid=self._uid)
+        self._prof.close()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _reap(self, idle, sent, gone):
+        '''
+        Find workers which died since the last check, and queue the requests
+        they held again (in front of the pending requests).  Return the number
+        of newly dead workers.
+        '''
+
+        n_dead = 0
+        for proc, ident in zip(self._workers, self._wuids):
+
+            if ident in gone or proc.is_alive():
+                continue
+
+            gone.add(ident)
+            n_dead += 1
+
+            lost = [req for req in sent.pop(ident, list())
+                        if req.uid in self._open]
+            self._log.warning('worker %s is gone, resending %d requests',
+                              ident.decode(), len(lost))
+            for req in reversed(lost):
+                req.t_sent = None
+                self._pending.appendleft(req)
+
+        if n_dead:
+            for item in list(idle):
+                if item[0] in gone:
+                    idle.remove(item)
+
+        return n_dead
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _collect(self, results):
+
+        now  = time.time()
+        done = list()
+        for res in results:
+
+            req = self._open.pop(res['uid'], None)
+            if not req:
+                self._log.warning('unknown request %s', res['uid'])
+                continue
+
+            req.state  = res['state']
+            req.result = res['result']
+            req.t_done = now
+            done.append(req)
+
+        new = self.result_cb(done)
+        if new:
+            self.request(new)
+
+
+# ------------------------------------------------------------------------------
+#
+class Worker(object):
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, cfg):
+
+        # like the task overlay workers, accept the name of a config file
+        if isinstance(cfg, str):
+            with open(cfg, 'r') as fin:
+                cfg = json.load(fin)
+
+        self._cfg   = Config(cfg)
+        self._uid   = cfg['uid']
+        self._log   = get_logger(self._uid)
+        self._prof  = Profiler(self._uid)
+        self._calls = dict()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def register_call(self, name, method):
+
+        self._calls[name] = method
+
+
+    # --------------------------------------------------------------------------
+    #
+    def pre_exec(self):
+        '''
+        overload to prepare the worker before requests are served
+        '''
+
+        pass
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _execute(self, work):
+
+        try:
+            if work.get('mode') != 'call':
+                raise ValueError('unsupported mode %s' % work.get('mode'))
+
+            data   = work['data']
+            method = self._calls[data['method']]
+            result = method(*data.get('args', []), **data.get('kwargs', {}))
+            state  = DONE
+
+        except Exception as e:
+            self._log.exception('request %s failed', work.get('uid'))
+            result = str(e)
+            state  = FAILED
+
+        return {'uid'   : work['uid'],
+                'state' : state,
+                'result': result}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def run(self):
+
+        self._prof.prof('worker_start', uid=self._uid)
+        self.pre_exec()
+
+        n    = self._cfg.get('msg_batch') or 1
+        zctx = zmq.Context()
+        sock = zctx.socket(zmq.DEALER)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.setsockopt(zmq.IDENTITY, self._uid.encode())
+        sock.connect(self._cfg['addr'])
+
+        results = list()
+        try:
+            while True:
+
+                sock.send(msgpack.packb({'res': results, 'n': n},
+                                        use_bin_type=True))
+                msg     = msgpack.unpackb(sock.recv(), raw=False)
+                results = list()
+
+                if msg.get('term'):
+                    break
+
+                for work in msg['work']:
+                    results.append(self._execute(work))
+
+        finally:
+            sock.close()
+            zctx.term()
+
+        self._prof.prof('worker_stop', uid=self._uid)
+        self._prof.close()
+
+
+# ------------------------------------------------------------------------------
+#
+def _worker_main(worker, cfg):
+
+    try:
+        worker(cfg).run()
+    except Exception:
+        get_logger(cfg['uid']).exception('worker failed')
+        sys.exit(1)
+
+
+# ------------------------------------------------------------------------------
+
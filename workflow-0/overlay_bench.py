@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+
+import numpy as np
+
+# run the wf0 master on the local stand-in of the task overlay
+os.environ['WF0_OVERLAY'] = 'local'
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE, 'wf0_oe_frontera'))
+
+import radical.utils as ru
+
+import local_overlay
+import wf0_master
+
+
+# Benchmark the request path of the task overlay with the local stand-in
+# (`local_overlay.py`): the wf0 master (`wf0_oe_frontera/wf0_master.py`) reads
+# a smiles file of `n_requests` ligands, and sends its `dock` requests to
+# `n_workers` local workers, for each given number of workers.  The workers are
+# started from the master's task description, like the agent would.  By
+# default they run the `dock` call of this script, which reads the ligand like
+# the wf0 worker does, but does not dock it.  With `--dock`, the actual wf0
+# worker (`wf0_oe_frontera/wf0_worker.py`) is run, which needs OpenEye, and the
+# input data, receptor and smiles file given in `wf0_oe_frontera/wf0.local.cfg`
+# - the number of requests is then given by the smiles file.
+#
+# Reported are
+#
+#   - the request rate, from the first request sent to the last result,
+#   - the latency percentiles, from sending a request to receiving its result
+#     (the time a request waits in the master is not included),
+#   - the CPU utilization of the master over its run (incl. worker startup).
+
+N_REQUESTS = 10000
+N_WORKERS  = [1, 10, 100, 1000]
+
+SMILES     = 'CC(=O)OC1=CC=CC=C1C(=O)O'
+
+
+# ------------------------------------------------------------------------------
+#
+class BenchMaster(wf0_master.MyMaster):
+    '''
+    the wf0 master, recording the completed requests
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, cfg):
+
+        self._done = list()
+
+        wf0_master.MyMaster.__init__(self, cfg)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def result_cb(self, requests):
+
+        self._done.extend(requests)
+        return wf0_master.MyMaster.result_cb(self, requests)
+
+
+# ------------------------------------------------------------------------------
+#
+class BenchWorker(local_overlay.Worker):
+    '''
+    a wf0 worker without docking
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, cfg):
+
+        local_overlay.Worker.__init__(self, cfg)
+
+        self.register_call('dock', self.dock)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def pre_exec(self):
+
+        self._fin = open('input_dir/%s.csv' % self._cfg.workload.smiles, 'r')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def dock(self, pos, off, uid):
+
+        self._prof.prof('dock_start', uid=uid)
+
+        self._fin.seek(off)
+        data = self._fin.readline().split(',')
+        _    = data[self._cfg.smi_col]
+
+        self._prof.prof('dock_stop', uid=uid)
+        return [[None, 'noop']]
+
+
+# ------------------------------------------------------------------------------
+#
+def setup(n_requests, cfg):
+    '''
+    Write the smiles file and its index for the master (in the current
+    directory).  With the index, the master reads all ligands of the file.
+    '''
+
+    os.makedirs('input_dir', exist_ok=True)
+
+    fname = 'input_dir/%s.csv' % cfg.workload.smiles
+    with open(fname, 'w') as fout:
+        fout.write('smiles,name\n')
+        offs = list()
+        for pos in range(n_requests):
+            offs.append(fout.tell())
+            fout.write('%s,lig.%d\n' % (SMILES, pos))
+        offs.append(fout.tell())   # EOF
+
+    with open('%s.idx' % fname, 'w') as fout:
+        for off in offs:
+            fout.write('%d\n' % off)
+
+
+# ------------------------------------------------------------------------------
+#
+def bench(n_workers, n_requests, msg_batch, dock=False):
+    '''
+    run the benchmark for one number of workers, return a dict of metrics
+    '''
+
+    if dock:
+        # name smiles and receptor without extensions, as `wf0.py` does
+        cfg   = ru.Config(cfg=ru.read_json(os.path.join(BASE, 'wf0_oe_frontera',
+                                                        'wf0.local.cfg')))
+        wl    = cfg.workload
+        wl.smiles   = wl.smiles.split('.csv')[0]
+        wl.receptor = wl.receptor.split('.oeb')[0]
+        wl.name     = '%s_-_%s' % (wl.receptor, wl.smiles)
+        wl.results  = 'results'
+        descr = {'executable' : sys.executable,
+                 'arguments'  : [os.path.join(BASE, 'wf0_oe_frontera',
+                                              'wf0_worker.py')],
+                 'environment': {'OE_LICENSE': 'oe_license.txt'}}
+    else:
+        cfg   = ru.Config(cfg={'n_masters': 1,
+                               'workload' : {'smiles' : 'bench',
+                                             'name'   : 'bench',
+                                             'results': 'results'}})
+        descr = {'executable': sys.executable,
+                 'arguments' : [os.path.abspath(__file__), 'worker']}
+
+    cfg.idx       = 0
+    cfg.msg_batch = msg_batch
+
+    # run in a scratch directory, with the input data linked for `--dock`
+    pwd  = os.getcwd()
+    tmp  = tempfile.mkdtemp(prefix='overlay_bench.')
+    env  = os.environ.get('PYTHONPATH')
+
+    os.environ['PYTHONPATH'] = os.pathsep.join([p for p in [BASE, env] if p])
+    os.chdir(tmp)
+
+    try:
+        if dock:
+            os.symlink(cfg.workload.input_dir,   'input_dir')
+            os.symlink(cfg.workload.impress_dir, 'impress_md')
+            os.symlink(cfg.workload.oe_license,  'oe_license.txt')
+        else:
+            setup(n_requests, cfg)
+
+        stdout     = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+        try:
+            ru_0   = resource.getrusage(resource.RUSAGE_SELF)
+            start  = time.time()
+
+            master = BenchMaster(cfg)
+            master.submit(descr=descr, count=n_workers, cores=1, gpus=0)
+            master.run()
+
+            stop   = time.time()
+            ru_1   = resource.getrusage(resource.RUSAGE_SELF)
+
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    finally:
+        os.chdir(pwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+        if env is None: del(os.environ['PYTHONPATH'])
+        else          : os.environ['PYTHONPATH'] = env
+
+    done   = master._done
+    failed = len([r for r in done if r.state != local_overlay.DONE])
+    t_sent = np.array([r.t_sent for r in done])
+    t_done = np.array([r.t_done for r in done])
+    lat    = (t_done - t_sent) * 1000
+    cpu    = (ru_1.ru_utime - ru_0.ru_utime) + (ru_1.ru_stime - ru_0.ru_stime)
+
+    return {'workers' : n_workers,
+            'requests': len(done),
+            'failed'  : failed,
+            'startup' : t_sent.min() - start,
+            'rate'    : len(done) / (t_done.max() - t_sent.min()),
+            'p50'     : np.percentile(lat, 50),
+            'p90'     : np.percentile(lat, 90),
+            'p99'     : np.percentile(lat, 99),
+            'cpu'     : cpu / (stop - start) * 100}
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    # usage: overlay_bench.py [--dock] [n_requests [msg_batch [n_workers ...]]]
+    #
+    # (the master starts its workers as `overlay_bench.py worker <cfg>`)
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'worker':
+        BenchWorker(sys.argv[2]).run()
+        sys.exit(0)
+
+    args = sys.argv[1:]
+    dock = '--dock' in args
+    args = [arg for arg in args if arg != '--dock']
+
+    n_requests = int(args[0]) if len(args) > 0 else N_REQUESTS
+    msg_batch  = int(args[1]) if len(args) > 1 else 1
+    n_workers  = [int(n) for n in args[2:]] or N_WORKERS
+
+    print('%8s  %9s  %6s  %9s  %10s  %9s  %9s  %9s  %7s'
+          % ('workers', 'requests', 'failed', 'startup', 'req/s',
+             'p50 [ms]', 'p90 [ms]', 'p99 [ms]', 'cpu [%]'))
+
+    for n in n_workers:
+        ret = bench(n, n_requests, msg_batch, dock)
+        print('%(workers)8d  %(requests)9d  %(failed)6d  %(startup)8.2fs  '
+              '%(rate)10.1f  %(p50)9.2f  %(p90)9.2f  %(p99)9.2f  %(cpu)7.1f'
+              % ret)
+        sys.stdout.flush()
+
+
+# ------------------------------------------------------------------------------
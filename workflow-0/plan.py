@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+
+# Plan the docking work for `theta_dock_rp_loop.py`: split an index range of
+# a smiles file into contiguous chunks of (about) equal cost, one chunk per
+# task, such that all tasks of all pilots finish at about the same time.
+#
+# The per-ligand cost is taken from previous sessions where available:
+#
+#   - `dock_start` / `dock_stop` profile events of the task overlay workers
+#     (uid `request.<pos>`) give the docking time for individual ligands;
+#   - `cu_exec_start` / `cu_exec_stop` events of `theta_dock.sh` units give
+#     the average docking time for the ligands listed in the unit's STDOUT.
+#
+# The cost of all other ligands is estimated from simple smiles descriptors,
+# with coefficients fitted to the measured times where available.
+#
+# The resulting specfile has one `idx_0 - idx_1` line (inclusive) per task,
+# as expected by `theta_dock.sh`, and is passed as last argument to
+# `theta_dock_rp_loop.py`.  Tasks without work get an empty line.
+
+import os
+import sys
+import glob
+
+import numpy as np
+
+
+# minimum number of measured ligands to fit the descriptor model
+N_FIT = 100
+
+
+# ------------------------------------------------------------------------------
+#
+def get_smiles_col(columns):
+
+    for idx, col in enumerate(columns):
+        if 'smile' in col.lower():
+            return idx
+
+    return 0
+
+
+# ------------------------------------------------------------------------------
+#
+def read_smiles(fname):
+    '''
+    return the list of smiles in the given file.  The file is expected to have
+    a header line which identifies the smiles column (see `theta_dock.py`).
+    '''
+
+    smiles = list()
+    with open(fname, 'r') as fin:
+
+        header = fin.readline()
+        sep    = ',' if ',' in header else None
+        col    = get_smiles_col(header.split(sep))
+
+        for line in fin:
+            elems = line.split(sep)
+            if len(elems) > col: smiles.append(elems[col].strip())
+            else               : smiles.append('')
+
+    return smiles
+
+
+# ------------------------------------------------------------------------------
+#
+def descriptors(smiles):
+    '''
+    Cheap descriptors which correlate with the docking time of a ligand: the
+    number of heavy atoms, of ring closures and of branches.  The smiles are
+    not parsed, so the counts are approximate.
+    '''
+
+    heavy = 0
+    rings = 0
+    branches = 0
+    bracket = False
+
+    for c in smiles:
+        if   c == '[': bracket = True; heavy += 1
+        elif c == ']': bracket = False
+        elif bracket : continue
+        elif c == '(': branches += 1
+        elif c.isdigit() or c == '%': rings += 1
+        elif c.isalpha() and c not in 'Hlr': heavy += 1
+
+    return [1.0, heavy, rings / 2.0, branches]
+
+
+# ------------------------------------------------------------------------------
+#
+def read_prof(fname):
+    '''
+    return a list of `[time, event, uid]` entries from an RP profile
+    '''
+
+    ret = list()
+    with open(fname, 'r') as fin:
+        for line in fin:
+            if line.startswith('#'):
+                continue
+            elems = line.split(',')
+            if len(elems) < 5:
+                continue
+            try:
+                ret.append([float(elems[0]), elems[1], elems[4]])
+            except ValueError:
+                pass
+
+    return ret
+
+
+# ------------------------------------------------------------------------------
+#
+def read_history(sids):
+    '''
+    Collect measured per-ligand docking times from the given session
+    directories.  Return a dict `{pos: seconds}`.
+    '''
+
+    times = dict()
+
+    for sid in sids:
+
+        # task overlay workers: one `dock_start` / `dock_stop` pair per ligand
+        for fname in glob.glob('%s/**/*.prof' % sid, recursive=True):
+
+            starts = dict()
+            for t, event, uid in read_prof(fname):
+
+                if not uid.startswith('request.'):
+                    continue
+
+                if event == 'dock_start':
+                    starts[uid] = t
+
+                elif event == 'dock_stop' and uid in starts:
+                    pos = int(uid.split('.')[-1])
+                    times[pos] = t - starts.pop(uid)
+
+        # `theta_dock.sh` units: average time per ligand over the unit runtime
+        for task in glob.glob('%s/pilot.*/unit.*/unit.*.sh' % sid):
+
+            udir  = os.path.dirname(task)
+            uid   = os.path.basename(task)[:-3]
+            pname = '%s/%s.prof'  % (udir, uid)
+            oname = '%s/STDOUT'   % udir
+
+            if not os.path.isfile(pname) or not os.path.isfile(oname):
+                continue
+
+            t_start = None
+            t_stop  = None
+            for t, event, _ in read_prof(pname):
+                if event == 'cu_exec_start': t_start = t
+                if event == 'cu_exec_stop' : t_stop  = t
+
+            if t_start is None or t_stop is None:
+                continue
+
+            cores = None
+            with open(task, 'r') as fin:
+                for line in fin:
+                    idx = line.find('theta_dock.sh')
+                    if idx >= 0:
+                        cores = int(line[idx:].split()[4].strip('"'))
+                        break
+
+            if not cores:
+                continue
+
+            done = list()
+            with open(oname, 'r') as fin:
+                for line in fin:
+                    try:
+                        done.append(int(line.split(' ', 1)[0]))
+                    except ValueError:
+                        pass
+
+            if not done:
+                continue
+
+            # the unit docks `cores` ligands concurrently
+            t_lig = (t_stop - t_start) * cores / len(done)
+            for pos in done:
+                if pos not in times:
+                    times[pos] = t_lig
+
+    return times
+
+
+# ------------------------------------------------------------------------------
+#
+def ligand_costs(smiles, positions, history=None):
+    '''
+    Return an array with the expected docking time for the ligands at the given
+    `positions` of the `smiles` list.  Measured times are used where available,
+    all other ligands are estimated from their descriptors.  Without any
+    history, the estimate is only a relative cost (in units of heavy atoms),
+    which is all that is needed for balancing.
+    '''
+
+    if not history:
+        history = dict()
+
+    positions = np.asarray(positions, dtype=np.int64)
+
+    desc  = np.array([descriptors(smiles[pos]) for pos in positions],
+                     dtype=np.float64).reshape(-1, 4)
+    coeff = np.array([1.0, 1.0, 0.0, 0.0])
+
+    # fit on all measured ligands, not only on the requested ones
+    known = [pos for pos in history if 0 <= pos < len(smiles)]
+    vals  = np.array([history[pos] for pos in known])
+
+    if len(known) >= N_FIT:
+        kdesc = np.array([descriptors(smiles[pos]) for pos in known])
+        coeff, _, _, _ = np.linalg.lstsq(kdesc, vals, rcond=None)
+
+    elif len(known):
+        # too few samples for a fit, but good enough to scale to seconds
+        kdesc  = np.array([descriptors(smiles[pos]) for pos in known])
+        coeff *= vals.sum() / kdesc.dot(coeff).sum()
+
+    costs = desc.dot(coeff)
+
+    # the fit may extrapolate badly for odd ligands - keep costs positive
+    if len(costs):
+        costs = np.maximum(costs, max(costs.mean() * 0.1, 1e-3))
+
+    for i, pos in enumerate(positions.tolist()):
+        if pos in history:
+            costs[i] = history[pos]
+
+    return costs
+
+
+# ------------------------------------------------------------------------------
+#
+def partition(costs, n_chunks):
+    '''
+    Split `costs` into `n_chunks` contiguous ranges of about equal total cost.
+    Return a list of `[first, last]` index pairs (inclusive, relative to the
+    start of `costs`).  Ranges are never empty, so there are fewer than
+    `n_chunks` ranges if there are less items than chunks.
+    '''
+
+    n_items = len(costs)
+    if not n_items:
+        return list()
+
+    n_chunks = min(n_chunks, n_items)
+    cum      = np.cumsum(costs)
+    targets  = cum[-1] * np.arange(1, n_chunks) / n_chunks
+    cuts     = np.searchsorted(cum, targets, side='left') + 1
+
+    # ensure that no range is empty
+    bounds = [0] + [int(c) for c in cuts] + [n_items]
+    for i in range(1, n_chunks):
+        bounds[i] = max(bounds[i], bounds[i - 1] + 1)
+    for i in range(n_chunks - 1, 0, -1):
+        bounds[i] = min(bounds[i], bounds[i + 1] - 1)
+
+    return [[bounds[i], bounds[i + 1] - 1] for i in range(n_chunks)]
+
+
+# ------------------------------------------------------------------------------
+#
+def write_specfile(fname, ranges, uids):
+    '''
+    Write one range per line for `uids` tasks.  With fewer ranges than tasks,
+    the remaining lines are left empty: `theta_dock.sh` reads past the end of
+    the specfile as its last line, and would otherwise dock the last range
+    again for each surplus task, while an empty line ends the task.
+    '''
+
+    assert(len(ranges) <= uids), [len(ranges), uids]
+
+    with open(fname, 'w') as fout:
+        for first, last in ranges:
+            fout.write('%10d - %10d\n' % (first, last))
+        for _ in range(uids - len(ranges)):
+            fout.write('\n')
+        fout.write('\n')
+
+
+# ------------------------------------------------------------------------------
+#
+def plan(smiles, idx_start, idx_stop, n_pilots, n_tasks, history=None):
+    '''
+    Return the index ranges for `n_pilots * n_tasks` tasks, ordered by unit
+    id (`p * n_tasks + t`), and the expected cost for each range.  With fewer
+    ligands than tasks there are fewer ranges than tasks, and the surplus
+    tasks get no work (see `write_specfile`).
+    '''
+
+    costs  = ligand_costs(smiles, np.arange(idx_start, idx_stop), history)
+    ranges = partition(costs, n_pilots * n_tasks)
+    loads  = [float(costs[first:last + 1].sum()) for first, last in ranges]
+    ranges = [[first + idx_start, last + idx_start] for first, last in ranges]
+
+    return ranges, loads
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    if len(sys.argv) < 7:
+        print('usage: %s <smi_file> <idx_start> <idx_stop> <n_pilots> '
+              '<n_tasks> <specfile> [session ...]' % sys.argv[0])
+        sys.exit(1)
+
+    smi_fname =     sys.argv[1]
+    idx_start = int(sys.argv[2])
+    idx_stop  = int(sys.argv[3])    # exclusive, `0` for end of file
+    n_pilots  = int(sys.argv[4])
+    n_tasks   = int(sys.argv[5])    # tasks per pilot
+    specfile  =     sys.argv[6]
+    sids      =     sys.argv[7:]    # sessions with profiles to learn from
+
+    smiles    = read_smiles(smi_fname)
+    history   = read_history(sids)
+
+    if not idx_stop:
+        idx_stop = len(smiles)
+
+    assert(idx_start < idx_stop <= len(smiles)), [idx_start, idx_stop]
+
+    print('smiles : %10d [%d - %d]' % (idx_stop - idx_start, idx_start,
+                                       idx_stop - 1))
+    print('history: %10d' % len(history))
+
+    ranges, loads = plan(smiles, idx_start, idx_stop, n_pilots, n_tasks,
+                         history)
+    write_specfile(specfile, ranges, n_pilots * n_tasks)
+
+    for p in range(n_pilots):
+        chunk = loads[p * n_tasks:(p + 1) * n_tasks]
+        if chunk:
+            print('pilot %3d: %4d tasks  load %12.1f  [%10.1f - %10.1f]'
+                  % (p, len(chunk), sum(chunk), min(chunk), max(chunk)))
+
+    print('wrote %d ranges to %s' % (len(ranges), specfile))
+
+
+# ------------------------------------------------------------------------------
+
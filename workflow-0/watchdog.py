@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+'''
+Per-call time budget for the docking workers.
+
+The task overlay workers of `wf0_oe_frontera` and `wf0_oe_theta` stage this
+module next to `wf0_worker.py`.  The guarded function runs in one persistent
+child process, forked from the worker on the first call, so it inherits the
+already loaded receptor and needs no re-initialization.  The arguments of each
+call are sent to the child over a pipe, and the result is sent back - there is
+no extra process per ligand.  Only a call which exceeds its budget (or which
+kills the child) costs a new process: the stuck child is killed, and the next
+call forks a fresh one - the stuck child does not linger or keep consuming
+a core.  This replaces the `sleep 60; kill $$` subshell which `smi.sh` spawns
+per ligand.
+
+Arguments and results are sent through a pipe, so they must be picklable:
+OEChem molecules need to be serialized by the caller (see `wf0_worker.py`).
+'''
+
+import os
+import signal
+import threading
+
+import multiprocessing as mp
+
+
+# ------------------------------------------------------------------------------
+#
+class Watchdog(object):
+    '''
+    Enforce a time budget on individual calls of `func` by running them in
+    a killable child process, which is reused until a call times out or the
+    child dies.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, func, timeout):
+
+        self._func    = func
+        self._timeout = timeout
+        self._ctx     = mp.get_context('fork')
+        self._lock    = threading.Lock()
+        self._child   = None
+        self._pipe    = None
+        self._owner   = None     # pid of the process which started the child
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _serve(self, pipe, other):
+
+        other.close()
+
+        while True:
+
+            try:
+                args, kwargs = pipe.recv()
+            except EOFError:
+                break
+
+            try:
+                pipe.send(('out', self._func(*args, **kwargs)))
+            except Exception as e:
+                try:
+                    pipe.send(('err', e))
+                except Exception:
+                    pipe.send(('err', RuntimeError(repr(e))))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _start(self):
+
+        ours, theirs = self._ctx.Pipe()
+
+        child = self._ctx.Process(target=self._serve, args=[theirs, ours])
+        child.daemon = True
+        child.start()
+        theirs.close()
+
+        self._child = child
+        self._pipe  = ours
+        self._owner = os.getpid()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _stop(self):
+
+        try:
+            os.kill(self._child.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+        self._child.join()
+        self._pipe.close()
+
+        code        = self._child.exitcode
+        self._child = None
+        self._pipe  = None
+
+        return code
+
+
+    # --------------------------------------------------------------------------
+    #
+    def run(self, *args, **kwargs):
+        '''
+        Call `func(*args, **kwargs)` in the child process and return its
+        result.  Raise a `TimeoutError` if the call did not complete within the
+        time budget (the child is killed), and a `RuntimeError` if the child
+        died without returning a result.  Exceptions raised by `func` are
+        re-raised in the caller.
+        '''
+
+        with self._lock:
+
+            # a child started by the process we were forked from is not ours
+            if self._child is None or self._owner != os.getpid():
+                self._start()
+
+            try:
+                self._pipe.send((args, kwargs))
+            except (BrokenPipeError, ConnectionResetError):
+                raise RuntimeError('call died (exit code %s)'
+                                   % self._stop()) from None
+
+            if not self._pipe.poll(self._timeout):
+                self._stop()
+                raise TimeoutError('timeout (>%s)' % self._timeout)
+
+            try:
+                kind, val = self._pipe.recv()
+            except EOFError:
+                raise RuntimeError('call died (exit code %s)'
+                                   % self._stop()) from None
+
+        if kind == 'err':
+            raise val
+
+        return val
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import sqlite3
+
+
+# ------------------------------------------------------------------------------
+#
+class CampaignDB(object):
+    '''
+    Local cache of the campaign status.  The remote results directory is
+    listed once per sync (with size and mtime for all entries), and only the
+    `.idx` files which changed since the last sync are counted again - that
+    costs two remote round trips, independent of the number of receptors and
+    smiles libraries in the campaign.  Line counts of the local smiles files
+    are cached by size and mtime as well.
+
+    Tables:
+
+      files   : one row per remote results entry (path relative to the results
+                directory), with size, mtime, and (for `.idx` files) the
+                number of lines (i.e., the number of completed ligands)
+      smiles  : one row per local smiles file, with size, mtime, and number of
+                ligands
+      rates   : one row per past pilot, with the number of docks and the
+                node-seconds it used (see `sizing.py`)
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, fname='campaign.db'):
+
+        self._fname = fname
+        self._db    = sqlite3.connect(fname)
+
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS files ('
+                             '  path   TEXT PRIMARY KEY,'
+                             '  size   INTEGER,'
+                             '  mtime  REAL,'
+                             '  lines  INTEGER,'
+                             '  synced REAL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS smiles ('
+                             '  path   TEXT PRIMARY KEY,'
+                             '  size   INTEGER,'
+                             '  mtime  REAL,'
+                             '  n_lig  INTEGER)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS rates ('
+                             '  pilot    TEXT PRIMARY KEY,'
+                             '  resource TEXT,'
+                             '  receptor TEXT,'
+                             '  smiles   TEXT,'
+                             '  nodes    INTEGER,'
+                             '  n_docks  INTEGER,'
+                             '  seconds  REAL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS rates_idx '
+                             'ON rates (resource, receptor)')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def close(self):
+
+        self._db.close()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def sync(self, shell, res_path):
+        '''
+        Update the cached state of the remote results directory `res_path`.
+        `shell` is expected to provide `run_sync(cmd) -> (ret, out, err)`,
+        like `radical.saga.utils.pty_shell.PTYShell`.
+        '''
+
+        now = time.time()
+        ret, out, err = shell.run_sync("find %s -mindepth 1 -maxdepth 2 "
+                                       "-printf '%%s %%T@ %%P\\n'" % res_path)
+        if ret:
+            raise RuntimeError('listing %s failed: %s' % (res_path, err))
+
+        remote = dict()
+        for line in out.split('\n'):
+            elems = line.strip().split(' ', 2)
+            if len(elems) != 3:
+                continue
+            remote[elems[2]] = [int(elems[0]), float(elems[1])]
+
+        cached = {row[0]: row[1:] for row in
+                  self._db.execute('SELECT path, size, mtime FROM files')}
+
+        # index files which were not counted yet (the count failed or was
+        # interrupted in an earlier sync) are counted again
+        stale = set([row[0] for row in
+                     self._db.execute('SELECT path FROM files '
+                                      'WHERE lines IS NULL')
+                     if row[0].endswith('.idx') and row[0] in remote])
+
+        with self._db:
+
+            for path in cached:
+                if path not in remote:
+                    self._db.execute('DELETE FROM files WHERE path = ?',
+                                     (path,))
+
+            for path, (size, mtime) in remote.items():
+                if cached.get(path) == (size, mtime):
+                    continue
+                self._db.execute('INSERT OR REPLACE INTO files '
+                                 '(path, size, mtime, lines, synced) '
+                                 'VALUES (?, ?, ?, NULL, ?)',
+                                 (path, size, mtime, now))
+                if path.endswith('.idx'):
+                    stale.add(path)
+
+        # count lines for all changed index files, in bulks to keep the command
+        # line short enough.  The counts `wc` reports are stored even if it
+        # fails for some files (e.g., files removed since the listing).
+        stale = sorted(stale)
+        bulk  = 512
+        for i in range(0, len(stale), bulk):
+
+            paths = stale[i:i + bulk]
+            ret, out, err = shell.run_sync('cd %s && wc -l %s'
+                                           % (res_path, ' '.join(paths)))
+
+            with self._db:
+                for line in out.split('\n'):
+                    elems = line.split()
+                    if len(elems) != 2 or elems[1] == 'total':
+                        continue
+                    self._db.execute('UPDATE files SET lines = ? '
+                                     'WHERE path = ?',
+                                     (int(elems[0]), elems[1]))
+
+            if ret:
+                raise RuntimeError('counting %s failed: %s' % (res_path, err))
+
+        return len(stale)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def list(self, path=''):
+        '''
+        return the names of all known remote entries in the given results
+        subdirectory (default: top level results directory).
+        '''
+
+        if path:
+            prefix = '%s/' % path.rstrip('/')
+            rows   = self._db.execute('SELECT path FROM files '
+                                      'WHERE substr(path, 1, ?) = ?',
+                                      (len(prefix), prefix))
+            return [row[0][len(prefix):] for row in rows]
+
+        else:
+            rows = self._db.execute('SELECT path FROM files '
+                                    "WHERE instr(path, '/') = 0")
+            return [row[0] for row in rows]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def forget(self, path):
+        '''
+        drop a remote entry from the cache (after it got moved or removed)
+        '''
+
+        with self._db:
+            self._db.execute('DELETE FROM files WHERE path = ?', (path,))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def n_done(self, receptor, smiles):
+        '''
+        return the number of completed ligands for a receptor / smiles pair
+        '''
+
+        path = '%s/%s_-_%s.idx' % (smiles, receptor, smiles)
+        row  = self._db.execute('SELECT lines FROM files WHERE path = ?',
+                                (path,)).fetchone()
+        if not row or row[0] is None:
+            return 0
+
+        return row[0]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def n_smiles(self, fname):
+        '''
+        return the number of ligands in a local smiles file (minus header)
+        '''
+
+        st  = os.stat(fname)
+        row = self._db.execute('SELECT size, mtime, n_lig FROM smiles '
+                               'WHERE path = ?', (fname,)).fetchone()
+
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            return row[2]
+
+        n_lines = 0
+        with open(fname, 'rb') as fin:
+            while True:
+                data = fin.read(1024 * 1024)
+                if not data:
+                    break
+                n_lines += data.count(b'\n')
+
+        n_lig = n_lines - 1
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO smiles '
+                             '(path, size, mtime, n_lig) VALUES (?, ?, ?, ?)',
+                             (fname, st.st_size, st.st_mtime, n_lig))
+
+        return n_lig
+
+
+    # --------------------------------------------------------------------------
+    #
+    def has_rate(self, pilot):
+
+        row = self._db.execute('SELECT 1 FROM rates WHERE pilot = ?',
+                               (pilot,)).fetchone()
+        return bool(row)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def add_rate(self, pilot, resource, receptor, smiles, nodes, n_docks,
+                       seconds):
+        '''
+        record the docking throughput measured for a past pilot
+        '''
+
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO rates '
+                             '(pilot, resource, receptor, smiles, nodes, '
+                             ' n_docks, seconds) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (pilot, resource, receptor, smiles, nodes,
+                              n_docks, seconds))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def rate(self, resource, receptor=None):
+        '''
+        return the measured docks per node-hour on the given resource (for the
+        given receptor, if specified), or `None` if nothing was measured.
+        '''
+
+        query = 'SELECT SUM(n_docks), SUM(nodes * seconds) FROM rates ' \
+                'WHERE resource = ?'
+        args  = [resource]
+
+        if receptor:
+            query += ' AND receptor = ?'
+            args.append(receptor)
+
+        n_docks, node_sec = self._db.execute(query, args).fetchone()
+
+        if not n_docks or not node_sec:
+            return None
+
+        return 3600.0 * n_docks / node_sec
+
+
+    # --------------------------------------------------------------------------
+    #
+    def rates(self):
+        '''
+        return `[resource, receptor, nodes, n_docks, node_hours]` for all
+        resource / receptor pairs with measurements
+        '''
+
+        rows = self._db.execute('SELECT resource, receptor, MAX(nodes), '
+                                '       SUM(n_docks), SUM(nodes * seconds) '
+                                'FROM rates GROUP BY resource, receptor '
+                                'ORDER BY resource, receptor')
+
+        return [[r[0], r[1], r[2], r[3], r[4] / 3600.0] for r in rows]
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    # dump the cached campaign status
+    db = CampaignDB(sys.argv[1] if len(sys.argv) > 1 else 'campaign.db')
+    for path in sorted(db.list()):
+        for fname in sorted(db.list(path)):
+            if fname.endswith('.idx'):
+                receptor = fname[:-4].split('_-_')[0]
+                print('%-30s %-25s %10d' % (receptor, path,
+                                            db.n_done(receptor, path)))
+    db.close()
+
+
+# ------------------------------------------------------------------------------
+
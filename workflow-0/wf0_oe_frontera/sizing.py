@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import glob
+import math
+
+import radical.utils as ru
+
+from campaign_db import CampaignDB
+
+
+# Size pilots from measured docking throughput.  The throughput of past pilots
+# is derived from the `dock_start` / `dock_stop` events in their profiles and
+# is recorded in the campaign database (see `campaign_db.py`).  For a new run,
+# the throughput measured for the same receptor on the same resource is used,
+# then the average throughput on that resource, and finally the configured
+# default (see `perf.md`).
+#
+# The sizing parameters are read from the `sizing` section of the config:
+#
+#   "sizing" : {
+#       "rate"        : 13000,  # default docks / node-hr
+#       "max_nodes"   :  1024,  # largest pilot to request
+#       "max_runtime" :  2880,  # walltime budget in minutes
+#       "overhead"    :    15   # pilot and worker startup time in minutes
+#   }
+
+
+# ------------------------------------------------------------------------------
+#
+def read_pilot(pdir):
+    '''
+    Return `[resource, receptor, smiles, nodes, n_docks, seconds]` for the
+    given pilot sandbox, or `None` if the pilot did not dock any ligands.
+    '''
+
+    cfgs = glob.glob('%s/unit.*/wf0.cfg' % pdir)
+    if not cfgs:
+        return None
+
+    cfg     = ru.Config(cfg=ru.read_json(cfgs[0]))
+    n_docks = 0
+    t_start = None
+    t_stop  = None
+
+    for fname in glob.glob('%s/**/*.prof' % pdir, recursive=True):
+
+        with open(fname, 'r') as fin:
+            for line in fin:
+
+                if ',dock_st' not in line:
+                    continue
+
+                elems = line.split(',', 2)
+                event = elems[1]
+                try:
+                    t = float(elems[0])
+                except ValueError:
+                    continue
+
+                if event == 'dock_start':
+                    if t_start is None or t < t_start:
+                        t_start = t
+
+                elif event == 'dock_stop':
+                    n_docks += 1
+                    if t_stop is None or t > t_stop:
+                        t_stop = t
+
+    if not n_docks or t_start is None or t_stop is None or t_stop <= t_start:
+        return None
+
+    return [cfg.pilot_descr.resource, cfg.workload.receptor,
+            cfg.workload.smiles, cfg.nodes, n_docks, t_stop - t_start]
+
+
+# ------------------------------------------------------------------------------
+#
+def update(db, sids):
+    '''
+    record the throughput of all pilots in the given session directories which
+    are not yet known to the campaign database
+    '''
+
+    n_new = 0
+    for sid in sids:
+        for pdir in glob.glob('%s/pilot.*' % sid):
+
+            pilot = '%s/%s' % (os.path.basename(sid.rstrip('/')),
+                               os.path.basename(pdir))
+            if db.has_rate(pilot):
+                continue
+
+            info = read_pilot(pdir)
+            if info:
+                db.add_rate(pilot, *info)
+                n_new += 1
+
+    return n_new
+
+
+# ------------------------------------------------------------------------------
+#
+def get_rate(db, cfg, receptor):
+    '''
+    return the expected docks / node-hr for the receptor on the configured
+    resource
+    '''
+
+    resource = cfg.pilot_descr.resource
+
+    rate = db.rate(resource, receptor)
+    if not rate:
+        rate = db.rate(resource)
+    if not rate:
+        rate = cfg.sizing.rate
+
+    return rate
+
+
+# ------------------------------------------------------------------------------
+#
+def size(cfg, n_todo, rate, runtime=None):
+    '''
+    Return `[nodes, runtime]` for a pilot which docks `n_todo` ligands at
+    `rate` docks / node-hr within the walltime budget (`runtime` in minutes,
+    defaults to the configured `max_runtime`).  Node counts are a multiple of
+    the number of masters, with at least one worker node per master.  If the
+    ligands cannot be docked within the budget on `max_nodes` nodes, the
+    largest possible pilot is returned.
+    '''
+
+    sizing    = cfg.sizing
+    n_masters = cfg.n_masters
+
+    if not runtime:
+        runtime = sizing.max_runtime
+
+    # usable docking time per node, in hours
+    hours = (runtime - sizing.overhead) / 60.0
+    assert(hours > 0), 'runtime %s below overhead' % runtime
+
+    nodes = math.ceil(n_todo / (rate * hours))
+    nodes = n_masters * max(2, math.ceil(nodes / n_masters))
+    nodes = min(nodes, n_masters * int(sizing.max_nodes / n_masters))
+
+    # do not ask for more walltime than needed on that many nodes
+    needed  = math.ceil(60.0 * n_todo / (rate * nodes) + sizing.overhead)
+    runtime = min(runtime, needed)
+
+    return nodes, runtime
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    # usage: sizing.py <cfg> [session ...]
+    #
+    # record the throughput of the given sessions and print the resulting
+    # docks / node-hr table (see `perf.md`)
+
+    cfg_file = sys.argv[1]
+    sids     = sys.argv[2:]
+
+    cfg      = ru.Config(cfg=ru.read_json(cfg_file))
+    db       = CampaignDB(cfg.get('status_db', 'campaign.db'))
+
+    print('new pilots: %d' % update(db, sids))
+    print()
+    print('| %-20s | %-30s | %9s | %13s | %10s | %13s |'
+          % ('resource', 'receptor', 'max nodes', 'docks', 'node-hrs',
+             'docks/node-hr'))
+    for resource, receptor, nodes, n_docks, node_hrs in db.rates():
+        print('| %-20s | %-30s | %9d | %13d | %10.1f | %13.0f |'
+              % (resource, receptor, nodes, n_docks, node_hrs,
+                 n_docks / node_hrs))
+
+    db.close()
+
+
+# ------------------------------------------------------------------------------
+
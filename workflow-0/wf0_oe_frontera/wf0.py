@@ -9,6 +9,16 @@ import radical.utils as ru
 import radical.saga  as rs
 import radical.pilot as rp
 
+import radical.saga.utils.pty_shell as rsup
+
+import sizing
+
+from campaign_db import CampaignDB
+
+# per-ligand time budget for the workers, shared with `wf0_oe_theta`
+WATCHDOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'watchdog.py')
+
 
 global p_map
 p_map = dict()  # pilot: [task, task, ...]
@@ -55,19 +65,22 @@ def unit_state_cb(unit, state):
 
 # ------------------------------------------------------------------------------
 #
-def check_runs(cfg_file, run_file):
+def check_runs(cfg_file, run_file, db):
 
     runs      = list()
-    n_smiles  = dict()
 
     rec_path  = 'input/receptors.v7/'    # FIXME
     smi_path  = 'input/smiles/'          # FIXME
 
     cfg       = ru.Config(cfg=ru.read_json(cfg_file))
-    res_path  = cfg.fs_url + cfg.workload.results
-    
-    fs        = rs.filesystem.Directory(res_path)
-    
+
+    # refresh the cached campaign status: one remote listing, and one remote
+    # line count for all index files which changed since the last check
+    shell     = rsup.PTYShell(cfg.fs_url)
+    n_synced  = db.sync(shell, cfg.workload.results)
+    shell.finalize(kill_pty=True)
+    print('synced %d index files' % n_synced)
+
     with open(run_file, 'r') as fin:
     
         for line in fin.readlines():
@@ -84,48 +97,41 @@ def check_runs(cfg_file, run_file):
     
             assert(len(elems) == 4), line
     
+            # `nodes` can be `auto` to size the pilot from the measured
+            # throughput: `runtime` is then the walltime budget (`auto` for
+            # the configured maximum)
             receptor = str(elems[0])
             smiles   = str(elems[1])
-            nodes    = int(elems[2])
-            runtime  = int(elems[3])
+            nodes    = str(elems[2])
+            runtime  = str(elems[3])
+
+            nodes    = None if nodes   == 'auto' else int(nodes)
+            runtime  = None if runtime == 'auto' else int(runtime)
     
             assert(receptor)
             assert(smiles)
-            assert(nodes)
-            assert(runtime)
+            assert(nodes is None or nodes > 0)
+            assert(runtime or nodes is None), 'fixed nodes need a runtime'
 
           # print('%s/%s.oeb' % (rec_path, receptor))
           # print('%s/%s.csv' % (smi_path, smiles))
             assert(os.path.isfile('%s/%s.oeb' % (rec_path, receptor)))
             assert(os.path.isfile('%s/%s.csv' % (smi_path, smiles)))
 
-            fname = '%s_-_%s.idx' % (receptor, smiles)
-            pname = '%s/%s'       % (smiles,   fname)
-            lname = '/tmp/%s'     % (fname)
-    
-            if not fs.is_file(pname):
-                n_have = 0
-            else:
-                ret = fs.list(pname)
-                fs.copy(pname, 'file://localhost/%s' % lname)
-                out, err, ret = ru.sh_callout('wc -l %s | cut -f 1 -d " "' % lname,
-                                              shell=True)
-                n_have = int(out)
-    
-    
-            if smiles in n_smiles:
-                n_need = n_smiles[smiles]
-    
-            else:
-                sname = '%s/%s.csv' % (smi_path, smiles)
-                out, err, ret = ru.sh_callout('wc -l %s | cut -f 1 -d " "' % sname, 
-                                              shell=True)
-                n_need = int(out) - 1
-                n_smiles[smiles] = n_need
+            n_have = db.n_done(receptor, smiles)
+            n_need = db.n_smiles('%s/%s.csv' % (smi_path, smiles))
     
             if n_need > n_have:
                 perc = int(100 * n_have / n_need)
                 print('run  %-30s %-25s [%3d%%]' % (receptor, smiles, perc))
+
+                if nodes is None:
+                    rate = sizing.get_rate(db, cfg, receptor)
+                    nodes, runtime = sizing.size(cfg, n_need - n_have, rate,
+                                                 runtime)
+                    print('     %-30s %-25s [%5d nodes, %5d min, %6.0f/nh]'
+                          % ('', '', nodes, runtime, rate))
+
                 runs.append([receptor, smiles, nodes, runtime])
             else:
                 print('skip %-30s %-25s [100%%]' % (receptor, smiles))
@@ -142,11 +148,17 @@ if __name__ == '__main__':
     cfg_file  = sys.argv[1]  # resource and workload config
     run_file  = sys.argv[2]  # runs for this campaign
     session   = None
+    db        = None
 
     try:
 
         cfg     = ru.Config(cfg=ru.read_json(cfg_file))
-        runs    = check_runs(cfg_file, run_file)
+        db      = CampaignDB(cfg.get('status_db', 'campaign.db'))
+
+        # learn docking throughput from previous sessions
+        sizing.update(db, glob.glob('rp.session.*'))
+
+        runs    = check_runs(cfg_file, run_file, db)
 
         if not runs:
             print('nothing to run')
@@ -165,7 +177,7 @@ if __name__ == '__main__':
         #   - submit configured number of masters with that cfg on that pilot
         subs = dict()
         d    = rs.filesystem.Directory('ssh://frontera/scratch1/07305/rpilot/workflow-0-results')
-        ls   = [str(u).split('/')[-1] for u in d.list()]
+        ls   = db.list()
 
         workload  = cfg.workload
 
@@ -180,18 +192,20 @@ if __name__ == '__main__':
                 if workload.recompute:
                     rec += 1
                     d.move(tgt, tgt + '.bak')
+                    db.forget(tgt)
                 else:
                     print('skip      1 %s' % name)
                     continue
 
             if smiles in ls:
                 if smiles not in subs:
-                    subs[smiles] = [str(u).split('/')[-1]  for u in d.list('%s/*' % smiles)]
+                    subs[smiles] = db.list(smiles)
                 if tgt in subs[smiles]:
                     if workload.recompute:
                         rec += 2
                         d.move('%s/%s'     % (smiles, tgt),
                                '%s/%s.bak' % (smiles, tgt))
+                        db.forget('%s/%s'  % (smiles, tgt))
                     else:
                         print('skip      2 %s' % name)
                         continue
@@ -243,6 +257,10 @@ if __name__ == '__main__':
                                       'target': 'wf0_worker.py',
                                       'action': rp.TRANSFER,
                                       'flags' : rp.DEFAULT_FLAGS},
+                                     {'source': WATCHDOG,
+                                      'target': 'watchdog.py',
+                                      'action': rp.TRANSFER,
+                                      'flags' : rp.DEFAULT_FLAGS},
                                      {'source': 'configs/wf0.%s.cfg' % name,
                                       'target': 'wf0.cfg',
                                       'action': rp.TRANSFER,
@@ -273,6 +291,8 @@ if __name__ == '__main__':
         umgr.wait_units()
 
     finally:
+        if db:
+            db.close()
         if session:
             session.close(download=True)
 
@@ -5,7 +5,14 @@ import sys
 import glob
 
 import radical.utils as ru
-import radical.pilot as rp
+
+# the task overlay backend: RP, or the local stand-in for runs without a pilot
+# (`WF0_OVERLAY=local`, see `../local_overlay.py`)
+if os.environ.get('WF0_OVERLAY') == 'local':
+    import local_overlay as overlay
+else:
+    import radical.pilot as rp
+    overlay = rp.task_overlay
 
 # import pandas  as pd
 # import numpy   as np
@@ -26,7 +33,7 @@ import radical.pilot as rp
 
 # ------------------------------------------------------------------------------
 #
-class MyMaster(rp.task_overlay.Master):
+class MyMaster(overlay.Master):
     '''
     This class provides the communication setup for the task overlay: it will
     set up the request / response communication queus and provide the endpoint
@@ -39,7 +46,7 @@ class MyMaster(rp.task_overlay.Master):
 
         # initialized the task overlay base class.  That base class will ensure
         # proper communication channels to the pilot agent.
-        rp.task_overlay.Master.__init__(self, cfg=cfg)
+        overlay.Master.__init__(self, cfg=cfg)
 
         print('%s: cfg from %s to %s' % (self._uid, cfg.idx, cfg.n_masters))
 
@@ -134,6 +141,23 @@ class MyMaster(rp.task_overlay.Master):
 
         known   = set(known)
         all_pos = set(range(0, len(self._idxs)))
+
+        # a work list restricts docking to the listed index ranges (see
+        # `gaps.py`)
+        ftodo = '%s/%s/%s.todo' % (self._cfg.workload.results, smiles, name)
+        if os.path.isfile(ftodo):
+            self._log.debug('ftodo: %s', ftodo)
+            todo = set()
+            with open(ftodo, 'r') as fin:
+                for line in fin.readlines():
+                    elems = line.replace('-', ' ').split()
+                    if not elems:
+                        continue
+                    first = int(elems[0])
+                    last  = int(elems[-1])
+                    todo.update(range(first, last + 1))
+            all_pos = all_pos.intersection(todo)
+
         new_pos = all_pos.difference(known)
         npos    = len(new_pos)
 
@@ -13,12 +13,20 @@ from   openeye    import oechem
 from   impress_md import interface_functions as iface
 
 
-import radical.pilot as rp
+# the task overlay backend: RP, or the local stand-in for runs without a pilot
+# (`WF0_OVERLAY=local`, see `../local_overlay.py`)
+if os.environ.get('WF0_OVERLAY') == 'local':
+    import local_overlay as overlay
+else:
+    import radical.pilot as rp
+    overlay = rp.task_overlay
+
+from watchdog import Watchdog
 
 
 # ------------------------------------------------------------------------------
 #
-class MyWorker(rp.task_overlay.Worker):
+class MyWorker(overlay.Worker):
     '''
     This class provides the required functionality to execute work requests.
     In this simple example, the worker only implements a single call: `dock`.
@@ -28,7 +36,7 @@ class MyWorker(rp.task_overlay.Worker):
     #
     def __init__(self, cfg):
 
-        rp.task_overlay.Worker.__init__(self, cfg)
+        overlay.Worker.__init__(self, cfg)
 
         self.register_call('dock', self.dock)
 
@@ -71,6 +79,11 @@ class MyWorker(rp.task_overlay.Worker):
             self.name_col      = self._cfg.lig_col
             self.idxs          = self._cfg.idxs
 
+            # per-ligand time budget, see `smi.sh` - the docking child is
+            # forked on the first call, after the receptor is loaded
+            self._watchdog = Watchdog(self._dock,
+                                      workload.get('dock_timeout', 60))
+
             self.docker, _ = iface.get_receptor(receptor_file,
                                                 use_hybrid=use_hybrid,
                                                 high_resolution=high_resolution)
@@ -91,6 +104,31 @@ class MyWorker(rp.task_overlay.Worker):
         return data
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _dock(self, smiles, pos, ligand_name):
+        '''
+        Run a single docking call - this is executed in the watchdog's docking
+        child process, so the resulting ligand is passed back as SDF string.
+        '''
+
+        _, _, ligand = iface.RunDocking_(smiles,
+                                         dock_obj=self.docker,
+                                         pos=pos,
+                                         name=ligand_name,
+                                         target_name=self.pdb_name,
+                                         force_flipper=self.force_flipper)
+        if ligand is None:
+            return None
+
+        ofs = oechem.oemolostream()
+        ofs.SetFormat(oechem.OEFormat_SDF)
+        ofs.openstring()
+        oechem.OEWriteMolecule(ofs, ligand)
+
+        return ofs.GetString()
+
+
     # --------------------------------------------------------------------------
     #
     def dock(self, pos, off, uid):
@@ -102,12 +140,30 @@ class MyWorker(rp.task_overlay.Worker):
         smiles      = data[self._cfg.smi_col]
         ligand_name = data[self._cfg.lig_col]
 
-        score, res, ligand = iface.RunDocking_(smiles,
-                                               dock_obj=self.docker,
-                                               pos=pos,
-                                               name=ligand_name,
-                                               target_name=self.pdb_name,
-                                               force_flipper=self.force_flipper)
+        try:
+            ligand = self._watchdog.run(smiles, pos, ligand_name)
+        except TimeoutError:
+            # the docking child was killed, the next ligand forks a new one -
+            # report the ligand as timed out
+            self._log.warn('dock timeout: %s [%s]', uid, ligand_name)
+            self._prof.prof('dock_timeout', uid=uid)
+            self._prof.prof('dock_stop', uid=uid)
+            return [[pos, 'timeout']]
+        except RuntimeError as e:
+            # the docking child crashed on this ligand, the next ligand forks
+            # a new one
+            self._log.warn('dock died: %s [%s]: %s', uid, ligand_name, e)
+            self._prof.prof('dock_died', uid=uid)
+            self._prof.prof('dock_stop', uid=uid)
+            return [[pos, 'died']]
+
+        if ligand is not None:
+            ifs    = oechem.oemolistream()
+            ifs.SetFormat(oechem.OEFormat_SDF)
+            ifs.openstring(ligand)
+            ligand = oechem.OEGraphMol()
+            oechem.OEReadMolecule(ifs, ligand)
+
         out = list()
         if self.ofs and ligand is not None:
             for i, col in enumerate(self._cfg.columns):
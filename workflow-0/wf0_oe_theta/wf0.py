@@ -18,6 +18,10 @@ THETA_SCHEDULING_POLICY = [
 ]
 MAX_NODES = 4100
 
+# per-ligand time budget for the workers, shared with `wf0_oe_frontera`
+WATCHDOG  = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', 'watchdog.py')
+
 global p_map
 p_map = dict()  # pilot: [task, task, ...]
 
@@ -206,6 +210,8 @@ if __name__ == '__main__':
                      'target': 'wf0_master.py'},
                     {'source': cfg.worker,
                      'target': 'wf0_worker.py'},
+                    {'source': WATCHDOG,
+                     'target': 'watchdog.py'},
                     {'source': 'configs/wf0.%s.cfg' % name,
                      'target': 'wf0.cfg'},
                     {'source': workload.input_dir,
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import time
+
+import threading as mt
+
+
+# Bulk transport for the WF1 request / response queues.  Instead of one queue
+# message per request or result, messages are collected for a short time
+# window (or up to a maximum count) and are sent with a single `put` of the
+# `ru.zmq.Putter`, as a list of message dicts (the putter msgpack encodes the
+# list as one frame).  The getter callbacks receive such a list, and expand it
+# with `unpack()`, which also accepts single messages.  The master sends at
+# most as many requests per frame as a worker has slots, so that a single
+# worker does not receive more requests than it can start right away.
+
+# default time window (seconds) and maximum number of messages per frame
+WINDOW    = 0.01
+BULK_SIZE = 1024
+
+
+# ------------------------------------------------------------------------------
+#
+def unpack(msg):
+    '''
+    return the list of messages in a bulk frame (or the message itself)
+    '''
+
+    if isinstance(msg, list):
+        return msg
+
+    return [msg]
+
+
+# ------------------------------------------------------------------------------
+#
+class BulkPutter(object):
+    '''
+    Collect messages for a `ru.zmq.Putter` and send them in bulk frames: a
+    frame is sent once `size` messages are collected, or `window` seconds after
+    the first message of the frame was added.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, putter, window=WINDOW, size=BULK_SIZE, log=None):
+
+        self._putter = putter
+        self._window = window
+        self._size   = size
+        self._log    = log
+        self._msgs   = list()
+        self._first  = None          # time of the oldest collected message
+        self._lock   = mt.Lock()     # protects `_msgs` and the putter
+        self._event  = mt.Event()    # set when messages are collected
+        self._term   = False
+
+        self._thread = mt.Thread(target=self._flusher, daemon=True)
+        self._thread.start()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def put(self, msg):
+
+        with self._lock:
+            self._msgs.append(msg)
+            if len(self._msgs) >= self._size:
+                self._flush()
+            elif self._first is None:
+                self._first = time.time()
+                self._event.set()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def flush(self):
+
+        with self._lock:
+            self._flush()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def close(self):
+
+        self._term = True
+        self._event.set()
+        self._thread.join()
+        self.flush()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _flush(self):
+
+        # lock must be held
+        self._first = None
+        while self._msgs:
+            frame      = self._msgs[:self._size]
+            self._msgs = self._msgs[self._size:]
+            if self._log:
+                self._log.debug('bulk put %d', len(frame))
+            self._putter.put(frame)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _flusher(self):
+
+        while not self._term:
+
+            self._event.wait()
+
+            with self._lock:
+                first = self._first
+                if first is None:
+                    self._event.clear()
+                    continue
+
+            delay = first + self._window - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            with self._lock:
+                if self._first == first:
+                    self._flush()
+
+
+# ------------------------------------------------------------------------------
+
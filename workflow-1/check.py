@@ -4,69 +4,44 @@ GAP = 10
 
 import os
 import sys
-import radical.utils as ru
 
-out = sys.argv[1].strip()
-inp = sys.argv[2].strip()
+# the coverage code is shared with workflow-0 (`ligand_coverage.py` links to
+# `../workflow-0/ligand_coverage.py`)
+from ligand_coverage import count_ligands, coverage, find_gaps
 
-smi = os.path.basename(inp)[:-4]
-oeb = os.path.basename(out)[:-4]
 
-num = int(ru.sh_callout('wc -l %s' % inp)[0].split()[0])
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
 
-rec = set()
-dup = list()
-with open(out, 'r') as fin:
-    try:
-        for line in fin.readlines():
-            idx = int(line.split(' ', 1)[0])
-            if idx in rec:
-                dup.append(idx)
-            rec.add(idx)
-    except:
-        print('failed: %s' % line)
-        raise
+    out = sys.argv[1].strip()
+    inp = sys.argv[2].strip()
 
-rmin = None
-rmax = None
-miss = 0
-gaps = list()
-for i in range(num):
-    if i in rec:
-        if rmin:
-            if rmin == i - 1:
-                if 1 >= GAP:
-                    gaps.append('%23d' % i)
-                rmin = None
-                rmax = None
-            elif rmax:
-                gap = rmax - rmin + 1
-                if gap >= GAP:
-                    gaps.append('%10d - %10d [%10d]'
-                               % (rmin, rmax, rmax - rmin + 1))
-                rmax = None
-                rmin = None
-            else:
-                assert(0), [rmin, rmax, i]
-    else:
-        miss += 1
-        if not rmin:
-            rmin = i
-        rmax = i
-    if not num % 1000:
-        sys.stdout.write('.')
-        sys.stdout.flush()
+    smi = os.path.basename(inp)[:-4]
+    oeb = os.path.basename(out)[:-4]
 
-with open('%s.stat' % oeb, 'w') as fout:
-    fout.write('\n')
-    fout.write('receptor  : %-30s  [%10d]\n' % (oeb, len(rec)))
-    fout.write('smiles    : %-30s  [%10d]\n' % (smi, num))
-    fout.write('missing   : %30.1f%% [%10d]\n' % (100.0 * miss / num, miss))
-    first = True
-    for gap in gaps:
-        if first: fout.write('gaps >= %2d:         %s\n' % (GAP, gap))
-        else    : fout.write('          :         %s\n'  %       gap )
-        first = False
+    num = count_ligands(inp)
 
-os.system('cat %s.stat' % oeb)
+    mask, dup, extra = coverage(out, num)
+
+    n_rec = int(mask.sum()) + extra
+    miss  = num - int(mask.sum())
+    gaps  = find_gaps(mask)
+    gaps  = gaps[gaps[:, 1] - gaps[:, 0] + 1 >= GAP]
+
+    with open('%s.stat' % oeb, 'w') as fout:
+        fout.write('\n')
+        fout.write('receptor  : %-30s  [%10d]\n' % (oeb, n_rec))
+        fout.write('smiles    : %-30s  [%10d]\n' % (smi, num))
+        fout.write('missing   : %30.1f%% [%10d]\n' % (100.0 * miss / num, miss))
+        first = True
+        for rmin, rmax in gaps:
+            if rmin == rmax: gap = '%23d' % rmin
+            else           : gap = '%10d - %10d [%10d]' % (rmin, rmax,
+                                                            rmax - rmin + 1)
+            if first: fout.write('gaps >= %2d:         %s\n' % (GAP, gap))
+            else    : fout.write('          :         %s\n'  %       gap )
+            first = False
+
+    os.system('cat %s.stat' % oeb)
 
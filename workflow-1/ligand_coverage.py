@@ -0,0 +1 @@
+../workflow-0/ligand_coverage.py
\ No newline at end of file
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import glob
+
+import numpy as np
+
+
+# The rank manifest lists all ranks (docked ligands) of a database: the ligand
+# position, the docking score, and the rank directory (relative to the
+# database).  It is a flat file of fixed size records which is appended to by
+# the docking stage (`workflow_dock_system.py`), and which the WF1 master
+# memory-maps instead of scanning the database directory for `rank*/`.
+#
+# A database without manifest (from older docking runs) is scanned once when
+# the manifest is created - either by the master (see `ranks()`) or by the
+# first rank the docking stage adds (see `add()`) - so that earlier ranks are
+# not lost.
+
+FNAME          = 'manifest.bin'
+PATH_LEN       = 64
+MANIFEST_DTYPE = np.dtype([('pos'  , '<i8'),
+                           ('score', '<f8'),
+                           ('path' , 'S%d' % PATH_LEN)])
+
+
+# ------------------------------------------------------------------------------
+#
+def add(dbase, pos, score, path):
+    '''
+    Append a rank to the manifest of a database (`score` may be `None` if
+    unknown).  The rank directory `path` is stored relative to the database,
+    and must fit into `PATH_LEN` bytes.
+    '''
+
+    rid = os.path.relpath(path, dbase).encode()
+    if len(rid) > PATH_LEN:
+        raise ValueError('rank path too long (%d > %d): %s'
+                         % (len(rid), PATH_LEN, rid.decode()))
+
+    rec = np.zeros(1, dtype=MANIFEST_DTYPE)
+    rec[0] = (pos, np.nan if score is None else score, rid)
+
+    fname = os.path.join(dbase, FNAME)
+    if not os.path.isfile(fname):
+        create(dbase, skip=rid)
+
+    with open(fname, 'ab') as fout:
+
+        # drop an incomplete last record of an interrupted run
+        size = fout.tell()
+        if size % MANIFEST_DTYPE.itemsize:
+            fout.truncate(size - size % MANIFEST_DTYPE.itemsize)
+
+        rec.tofile(fout)
+
+
+# ------------------------------------------------------------------------------
+#
+def load(fname):
+    '''
+    Memory-map the manifest.  A partially written last record (from an
+    interrupted docking run) is ignored.
+    '''
+
+    if not os.path.isfile(fname):
+        return np.zeros(0, dtype=MANIFEST_DTYPE)
+
+    n = os.path.getsize(fname) // MANIFEST_DTYPE.itemsize
+    if not n:
+        return np.zeros(0, dtype=MANIFEST_DTYPE)
+
+    return np.memmap(fname, dtype=MANIFEST_DTYPE, mode='r', shape=(n,))
+
+
+# ------------------------------------------------------------------------------
+#
+def scan(dbase, skip=None):
+    '''
+    create manifest records from the `rank<pos>/` directories of a database,
+    except for the rank `skip` (the docking scores are not known)
+    '''
+
+    rids = [os.path.basename(path.rstrip('/')).encode()
+            for path in sorted(glob.glob('%s/rank*/' % dbase))]
+    rids = [rid for rid in rids if rid != skip]
+    recs = np.zeros(len(rids), dtype=MANIFEST_DTYPE)
+
+    for i, rid in enumerate(rids):
+        try:
+            pos = int(rid[4:])
+        except ValueError:
+            pos = -1
+        recs[i] = (pos, np.nan, rid)
+
+    return recs
+
+
+# ------------------------------------------------------------------------------
+#
+def create(dbase, skip=None):
+    '''
+    write the manifest of a database from a directory scan (see `scan()`)
+    '''
+
+    fname = os.path.join(dbase, FNAME)
+    recs  = scan(dbase, skip)
+
+    with open('%s.tmp' % fname, 'wb') as fout:
+        recs.tofile(fout)
+    os.rename('%s.tmp' % fname, fname)
+
+
+# ------------------------------------------------------------------------------
+#
+def ranks(dbase):
+    '''
+    return the manifest records for a database, creating the manifest from a
+    directory scan if it does not exist yet
+    '''
+
+    fname = os.path.join(dbase, FNAME)
+
+    if not os.path.isfile(fname):
+        create(dbase)
+
+    return load(fname)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    # usage: manifest.py <dbase>
+    #
+    # create the manifest for an existing database (if needed) and print
+    # a summary
+
+    dbase  = sys.argv[1]
+    recs   = ranks(dbase)
+    scores = recs['score'][~np.isnan(recs['score'])]
+
+    print('ranks : %10d' % len(recs))
+    print('scored: %10d' % len(scores))
+    if len(scores):
+        print('score : %10.2f - %.2f' % (scores.min(), scores.max()))
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import math
+import time
+
+import numpy as np
+
+from impress_md import interface_functions as iface
+
+
+# MMGBSA with early stopping.  Instead of one run with a fixed number of
+# iterations, MMGBSA is run repeatedly with `CHUNK` iterations per run, and the
+# running mean and standard error of the binding energy are updated with the
+# estimate of each run.  This is a restart based approximation, not a streaming
+# estimate over the frames of a single trajectory: `iface.RunMMGBSA_` does not
+# expose per-frame energies, so each chunk is a separate, independent run which
+# pays system setup and equilibration again.  `iface.RunMMGBSA_` returns the
+# binding energy estimate of its run (as used by `workflow_dock_system.py` and
+# by the former `sim` call of `wf1_worker.py`) - a scalar or per-frame values,
+# which are averaged.
+#
+# The chunks never cost more than the former single run of `MAX_ITERS`
+# iterations: with `SETUP` iterations worth of setup per run, a new chunk is
+# only started while `n_runs * (CHUNK + SETUP) <= MAX_ITERS + SETUP` holds.
+# With the defaults this allows 3 chunks (3000 iterations).  A chunk is also
+# not started when it would, at the duration of the previous chunks, not
+# complete within the `timeout` (seconds) of the caller.  The outputs of chunk
+# `i` are written to `<rank>/mmgbsa.<i>/`, so that chunks do not overwrite each
+# other.
+#
+# The runs stop once
+#
+#   - the standard error falls below `TOLERANCE` (kcal/mol),
+#   - the ligand is clearly worse than the `cutoff` energy (the current top-N
+#     cutoff of the master): `mean - Z * se > cutoff`,
+#   - the cost of the single run or the `timeout` would be exceeded.
+#
+# Neither of the first two criteria is checked before `MIN_CHUNKS` estimates
+# are available.  Lower binding energies are better.
+
+CHUNK      = 1000
+SETUP      = 500
+MAX_ITERS  = 5000
+MIN_CHUNKS = 2
+TOLERANCE  = 0.5
+Z          = 2.0
+
+
+# ------------------------------------------------------------------------------
+#
+class RunningStats(object):
+    '''
+    running mean and variance (Welford)
+    '''
+
+    def __init__(self):
+
+        self.n     = 0
+        self.mean  = 0.0
+        self._m2   = 0.0
+
+
+    def add(self, val):
+
+        self.n    += 1
+        delta      = val - self.mean
+        self.mean += delta / self.n
+        self._m2  += delta * (val - self.mean)
+
+
+    @property
+    def se(self):
+
+        if self.n < 2:
+            return float('inf')
+
+        return math.sqrt(self._m2 / (self.n - 1) / self.n)
+
+
+# ------------------------------------------------------------------------------
+#
+def run_mmgbsa(rank, gpu=True, niters=MAX_ITERS, chunk=CHUNK, setup=SETUP,
+               tol=TOLERANCE, cutoff=None, min_chunks=MIN_CHUNKS, z=Z,
+               timeout=None):
+    '''
+    Run MMGBSA chunks for the given rank until the binding energy converged,
+    the ligand is clearly worse than `cutoff`, or the next chunk would exceed
+    the cost of a single `niters` run or the `timeout`.
+    Return a dict with the `mean` and `se` of the binding energy, the number
+    of estimates `n`, the `iters` run, and the `stop` reason (`converged`,
+    `cutoff`, `max_iters` or `timeout`).
+    '''
+
+    stats = RunningStats()
+    iters = 0
+    stop  = 'max_iters'
+    start = time.time()
+
+    while (stats.n + 1) * (chunk + setup) <= niters + setup:
+
+        if timeout is not None and stats.n:
+            used = time.time() - start
+            if used + used / stats.n > timeout:
+                stop = 'timeout'
+                break
+
+        out = '%s/mmgbsa.%d' % (rank, stats.n)
+        os.makedirs(out, exist_ok=True)
+
+        val = iface.RunMMGBSA_(rank, out, gpu=gpu, niters=chunk)
+        val = np.asarray(val, dtype=float)
+        if not val.size or not np.isfinite(val).all():
+            raise ValueError('no MMGBSA estimate for %s: %s' % (out, val))
+
+        iters += chunk
+        stats.add(float(val.mean()))
+
+        if stats.n < min_chunks:
+            continue
+
+        if stats.se < tol:
+            stop = 'converged'
+            break
+
+        if cutoff is not None and stats.mean - z * stats.se > cutoff:
+            stop = 'cutoff'
+            break
+
+    if not stats.n:
+        raise ValueError('no MMGBSA chunk fits into %d iterations' % niters)
+
+    return {'mean' : stats.mean,
+            'se'   : stats.se,
+            'n'    : stats.n,
+            'iters': iters,
+            'stop' : stop}
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    # usage: mmgbsa_stream.py <rank> [cutoff]
+
+    rank   = sys.argv[1]
+    cutoff = float(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    print(run_mmgbsa(rank, cutoff=cutoff))
+
+
+# ------------------------------------------------------------------------------
+
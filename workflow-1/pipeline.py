@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import time
+import queue
+import threading
+
+import multiprocessing as mp
+
+
+# A staged pipeline: each stage has a bounded input queue and a pool of worker
+# threads.  A worker takes an item from its queue, calls the stage function,
+# reports the result to the pipeline (see `Pipeline.run`), and hands the item
+# to the next stage if the result passes the stage filter - otherwise the item
+# is dropped.  The bounded queues limit the number of items in flight and
+# throttle fast stages when a slower stage falls behind, so that, for example,
+# CPU bound docking overlaps with GPU bound minimization of earlier ligands.
+#
+# Items are dicts which carry the stage results under the stage names.
+#
+# Stages with `procs=True` run their stage function in a pool of worker
+# processes (one per stage worker), for CPU bound Python code which would
+# otherwise serialize on the GIL.  The stage threads then only hand items to
+# the pool and wait for the result.  `init()` runs once per process, so that,
+# for example, the receptor is loaded once per docking process.  The pools are
+# forked before the stage threads start, and the stage functions are looked up
+# by stage name in the forked processes - they need not be picklable, but items
+# and results are sent between processes and thus must be.
+
+# default size of the stage input queues
+QUEUE_SIZE = 16
+
+# interval for progress reports in `run` (seconds)
+REPORT = 60.0
+
+# stages by name, and the stage context of a pool process
+_STAGES = dict()
+_CTX    = None
+
+
+# ------------------------------------------------------------------------------
+#
+def _proc_init(name):
+
+    global _CTX
+
+    stage = _STAGES[name]
+    _CTX  = stage.init() if stage.init else dict()
+
+
+# ------------------------------------------------------------------------------
+#
+def _proc_call(name, item):
+
+    return _STAGES[name].func(item, **_CTX)
+
+
+# ------------------------------------------------------------------------------
+#
+class Stage(object):
+    '''
+    A pipeline stage: `func(item, **ctx)` computes the stage result for an
+    item, and `filt(result)` decides if the item moves on to the next stage.
+    `init()` is called once in each worker thread (or worker process, for
+    `procs=True`) and returns the `ctx` dict for that worker (for resources
+    which cannot be shared between workers).
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, name, func, workers=1, filt=None, init=None,
+                       qsize=QUEUE_SIZE, procs=False):
+
+        self.name    = name
+        self.func    = func
+        self.workers = workers
+        self.filt    = filt
+        self.init    = init
+        self.procs   = procs
+        self.queue   = queue.Queue(maxsize=qsize)
+        self.next    = None
+        self.pool    = None
+
+        # throughput counters
+        self._lock   = threading.Lock()
+        self.n_in    = 0      # items processed
+        self.n_ok    = 0      # items passed on
+        self.n_drop  = 0      # items dropped by the filter (or failed)
+        self.busy    = 0.0    # time spent in `func`, summed over workers
+        self._start  = None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stats(self):
+
+        with self._lock:
+            ttime = time.time() - self._start if self._start else 0.0
+            return {'in'   : self.n_in,
+                    'ok'   : self.n_ok,
+                    'drop' : self.n_drop,
+                    'rate' : self.n_in / ttime if ttime else 0.0,
+                    'util' : self.busy / ttime / self.workers if ttime else 0.0,
+                    'queue': self.queue.qsize()}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _work(self, events):
+
+        if self.pool: ctx = None
+        else        : ctx = self.init() if self.init else dict()
+
+        while True:
+
+            item = self.queue.get()
+            if item is None:
+                break
+
+            start = time.time()
+            try:
+                if self.pool:
+                    res = self.pool.apply(_proc_call, [self.name, item])
+                else:
+                    res = self.func(item, **ctx)
+            except Exception as e:
+                print('=== %s FAILED: %s' % (self.name, e))
+                res = False
+
+            ok = self.filt(res) if self.filt else res is not False
+
+            with self._lock:
+                self.n_in += 1
+                self.busy += time.time() - start
+                if ok: self.n_ok   += 1
+                else : self.n_drop += 1
+
+            item[self.name] = res
+            events.put([self, item, res, ok])
+
+            if ok and self.next:
+                self.next.queue.put(item)
+
+
+# ------------------------------------------------------------------------------
+#
+class Pipeline(object):
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, stages):
+
+        self.stages  = stages
+        self._events = queue.Queue()
+        self._byname = {stage.name: stage for stage in stages}
+
+        for this, nxt in zip(stages[:-1], stages[1:]):
+            this.next = nxt
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stats(self):
+        '''
+        return the throughput counters of all stages
+        '''
+
+        return {stage.name: stage.stats() for stage in self.stages}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def report(self):
+
+        for name, st in self.stats().items():
+            print('=== %-14s in: %7d  ok: %7d  drop: %7d  %8.2f/s  '
+                  'util: %5.1f%%  queue: %4d'
+                  % (name, st['in'], st['ok'], st['drop'], st['rate'],
+                     st['util'] * 100, st['queue']))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def run(self, items, cb):
+        '''
+        Feed `[stage_name, item]` pairs from the iterable `items` into the
+        pipeline, where `stage_name` is the stage the item enters (items
+        which have partially passed the pipeline before can skip stages).
+        `cb(stage_name, item, result, ok)` is called for every stage result -
+        it is always called in the calling thread, so it can update state
+        which is not thread safe.  Return when all items left the pipeline.
+        '''
+
+        # fork the process pools while this process is still single threaded
+        ctx = mp.get_context('fork')
+        for stage in self.stages:
+            if stage.procs:
+                _STAGES[stage.name] = stage
+                stage.pool = ctx.Pool(stage.workers, initializer=_proc_init,
+                                      initargs=[stage.name])
+
+        threads = list()
+        for stage in self.stages:
+            stage._start = time.time()
+            for _ in range(stage.workers):
+                thread = threading.Thread(target=stage._work,
+                                          args=[self._events])
+                thread.daemon = True
+                thread.start()
+                threads.append([stage, thread])
+
+        items   = iter(items)
+        pending = None      # item which did not fit into its stage queue
+        active  = 0         # items in the pipeline
+        last    = time.time()
+
+        while True:
+
+            # feed as many items as the stage queues accept
+            while True:
+                if pending is None:
+                    pending = next(items, None)
+                    if pending is None:
+                        break
+                name, item = pending
+                try:
+                    self._byname[name].queue.put_nowait(item)
+                except queue.Full:
+                    break
+                pending = None
+                active += 1
+
+            if not active and pending is None:
+                break
+
+            try:
+                stage, item, res, ok = self._events.get(timeout=1.0)
+            except queue.Empty:
+                pass
+            else:
+                if not ok or not stage.next:
+                    active -= 1
+                cb(stage.name, item, res, ok)
+
+            if time.time() - last > REPORT:
+                self.report()
+                last = time.time()
+
+        for stage, _ in threads:
+            stage.queue.put(None)
+
+        for _, thread in threads:
+            thread.join()
+
+        for stage in self.stages:
+            if stage.pool:
+                stage.pool.close()
+                stage.pool.join()
+                stage.pool = None
+
+
+# ------------------------------------------------------------------------------
+
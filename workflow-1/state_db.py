@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import sqlite3
+
+import radical.utils as ru
+
+
+# stages of `workflow_dock_system.py`, in order
+STAGES = ['docking', 'parameterize', 'minimization', 'mmgbsa', 'result']
+
+# commit pending updates after that many changed positions or seconds
+BATCH    = 64
+INTERVAL = 10.0
+
+
+# ------------------------------------------------------------------------------
+#
+def _real(val):
+    '''
+    energies are stored as floats - per-frame energies are averaged
+    '''
+
+    try:
+        return float(val)
+    except TypeError:
+        val = list(val)
+        return sum([float(v) for v in val]) / len(val)
+
+
+# ------------------------------------------------------------------------------
+#
+class StateDB(object):
+    '''
+    Pipeline state of `workflow_dock_system.py`, one row per ligand position.
+    For each stage, the `<stage>_ok` column is `NULL` while the stage is to
+    do, `0` if it failed and `1` if it is done, and the stage results are
+    stored in separate columns (so that scores can be queried).  `get` and
+    `set` use the values of the former JSON state:
+
+      docking      : [score, res]  ([None, None] to do, [False, False] failed)
+      parameterize : True
+      minimization : energy
+      mmgbsa       : energy
+      result       : first metrics line
+
+    where `None` means to do and `False` means failed.
+
+    The database runs in WAL mode.  Updates are collected in memory and are
+    committed in one transaction per `BATCH` positions or `INTERVAL` seconds
+    (see `flush`) - after a crash, at most those positions are recomputed.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, fname):
+
+        self._fname   = fname
+        self._db      = sqlite3.connect(fname)
+        self._rows    = dict()   # cached rows
+        self._dirty   = set()    # positions with uncommitted changes
+        self._last    = time.time()
+
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous  = NORMAL')
+
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS state ('
+                             '  pos             INTEGER PRIMARY KEY,'
+                             '  docking_ok      INTEGER,'
+                             '  docking_score   REAL,'
+                             '  docking_res     TEXT,'
+                             '  parameterize_ok INTEGER,'
+                             '  minimization_ok INTEGER,'
+                             '  minimization    REAL,'
+                             '  mmgbsa_ok       INTEGER,'
+                             '  mmgbsa          REAL,'
+                             '  result_ok       INTEGER,'
+                             '  result          TEXT)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS state_result_idx '
+                             'ON state (result_ok)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS state_docking_idx '
+                             'ON state (docking_score)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS state_mmgbsa_idx '
+                             'ON state (mmgbsa)')
+
+        self._cols = [row[1] for row in
+                      self._db.execute('PRAGMA table_info(state)')]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def close(self):
+
+        self.flush(force=True)
+        self._db.close()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def import_json(self, fname):
+        '''
+        import a state file of the former JSON format (if the database is empty)
+        '''
+
+        if self._db.execute('SELECT COUNT(*) FROM state').fetchone()[0]:
+            return 0
+
+        state = ru.read_json(fname)
+        for pos, info in state.items():
+            for key in STAGES:
+                self.set(pos, key, info.get(key))
+
+        self.flush(force=True)
+
+        return len(state)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def done(self):
+        '''
+        return the set of positions which passed through all stages (or
+        failed in one)
+        '''
+
+        self.flush(force=True)
+        return set([row[0] for row in self._db.execute(
+                        'SELECT pos FROM state WHERE result_ok IS NOT NULL')])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _row(self, pos):
+
+        pos = int(pos)
+        if pos not in self._rows:
+            cur = self._db.execute('SELECT * FROM state WHERE pos = ?', (pos,))
+            row = cur.fetchone()
+            if row: self._rows[pos] = dict(zip(self._cols, row))
+            else  : self._rows[pos] = {col: None for col in self._cols}
+            self._rows[pos]['pos'] = pos
+
+        return self._rows[pos]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def get(self, pos, key):
+
+        row = self._row(pos)
+        ok  = row['%s_ok' % key]
+
+        if key == 'docking':
+            if ok is None: return [None, None]
+            if not ok    : return [False, False]
+            return [row['docking_score'], row['docking_res']]
+
+        if ok is None: return None
+        if not ok    : return False
+        if key == 'parameterize':
+            return True
+
+        return row[key]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def set(self, pos, key, val, flush=False):
+
+        row = self._row(pos)
+
+        if key == 'docking':
+            score, res = val
+            if   score is None  and res is None : row['docking_ok'] = None
+            elif score is False and res is False: row['docking_ok'] = 0
+            else:
+                row['docking_ok']    = 1
+                row['docking_score'] = _real(score)
+                row['docking_res']   = res
+
+        elif val is None : row['%s_ok' % key] = None
+        elif val is False: row['%s_ok' % key] = 0
+        else:
+            row['%s_ok' % key] = 1
+            if   key in ['minimization', 'mmgbsa']: row[key] = _real(val)
+            elif key == 'result'                   : row[key] = val
+
+        self._dirty.add(row['pos'])
+
+        if flush:
+            self.flush()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def flush(self, force=False):
+        '''
+        commit the pending updates if enough have accumulated (or if `force`d)
+        '''
+
+        if not self._dirty:
+            return
+
+        if not force and len(self._dirty) < BATCH and \
+                time.time() - self._last < INTERVAL:
+            return
+
+        cols = ', '.join(self._cols)
+        vals = ', '.join(['?'] * len(self._cols))
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO state (%s) '
+                                 'VALUES (%s)' % (cols, vals),
+                                 [[self._rows[pos][col] for col in self._cols]
+                                  for pos in self._dirty])
+
+        # completed positions are not needed in memory anymore
+        for pos in self._dirty:
+            if self._rows[pos]['result_ok'] is not None:
+                del(self._rows[pos])
+
+        self._dirty = set()
+        self._last  = time.time()
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    # usage: state_db.py <db_file>
+    #
+    # print the number of positions per stage status, and the best ligands by
+    # MMGBSA energy
+
+    db = StateDB(sys.argv[1])
+
+    print('%-12s  %10s  %10s  %10s' % ('stage', 'todo', 'failed', 'done'))
+    for key in STAGES:
+        counts = dict(db._db.execute('SELECT %s_ok, COUNT(*) FROM state '
+                                     'GROUP BY %s_ok' % (key, key)).fetchall())
+        print('%-12s  %10d  %10d  %10d' % (key, counts.get(None, 0),
+                                           counts.get(0, 0), counts.get(1, 0)))
+
+    print()
+    for pos, dock, mmgbsa in db._db.execute(
+            'SELECT pos, docking_score, mmgbsa FROM state '
+            'WHERE mmgbsa_ok = 1 ORDER BY mmgbsa LIMIT 10'):
+        print('%10d  %10.2f  %10.2f' % (pos, dock, mmgbsa))
+
+    db.close()
+
+
+# ------------------------------------------------------------------------------
+
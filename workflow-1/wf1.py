@@ -43,6 +43,9 @@ if __name__ == '__main__':
         pdinit["input_staging"] = [model,
                                    'wf1_master.py',
                                    'wf1_worker.py',
+                                   'manifest.py',
+                                   'bulk.py',
+                                   'mmgbsa_stream.py',
                                    'wf1_worker.sh',
                                    'oe_license.txt',
                                    'config.json'
@@ -77,6 +80,15 @@ if __name__ == '__main__':
                                        {'source': 'pilot:///wf1_worker.py',
                                         'target': 'unit:///wf1_worker.py',
                                         'action': rp.LINK},
+                                       {'source': 'pilot:///manifest.py',
+                                        'target': 'unit:///manifest.py',
+                                        'action': rp.LINK},
+                                       {'source': 'pilot:///bulk.py',
+                                        'target': 'unit:///bulk.py',
+                                        'action': rp.LINK},
+                                       {'source': 'pilot:///mmgbsa_stream.py',
+                                        'target': 'unit:///mmgbsa_stream.py',
+                                        'action': rp.LINK},
                                        {'source': 'pilot:///wf1_worker.sh',
                                         'target': 'unit:///wf1_worker.sh',
                                         'action': rp.LINK},
@@ -3,19 +3,25 @@
 import os
 import sys
 import copy
-import glob
+import json
 import time
+import heapq
 import signal
-import shutil
+import itertools
 
 os.environ['RADICAL_BASE_DIR'] = '/gpfs/alpine/med110/scratch/merzky1/radical.pilot.sandbox/tmp'
 
 # import numpy         as np
 import threading     as mt
 
+import concurrent.futures as cf
+
 import radical.pilot as rp
 import radical.utils as ru
 
+import bulk
+import manifest
+
 
 # This script has to run as a task within an pilot allocation, and is
 # a demonstration of a task overlay within the RCT framework.
@@ -30,12 +36,55 @@ import radical.utils as ru
 # The worker itself is an external program which is not covered in this code.
 
 
+# minimum number of journal records before the state is compacted
+JOURNAL_MIN = 1024
+
+# Requests are scheduled by priority: MMGBSA simulations before minimizations,
+# simulations by minimization energy, minimizations by docking score (lower is
+# better, unknown scores last).  Only `window` requests are in flight at any
+# time (default: one per worker slot), so that results can change the order of
+# the remaining work.  Ranks with a docking score above `threshold` are not
+# minimized, and at most `budget[call]` requests are submitted per call type.
+# Skipped ranks remain open in the state and are picked up by later runs.
+# MMGBSA runs stop early once a ligand is clearly worse than the `top_n`-th
+# best binding energy seen so far (see `mmgbsa_stream.py`).  Up to `batch`
+# minimizations are sent as one `min_batch` request, which a worker runs
+# back to back in the same GPU process.
+# The `schedule` section of `config.json` overwrites these defaults.
+SCHEDULE = {'window'   : None,
+            'threshold': None,
+            'top_n'    : 100,
+            'batch'    : 8,
+            'budget'   : {'min': None,
+                          'sim': None}}
+
+# Requests are sent to the workers in bulk frames (see `bulk.py`): requests
+# submitted within `window` seconds are coalesced, with up to `size` requests
+# per frame (default: the number of GPU slots of a worker, so that a worker can
+# start all requests of a frame right away).  Workers collect their results
+# for `res_window` seconds before sending them.  The `bulk` section of
+# `config.json` overwrites these defaults.
+BULK = {'window'    : bulk.WINDOW,
+        'size'      : None,
+        'res_window': 0.1}
+
+# Workers refuse requests for which they have no free slot (see
+# `wf1_worker.py`), e.g., a second simulation on a worker with one `sim` slot.
+# Refused requests are held back until a request of the same call type
+# completes (which frees a slot of that type), or until no request is in
+# flight, and are then scheduled again.
+REFUSED = 'refused'
+
+
 # ------------------------------------------------------------------------------
 #
 class Request(object):
-
-    # poor man's future
-    # TODO: use proper future implementation
+    '''
+    A future for a work request: the master fulfills it when the result
+    arrives, and waiting threads and done callbacks are triggered right away.
+    The underlying future resolves to the request itself, so that failed
+    requests can be inspected like completed ones.
+    '''
 
 
     # --------------------------------------------------------------------------
@@ -46,6 +95,8 @@ class Request(object):
         self._work   = work
         self._state  = 'NEW'
         self._result = None
+        self._error  = None
+        self._future = cf.Future()
 
 
     # --------------------------------------------------------------------------
@@ -65,6 +116,16 @@ class Request(object):
         return self._result
 
 
+    @property
+    def error(self):
+        return self._error
+
+
+    @property
+    def future(self):
+        return self._future
+
+
     # --------------------------------------------------------------------------
     #
     def as_dict(self):
@@ -77,6 +138,7 @@ class Request(object):
                 'result': self._result,
                 'call'  : self._work['call'],
                 'rank'  : self._work['rank'],
+                'args'  : self._work.get('args'),
                }
 
 
@@ -93,17 +155,173 @@ class Request(object):
         if error: self._state = 'FAILED'
         else    : self._state = 'DONE'
 
+        self._future.set_result(self)
+
 
     # --------------------------------------------------------------------------
     #
-    def wait(self):
+    def done(self):
+
+        return self._future.done()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def add_done_callback(self, cb):
+        '''
+        Call `cb(request)` once the request is done (immediately if it is
+        already done).  Callbacks run in the thread which fulfills the request,
+        in the order they were added.  Returns the request, so that callbacks
+        can be chained.
+        '''
+
+        self._future.add_done_callback(lambda _: cb(self))
+
+        return self
 
-        while self.state not in ['DONE', 'FAILED']:
-            time.sleep(0.1)
+
+    # --------------------------------------------------------------------------
+    #
+    def wait(self, timeout=None):
+
+        cf.wait([self._future], timeout=timeout)
 
         return self._result
 
 
+# ------------------------------------------------------------------------------
+#
+def as_completed(requests, timeout=None):
+    '''
+    iterate over the given requests in the order they complete
+    '''
+
+    reqs = {req.future: req for req in requests}
+    for future in cf.as_completed(reqs, timeout=timeout):
+        yield reqs[future]
+
+
+# ------------------------------------------------------------------------------
+#
+def wait(requests, timeout=None, return_when=cf.ALL_COMPLETED):
+    '''
+    Wait for a batch of requests.  Return two lists, with the completed and
+    the pending requests.
+    '''
+
+    reqs = {req.future: req for req in requests}
+    done, pending = cf.wait(reqs, timeout=timeout, return_when=return_when)
+
+    return [reqs[f] for f in done], [reqs[f] for f in pending]
+
+
+# ------------------------------------------------------------------------------
+#
+class Journal(object):
+    '''
+    Persistent master state: a JSON snapshot plus an append-only journal with
+    one line per state change (`[rid, info]`).  On load, the journal is
+    replayed on top of the snapshot.  The journal is compacted into a new
+    snapshot once it holds more records than the state has ranks, so that the
+    amortized cost per state change stays constant.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, fname, log):
+
+        self._fsnap    = fname
+        self._fjournal = '%s.journal' % fname
+        self._log      = log
+        self._fout     = None
+        self._n        = 0      # records in the journal
+
+
+    # --------------------------------------------------------------------------
+    #
+    def load(self):
+        '''
+        return the state from the last snapshot and the journal
+        '''
+
+        state = dict()
+
+        if os.path.exists(self._fsnap):
+            try:
+                state = ru.read_json(self._fsnap)
+            except:
+                self._log.exception('cannot read snapshot %s', self._fsnap)
+
+        self._n = 0
+        line    = ''
+        if os.path.exists(self._fjournal):
+            with open(self._fjournal, 'r') as fin:
+                for line in fin:
+                    try:
+                        rid, info = json.loads(line)
+                    except ValueError:
+                        # incomplete last record of an interrupted run
+                        self._log.warn('skip journal record: %s', line)
+                        continue
+                    state[rid] = info
+                    self._n   += 1
+
+        self._log.debug('loaded %d ranks (%d journal records)',
+                        len(state), self._n)
+
+        self._fout = open(self._fjournal, 'a')
+
+        # do not append to an incomplete record
+        if line and not line.endswith('\n'):
+            self._fout.write('\n')
+
+        return state
+
+
+    # --------------------------------------------------------------------------
+    #
+    def append(self, rid, info, state):
+        '''
+        record the new `info` for rank `rid`, and compact the journal if needed
+        '''
+
+        self._fout.write(json.dumps([rid, info]) + '\n')
+        self._fout.flush()
+        self._n += 1
+
+        if self._n > max(JOURNAL_MIN, len(state)):
+            self.compact(state)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def compact(self, state):
+        '''
+        Write a new snapshot and truncate the journal.  Records which survive
+        an interruption between both steps are replayed onto the new snapshot,
+        which is harmless.
+        '''
+
+        self._log.debug('compact [%d ranks, %d records]', len(state), self._n)
+
+        ru.write_json(state, '%s.tmp' % self._fsnap)
+        os.rename('%s.tmp' % self._fsnap, self._fsnap)
+
+        if self._fout:
+            self._fout.close()
+        self._fout = open(self._fjournal, 'w')
+        self._n    = 0
+
+
+    # --------------------------------------------------------------------------
+    #
+    def close(self):
+
+        if self._fout:
+            self._fout.close()
+            self._fout = None
+
+
 # ------------------------------------------------------------------------------
 #
 class MyMaster(rp.task_overlay.Master):
@@ -159,10 +377,19 @@ class MyMaster(rp.task_overlay.Master):
         # this master will put requests onto the request queue, and will get
         # responses from the response queue.  Note that the responses will be
         # delivered via an async callback (`self.result_cb`).
-        self._req_put = ru.zmq.Putter('funcs_req_queue',
-                                      self._req_addr_put,
-                                      log=self._log,
-                                      prof=self._prof)
+        slots = (cfg.get('slots') or dict()).get('gpu', 1)
+        blk   = dict(BULK)
+        blk.update(cfg.get('bulk') or dict())
+        if not blk['size']:
+            blk['size'] = slots
+
+        self._req_put = bulk.BulkPutter(ru.zmq.Putter('funcs_req_queue',
+                                                      self._req_addr_put,
+                                                      log=self._log,
+                                                      prof=self._prof),
+                                        window=blk['window'],
+                                        size=blk['size'],
+                                        log=self._log)
         self._res_get = ru.zmq.Getter('funcs_req_queue',
                                       self._res_addr_get,
                                       cb=self.result_cb,
@@ -172,7 +399,9 @@ class MyMaster(rp.task_overlay.Master):
         # for the workers it is the opposite: they will get requests from the
         # request queue, and will send responses to the response queue.
         self._info = {'req_addr_get': self._req_addr_get,
-                      'res_addr_put': self._res_addr_put}
+                      'res_addr_put': self._res_addr_put,
+                      'slots'       : cfg.get('slots'),
+                      'res_window'  : blk['res_window']}
 
         self._log.debug('info: %s', self._info)
 
@@ -180,10 +409,33 @@ class MyMaster(rp.task_overlay.Master):
         time.sleep(1)
 
         # prepare for operation
-        self._fstate = '%s/status.json' % self._dbase
-        self._state  = dict()      # state of all ranks
-        self._req    = dict()      # keep track of open requests
-        self._lock   = mt.RLock()  # lock the request and state dicts on updates
+        self._fstate  = '%s/status.json' % self._dbase
+        self._journal = Journal(self._fstate, self._log)
+        self._state   = dict()      # state of all ranks
+        self._req     = dict()      # keep track of open requests
+        self._lock    = mt.RLock()  # lock the request and state dicts on updates
+        self._idle    = mt.Event()  # set while no requests are open
+        self._idle.set()
+
+        sched = copy.deepcopy(SCHEDULE)
+        for key, val in (cfg.get('schedule') or dict()).items():
+            if isinstance(val, dict): sched[key].update(val)
+            else                    : sched[key] = val
+
+        if not sched['window']:
+            sched['window'] = n_workers * slots
+
+        self._sched   = sched
+        self._queue   = list()            # heap of scheduled requests
+        self._seq     = itertools.count() # keep FIFO order on equal priority
+        self._n_sub   = {'min': 0,        # submitted requests per call type
+                         'sim': 0}
+        self._top     = list()            # heap of the best (negated) energies
+        self._keys    = dict()            # priority key per scheduled rank
+        self._refused = {'min': list(),   # refused ranks per call type
+                         'sim': list()}
+
+        self._log.debug('schedule: %s', self._sched)
 
 
     # --------------------------------------------------------------------------
@@ -192,20 +444,9 @@ class MyMaster(rp.task_overlay.Master):
 
         # safe current state to disk
         with self._lock:
-            if self._state:
-                self._log.debug('sync [%d]: %s', len(self._state),
-                        self._state[sorted(self._state.keys())[0]])
-            else:
-                self._log.debug('sync [0]')
-
+            self._log.debug('sync [%d]', len(self._state))
             try:
-                ru.write_json(self._state, '%s.tmp' % self._fstate)
-                out, err, ret = ru.sh_callout('ls -la %s.tmp' % self._fstate)
-                self._log.debug('=== [%s] [%s]', out, err)
-             #  os.system('ls -l %s.tmp %s' % (self._fstate, self._fstate))
-                shutil.move('%s.tmp' % self._fstate, self._fstate)
-             #  os.system('mv    %s.tmp %s' % (self._fstate, self._fstate))
-             #  os.system('ls -l %s.tmp %s' % (self._fstate, self._fstate))
+                self._journal.compact(self._state)
             except:
                 self._log.exception('sync error')
 
@@ -220,50 +461,77 @@ class MyMaster(rp.task_overlay.Master):
         # those workers and execute them.
         self.submit_workers()
 
-        if not os.path.exists(self._fstate):
-            self.sync()
+        self._state = self._journal.load()
 
-        try:
-            self._state = ru.Config(cfg=ru.read_json(self._fstate))
-        except:
-            self._state = dict()
+        # MMGBSA results of earlier runs count for the top-N cutoff
+        for info in self._state.values():
+            stats = info.get('mmgbsa')
+            if isinstance(stats, dict):
+                heapq.heappush(self._top, -stats['mean'])
+        top_n = self._sched['top_n']
+        if top_n:
+            self._top = heapq.nlargest(top_n, self._top)
+            heapq.heapify(self._top)
 
         to_minimize = list()  # need to run minimization
         to_simulate = list()  # need to run mmgbsa simulations
 
-        for rank in glob.glob('%s/rank*/' % self._dbase):
+        # the rank manifest avoids a scan of the database directory.  Ranks
+        # which were docked again after a restart are listed more than once.
+        seen = set()
+        for rec in manifest.ranks(self._dbase):
+
+            rid  = rec['path'].decode()
+            if rid in seen:
+                continue
+            seen.add(rid)
+
+            info = self._state.get(rid)
+
+            # done ranks are not touched again
+            if info and info['simulate'] is False:
+                continue
 
+            rank = '%s/%s' % (self._dbase, rid)
+            if not info:
+                info = {'energy'  : None,  # unknown
+                        'simulate': None}  # not done yet
+                self._state[rid] = info
 
-            rank = rank.rstrip('/')
-            rid  = rank.split('/')[-1]
-            if rid not in self._state:
-                self._state[rid] = {'energy'  : None,  # unknown
-                                    'simulate': None}  # not done yet
+            score = float(rec['score'])
+            if   info['energy'  ] is None: to_minimize.append([rank, score])
+            elif info['simulate'] is True: to_simulate.append([rank, score])
 
-            info = self._state[rid]
-            if   info['energy'  ] is None: to_minimize.append(rank)
-            elif info['simulate'] is True: to_simulate.append(rank)
+        # schedule all minimization tasks - the most promising ranks first
+        for rank, score in to_minimize:
+            self.schedule('min', rank, score, dispatch=False)
 
-        # submit all minimization tasks first
-        for rank in to_minimize:
-            self.request('min', rank)
+        # schedule all simulations tasks - by minimization energy
+        for rank, _ in to_simulate:
+            rid = rank.split('/')[-1]
+            self.schedule('sim', rank, self._state[rid]['energy'],
+                          dispatch=False)
 
-      # # submit all simulations tasks
-      # for rank in to_simulate:
-      #     self.request('sim', rank)
+        self.dispatch()
 
-        # all eligible tasks are submitted - now we just wait for the results to
-        # come back.  If minimization results are positive, we may need to
-        # submit new tasks (in self._result_cb) - but otherwise we just wait (in
-        # `self.wait()`) until all tasks are done.
+        # all eligible tasks are scheduled - now we just wait for the results to
+        # come back.  Each result frees a slot in the window for the next
+        # scheduled request.  If minimization results are positive, we may need
+        # to schedule new tasks (in self._result_cb) - but otherwise we just
+        # wait until all tasks are done.
 
         # sync current state to disk
         self.sync()
 
-        # TODO: wait for completion
-        while len(self._req):
-            self._log.debug('wait: %d', len(self._req))
-            time.sleep(5)
+        # wait for completion: new requests are scheduled before the request
+        # which triggered them is removed, and `dispatch` only sets `_idle` once
+        # no request is open or queued
+        self._idle.wait()
+
+        # final snapshot
+        self.sync()
+        self._journal.close()
+        self._req_put.close()
 
         self._prof.prof('master_run_stop', uid=self._uid)
 
@@ -294,25 +562,148 @@ class MyMaster(rp.task_overlay.Master):
 
     # --------------------------------------------------------------------------
     #
-    def request(self, call, rank):
+    def schedule(self, call, rank, key, dispatch=True):
+        '''
+        Queue a request with the given priority key (lower is more promising,
+        `None` / `NaN` for unknown).  Minimizations with a docking score above
+        the threshold are skipped.
+        '''
+
+        if key is None or key != key:
+            key = float('inf')
+
+        # ranks without known score are not skipped
+        threshold = self._sched['threshold']
+        if call == 'min' and threshold is not None and \
+                threshold < key < float('inf'):
+            self._log.debug('skip %s %s: %s > %s', call, rank, key, threshold)
+            return
+
+        prio = {'sim': 0, 'min': 1}[call]
+        with self._lock:
+            self._keys[rank] = key
+            heapq.heappush(self._queue, (prio, key, next(self._seq), call, rank))
+
+        if dispatch:
+            self.dispatch()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def dispatch(self):
+        '''
+        submit queued requests by priority until the window is full
+        '''
+
+        with self._lock:
+
+            # nothing in flight which could free a slot: retry refused requests
+            if not self._req:
+                self._retry()
+
+            while self._queue and len(self._req) < self._sched['window']:
+
+                _, _, _, call, rank = heapq.heappop(self._queue)
+
+                if not self._budget(call):
+                    self._log.debug('budget exhausted: %s %s', call, rank)
+                    continue
+
+                if call == 'sim':
+                    self.request(call, rank, {'cutoff': self.cutoff()})
+                    continue
+
+                # batch the next minimizations in line
+                batch = [rank]
+                while self._queue and self._queue[0][3] == 'min' and \
+                        len(batch) < self._sched['batch'] and \
+                        self._budget('min'):
+                    batch.append(heapq.heappop(self._queue)[4])
+
+                if len(batch) > 1: self.request('min_batch', batch)
+                else             : self.request('min', rank)
+
+            if not self._req:
+                self._idle.set()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _retry(self, call=None):
+        '''
+        queue refused requests of the given call type (default: all) again,
+        with their original priority
+        '''
+
+        with self._lock:
+            for kind in self._refused:
+                if call and kind != call:
+                    continue
+                prio = {'sim': 0, 'min': 1}[kind]
+                for rank in self._refused[kind]:
+                    key = self._keys[rank]
+                    heapq.heappush(self._queue,
+                                   (prio, key, next(self._seq), kind, rank))
+                self._refused[kind] = list()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _budget(self, call):
+        '''
+        count a request against the budget of its call type - return `False`
+        if the budget is exhausted
+        '''
+
+        budget = self._sched['budget'].get(call)
+        if budget is not None and self._n_sub[call] >= budget:
+            return False
+
+        self._n_sub[call] += 1
+        return True
+
+
+    # --------------------------------------------------------------------------
+    #
+    def cutoff(self):
+        '''
+        return the `top_n`-th best MMGBSA binding energy, or `None` if there
+        are not yet enough results
+        '''
+
+        with self._lock:
+            if self._sched['top_n'] and len(self._top) >= self._sched['top_n']:
+                return -self._top[0]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def request(self, call, rank, args=None):
         '''
         submit a work request to the request queue
         '''
 
-        assert(call in ['min', 'sim']), call
+        assert(call in ['min', 'min_batch', 'sim']), call
 
-        rid  = rank.split('/')[-1]
-        self._prof.prof('master_%s_req' % call, uid=rid)
+        # `min_batch` requests carry a list of ranks
+        if call == 'min_batch':
+            for _rank in rank:
+                self._prof.prof('master_min_req', uid=_rank.split('/')[-1])
+        else:
+            self._prof.prof('master_%s_req' % call, uid=rank.split('/')[-1])
 
         # create request and add to bookkeeping dict.  That response object will
         # be updated once a response for the respective request UID arrives.
         req = Request(work={'call': call,
-                            'rank': rank})
+                            'rank': rank,
+                            'args': args})
         with self._lock:
             self._req[req.uid] = req
+            self._idle.clear()
 
         self._log.info('req put %s %s: %s', call, rank, req.uid)
-        # push the request message (here and dictionary) onto the request queue
+        # push the request message (here and dictionary) onto the request
+        # queue - it is sent with other requests of the same time window
         self._req_put.put(req.as_dict())
 
         # return the request to the master script for inspection etc.
@@ -322,8 +713,25 @@ class MyMaster(rp.task_overlay.Master):
     # --------------------------------------------------------------------------
     #
     def result_cb(self, msg):
+        '''
+        handle a frame of results, and refill the request window once
+        '''
+
+        msgs = bulk.unpack(msg)
+        self._log.debug('=== result [%d]', len(msgs))
 
-        self._log.debug('=== result')
+        with self._lock:
+
+            for res in msgs:
+                self._result(res)
+
+            # refill the window (sets `_idle` if no work is left)
+            self.dispatch()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _result(self, msg):
 
         # update result and error information for the corresponding request UID
         call = msg['call']
@@ -331,11 +739,52 @@ class MyMaster(rp.task_overlay.Master):
         uid  = msg['uid']
         res  = msg['res']
         err  = msg['err']
-        rid  = rank.split('/')[-1]
 
-        self._prof.prof('master_%s_res' % call, uid=rid)
         self._log.info('res get %s %s: %s : %s : %s', call, rank, uid, res, err)
 
+        with self._lock:
+
+            # a refused request is held back (and does not count against the
+            # budget), see `REFUSED`
+            if err == REFUSED:
+                if call == 'min_batch': ranks = rank
+                else                  : ranks = [rank]
+                kind = 'sim' if call == 'sim' else 'min'
+                for _rank in ranks:
+                    self._n_sub[kind] -= 1
+                    self._refused[kind].append(_rank)
+
+            else:
+                # any other result frees a slot of its call type on some
+                # worker
+                self._retry('sim' if call == 'sim' else 'min')
+
+                # a minimization batch carries one `[energy, error]` pair per
+                # rank
+                if call == 'min_batch':
+                    if not isinstance(res, list):
+                        res = [[res, err]] * len(rank)
+                    for _rank, (_res, _err) in zip(rank, res):
+                        self._update('min', _rank, _res, _err)
+                else:
+                    self._update(call, rank, res, err)
+
+            # request is done - this triggers waiters and done callbacks, which
+            # thus see the updated state
+            self._req[uid].set_result(res, err)
+            del(self._req[uid])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _update(self, call, rank, res, err):
+        '''
+        record the result of a call for a single rank
+        '''
+
+        rid = rank.split('/')[-1]
+        self._prof.prof('master_%s_res' % call, uid=rid)
+
         # check if the request was a minimize or simulate call.  For minimiz,
         # evaluate the returned anergy and decide if we need to submit an
         # simulate task - if so, submit it.  For a simulate result, just mark
@@ -343,34 +792,42 @@ class MyMaster(rp.task_overlay.Master):
 
         with self._lock:
 
-            self._req[uid].set_result(res, err)
-
             if call == 'min':
 
               # if res is None: self._state[rid]['energy'] = np.nan
                 if res is None: self._state[rid]['energy'] = -1000.0
                 else          : self._state[rid]['energy'] = res
 
-                if res is None or res <= 0:
-                    # no need to simulate this rank
+                if res is None or res != res or res <= 0:
+                    # no need to simulate this rank (or failed minimization)
                     self._log.debug('rank %s: min done', rid)
                     self._state[rid]['simulate'] = False
-              # else:
-              #     # got a positive energy: submit simulation
-              #     self._log.debug('rank %s: req sim', rid)
-              #     self._state[rid]['simulate'] = True
-              #     self.request('sim', rank)
+                else:
+                    # got a positive energy: schedule a simulation.  This is
+                    # called under the result lock, `result_cb` dispatches
+                    # once the whole frame is handled
+                    self._log.debug('rank %s: req sim', rid)
+                    self._state[rid]['simulate'] = True
+                    self.schedule('sim', rank, res, dispatch=False)
 
             elif call == 'sim':
 
-                # just record the result
+                # record the MMGBSA statistics, and update the top-N energies
                 self._log.debug('rank %s: sim done', rid)
                 self._state[rid]['simulate'] = False
+                self._state[rid]['mmgbsa']   = res
 
-            self.sync()
+                top_n = self._sched['top_n']
+                if isinstance(res, dict) and top_n:
+                    if len(self._top) < top_n:
+                        heapq.heappush(self._top, -res['mean'])
+                    elif -res['mean'] > self._top[0]:
+                        heapq.heapreplace(self._top, -res['mean'])
 
-            # request is done
-            del(self._req[uid])
+            try:
+                self._journal.append(rid, self._state[rid], self._state)
+            except:
+                self._log.exception('journal error')
 
 
 # ------------------------------------------------------------------------------
@@ -7,6 +7,8 @@ import numpy as np
 
 from impress_md import interface_functions
 
+import mmgbsa_stream
+
 
 # ------------------------------------------------------------------------------
 #
@@ -49,8 +51,12 @@ if __name__ == '__main__':
     elif mode == 'mmgbsa':
 
         try:
-            # O(10k)
-            interface_functions.RunMMGBSA_(rank, rank, gpu=True, niters=5000)
+            # O(10k), stops early once the binding energy converged
+            stats = mmgbsa_stream.run_mmgbsa(rank, gpu=True)
+            print('=== done MMGBSA    %s [%s]' % (name, stats))
+
+            with open('%s/work_stats/%s.stat' % (work, name), 'a') as fout:
+                fout.write('mmgbsa: %s\n' % stats)
 
         except Exception as e:
             print('=== fail MMGBSA    %s [err=%s]' % (name, e))
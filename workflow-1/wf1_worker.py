@@ -2,17 +2,210 @@
 
 import os
 import sys
-import time
+import queue
 
 import numpy           as np
+import threading       as mt
 import multiprocessing as mp
 
 from impress_md import interface_functions as iface
 
+import bulk
+import mmgbsa_stream
+
 import radical.utils as ru
 import radical.pilot as rp
 
 
+# time limits for the calls, in seconds
+TIMEOUT = {'min':      30,
+           'sim': 60 * 30}
+
+# `min_batch` requests run several minimizations back to back in the same GPU
+# process: the time limit applies per minimization, and the batch counts
+# against the `min` slots
+BATCH   = {'min_batch': 'min'}
+
+# Number of concurrent requests per worker (i.e., per GPU), in total and per
+# call type.  Can be overwritten by the `slots` section of `config.json`.
+# Short minimizations can then use the GPU while a long MMGBSA run is active.
+SLOTS   = {'gpu': 1,
+           'min': 1,
+           'sim': 1}
+
+# error returned for requests which find no free slot on this worker - the
+# master queues them again
+REFUSED = 'refused'
+
+
+# ------------------------------------------------------------------------------
+#
+def child_main(conn):
+    '''
+    Main loop of a persistent child process: receive `[call, rid, rank, args]`
+    requests over the pipe, run them, and send back `[rid, val, err]`.  For
+    `sim` calls, `val` is the dict of MMGBSA statistics (see
+    `mmgbsa_stream.py`), and `args` can hold the master's energy `cutoff`.
+    For `min_batch` calls, `rank` is a list of ranks, and one result is sent
+    per rank as soon as it is available.  The process lives across requests,
+    so the OpenEye / OpenMM imports and the GPU platform initialization are
+    only paid once.
+    '''
+
+    while True:
+
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+
+        if msg is None:
+            break
+
+        call, rid, rank, args = msg
+        val = np.nan
+        err = None
+
+        if call == 'min_batch':
+            for _rank in rank:
+                val = np.nan
+                err = None
+                try:
+                    val = iface.RunMinimization_(_rank, _rank, write=True,
+                                                 gpu=True)
+                except Exception as e:
+                    err = str(e)
+                conn.send([rid, val, err])
+            continue
+
+        try:
+            if call == 'min':
+                val = iface.RunMinimization_(rank, rank, write=True, gpu=True)
+
+            elif call == 'sim':
+                val = mmgbsa_stream.run_mmgbsa(rank, gpu=True,
+                                               timeout=TIMEOUT['sim'], **args)
+
+            else:
+                err = 'unknown call %s' % call
+
+        except Exception as e:
+            err = str(e)
+
+        conn.send([rid, val, err])
+
+
+# ------------------------------------------------------------------------------
+#
+class GPUProcess(object):
+    '''
+    A persistent child process which executes calls on the worker's GPU.
+    Requests are sent over a pipe, and the result is awaited without polling.
+    The child is only replaced if a call times out or the child dies.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, log):
+
+        self._log  = log
+        self._proc = None
+        self._conn = None
+
+        self.start()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def start(self):
+
+        self._conn, child = mp.Pipe()
+        self._proc = mp.Process(target=child_main, args=[child])
+        self._proc.daemon = True
+        self._proc.start()
+        child.close()
+
+        self._log.debug('started child %s', self._proc.pid)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stop(self):
+
+        if self._proc.is_alive():
+            self._proc.terminate()
+        self._proc.join()
+        self._conn.close()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def restart(self):
+
+        self._log.debug('recycle child %s', self._proc.pid)
+        self.stop()
+        self.start()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def call(self, call, rid, rank, timeout, args=None):
+        '''
+        run the call in the child process, return `[val, err]`
+        '''
+
+        try:
+            self._conn.send([call, rid, rank, args or dict()])
+
+            if not self._conn.poll(timeout):
+                self.restart()
+                return np.nan, 'timeout'
+
+            _rid, val, err = self._conn.recv()
+            assert(_rid == rid), [_rid, rid]
+
+            return val, err
+
+        except (EOFError, OSError):
+            # the child died (and took the request with it)
+            self.restart()
+            return np.nan, 'child failed'
+
+
+    # --------------------------------------------------------------------------
+    #
+    def call_batch(self, call, rid, ranks, timeout, args=None):
+        '''
+        Run a batch call in the child process, with the timeout applied per
+        rank.  Return a list of `[val, err]` per rank.  If a rank times out (or
+        kills the child), the remaining ranks continue in a new child.
+        '''
+
+        ret = list()
+        while len(ret) < len(ranks):
+
+            todo = ranks[len(ret):]
+            try:
+                self._conn.send([call, rid, todo, args or dict()])
+
+                for _ in todo:
+
+                    if not self._conn.poll(timeout):
+                        self.restart()
+                        ret.append([np.nan, 'timeout'])
+                        break
+
+                    _rid, val, err = self._conn.recv()
+                    assert(_rid == rid), [_rid, rid]
+                    ret.append([val, err])
+
+            except (EOFError, OSError):
+                self.restart()
+                ret.append([np.nan, 'child failed'])
+
+        return ret
+
+
 # ------------------------------------------------------------------------------
 #
 class MyWorker(rp.task_overlay.Worker):
@@ -46,108 +239,155 @@ class MyWorker(rp.task_overlay.Worker):
         that incoming requests will trigger an async callback `self.request_cb`.
         '''
 
+        slots = dict(SLOTS)
+        slots.update(self._info.get('slots') or dict())
+
+        self._log.debug('slots: %s', slots)
+
+        # requests in flight, and per call type
+        self._slots = mt.Semaphore(slots['gpu'])
+        self._calls = {call: mt.Semaphore(min(slots[call], slots['gpu']))
+                       for call in TIMEOUT}
+
+        # one GPU process per slot.  Start them before the ZMQ threads come
+        # up, so that they are forked from a quiet process
+        self._procs = queue.Queue()
+        for _ in range(slots['gpu']):
+            self._procs.put(GPUProcess(self._log))
+
         self._req_get = ru.zmq.Getter('funcs_req_queue',
                                       self._info.req_addr_get,
                                       cb=self.request_cb,
                                       log=self._log,
                                       prof=self._prof)
-        self._res_put = ru.zmq.Putter('funcs_res_queue',
-                                      self._info.res_addr_put,
-                                      log=self._log,
-                                      prof=self._prof)
+        # results are sent in bulk frames
+        self._res_put = bulk.BulkPutter(ru.zmq.Putter('funcs_res_queue',
+                                                      self._info.res_addr_put,
+                                                      log=self._log,
+                                                      prof=self._prof),
+                                        window=self._info.get('res_window',
+                                                              bulk.WINDOW),
+                                        log=self._log)
 
         self._log.info('initialized: %s', self._info)
         self._prof.prof('worker_init', uid=self._uid)
 
-        self._queue = mp.Queue()
-
         # the worker can return custom information which will be made available
         # to the master.  This can be used to communicate, for example, worker
         # specific communication endpoints.
         return {'foo': 'bar'}
 
 
+    # --------------------------------------------------------------------------
+    #
+    def request_cb(self, msg):
+        '''
+        Hand the requests of a bulk frame to handler threads.  A request only
+        starts if both a slot of its call type and a total slot are free - it
+        then holds both until its result is sent.  Otherwise it is refused and
+        goes back to the master, so that it does not wait here while other
+        workers (or other call types on this worker) could run it.  The next
+        frame is only fetched once a slot is free, so that the worker does not
+        keep requests away from others.
+        '''
+
+        for req in bulk.unpack(msg):
+
+            call = req['call']
+            kind = BATCH.get(call, call)
+
+            if kind not in self._calls:
+                err = 'unknown call %s' % call
+                self._log.error('call failed: %s', err)
+                self._prof.prof('worker_%s_fail' % call, uid=req['uid'])
+                self._respond(req, np.nan, err)
+                continue
+
+            if not self._calls[kind].acquire(blocking=False):
+                self._refuse(req)
+                continue
+
+            if not self._slots.acquire(blocking=False):
+                self._calls[kind].release()
+                self._refuse(req)
+                continue
+
+            mt.Thread(target=self._handle, args=[req], daemon=True).start()
+
+        self._slots.acquire()
+        self._slots.release()
+
 
     # --------------------------------------------------------------------------
     #
-    def run_min(self, rid, rank1, rank2, write, gpu):
+    def _refuse(self, msg):
 
-        val = iface.RunMinimization_(rank1, rank2, write=write, gpu=gpu)
-        self._queue.put([rid, val])
+        self._log.debug('req refused %s %s: %s', msg['call'], msg['rank'],
+                                                 msg['uid'])
+        self._prof.prof('worker_%s_refuse' % msg['call'], uid=msg['uid'])
+        self._respond(msg, np.nan, REFUSED)
 
 
     # --------------------------------------------------------------------------
     #
-    def run_sim(self, rid, rank1, rank2, gpu, niters):
+    def _respond(self, msg, val, err):
+
+        res = {'call': msg['call'],
+               'rank': msg['rank'],
+               'uid' : msg['uid'],
+               'res' : val,
+               'err' : err}
 
-        val = iface.RunMMGBSA_(rank1, rank2, gpu=True, niters=niters)
-        self._queue.put([rid, val])
+        self._log.info('res put %s %s: %s : %s : %s', msg['call'], msg['rank'],
+                                                       msg['uid'], val, err)
+        self._res_put.put(res)
 
 
     # --------------------------------------------------------------------------
     #
-    def request_cb(self, msg):
+    def _handle(self, msg):
         '''
-        This implementation only understands a single request type: 'hello'.
-        It will run that request and immediately return a respone message.
-        All other requests will immediately trigger an error response.
+        This implementation understands three request types: 'min', 'sim' and
+        'min_batch'.  It will run the request in a free GPU process and return
+        a respone message once the call completed or timed out.  The request's
+        slots are acquired by `request_cb`, and are released here.
         '''
 
         uid  = msg['uid']
         call = msg['call']
         rank = msg['rank']
-        val  = np.NaN
+        kind = BATCH.get(call, call)
+        val  = np.nan
         err  = None
-        rid  = rank.split('/')[-1]
 
-        timeout = {'min':      30,
-                   'sim': 60 * 30}[call]
+        # batches are profiled under the request id
+        if call in BATCH: rid = uid
+        else            : rid = rank.split('/')[-1]
 
         self._log.info('req get %s %s: %s', call, rank, uid)
 
-        # make sure queue is empty
-
         try:
-            if call == 'min':
-                proc = mp.Process(target=self.run_min,
-                                  args=[rid, rank, rank, True, True])
-
-            elif msg['call'] == 'sim':
-                proc = mp.Process(target=self.run_sim,
-                                  args=[rid, rank, rank, True, 5000])
-
-        except Exception as e:
-            err = str(e)
-            self._log.exception('call failed')
-            self._prof.prof('worker_%s_fail'  % call, uid=rid)
-
-        proc.start()
-        start = time.time()
-        self._prof.prof('worker_%s_start'  % call, uid=rid)
-        while True:
+            proc = self._procs.get()
             try:
-                _rid, val = self._queue.get(block=True, timeout=1)
-                if _rid != rid:
-                    self._log.debug('unexpected queue data %s: %s', _rid, val)
-                    continue
+                self._prof.prof('worker_%s_start'  % call, uid=rid)
+                if call in BATCH:
+                    val = proc.call_batch(call, rid, rank, TIMEOUT[kind],
+                                          msg.get('args'))
                 else:
-                    self._prof.prof('worker_%s_stop' % call, uid=rid)
-                    break
-            except:
-                if start + timeout < time.time():
-                    err = 'timeout'
-                    self._prof.prof('worker_%s_tout' % call, uid=rid)
-                    proc.terminate()
-                    break
-
-        res = {'call': call,
-               'rank': rank,
-               'uid' : uid,
-               'res' : val,
-               'err' : err}
+                    val, err = proc.call(call, rid, rank, TIMEOUT[call],
+                                         msg.get('args'))
+            finally:
+                self._procs.put(proc)
 
-        self._log.info('res put %s %s: %s : %s : %s', call, rank, uid, val, err)
-        self._res_put.put(res)
+            if   err == 'timeout': self._prof.prof('worker_%s_tout' % call, uid=rid)
+            elif err             : self._prof.prof('worker_%s_fail' % call, uid=rid)
+            else                 : self._prof.prof('worker_%s_stop' % call, uid=rid)
+
+            self._respond(msg, val, err)
+
+        finally:
+            self._calls[kind].release()
+            self._slots.release()
 
 
 # ------------------------------------------------------------------------------
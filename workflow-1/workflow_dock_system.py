@@ -2,13 +2,16 @@
 
 import os
 import sys
-import pprint
 
 import pandas        as pd
-import radical.utils as ru
 
 from impress_md import interface_functions as iface
 
+import manifest
+import pipeline
+
+from state_db import StateDB
+
 
 # --------------------------------------------------------------------------
 #
@@ -63,18 +66,34 @@ def mmgbsa(pos, path, gpu, niters):
         return False
 
 
+# ------------------------------------------------------------------------------
+#
+# number of workers per stage: docking and parameterization run on the CPU, in
+# worker processes (see `pipeline.py`), minimization and MMGBSA on the GPU, in
+# worker threads (the defaults can be overwritten on the command line)
+CPU_WORKERS = os.cpu_count() or 1
+GPU_WORKERS = 1
+
+
 # ------------------------------------------------------------------------------
 #
 if __name__ == '__main__':
 
+    # usage: workflow_dock_system.py <smiles> <receptor> [n_cpu [n_gpu]]
+
     smiles_file   = sys.argv[1]
     receptor_file = sys.argv[2]
+    n_cpu         = int(sys.argv[3]) if len(sys.argv) > 3 else CPU_WORKERS
+    n_gpu         = int(sys.argv[4]) if len(sys.argv) > 4 else GPU_WORKERS
     target_name   = receptor_file
     dbase_name    = 'ena_db'
     path_root     = 'rank'
     path_output   = 'output/'
     path_input    = 'input/'
-    state         = dict()
+
+    # the rank directories are created in the working directory, which thus
+    # is the database the WF1 master reads (and which holds the manifest)
+    path_dbase    = os.getcwd()
 
     smiles_data   = pd.read_csv(smiles_file, sep=' ', header=None)
 
@@ -82,97 +101,125 @@ if __name__ == '__main__':
     smi_base      = os.path.basename(smiles_file  ).split('.')[0]
     print(rec_base)
 
-    state_file    = '%s_%s.json' % (rec_base, smi_base)
+    state_file    = '%s_%s.json' % (rec_base, smi_base)   # former format
+    state_db      = '%s_%s.db'   % (rec_base, smi_base)
 
     if not os.path.exists(path_output):
         os.mkdir(path_output)
 
+    state = StateDB(state_db)
+
     if os.path.exists(state_file):
-        state = ru.read_json(state_file)
+        print('=== import %d positions' % state.import_json(state_file))
+
+
+    # the stage functions run in the workers of the pipeline
+    def docking_init():
+        # the receptor is loaded once per docking process
+        docker, recept = iface.get_receptr(receptor_file=receptor_file)
+        return {'docker': docker, 'recept': recept}
+
+
+    def docking_stage(item, docker, recept):
+        return list(docking(item['pos'], item['smiles'], path_input,
+                            item['path'], dbase_name, target_name, docker,
+                            write=True, recept=recept,
+                            receptor_file=receptor_file, name=item['name'],
+                            docking_only=True))
+
+
+    def parameterize_stage(item):
+        return parameterize(item['pos'], item['path'])
+
+
+    def minimization_stage(item):
+        return minimization(item['pos'], item['path'], write=True, gpu=True)
+
 
-    def pstate_flush(_state):
-        ru.write_json(_state, '%s.new' % state_file)
-        os.system('mv %s.new %s' % (state_file, state_file))
+    def mmgbsa_stage(item):
+        return mmgbsa(item['pos'], item['path'], gpu=True, niters=5000)  # 5ns
 
 
-    def pstate_get(_state, pos, key):
-        pos = str(pos)
-        if pos not in _state:
-            _state[pos] = {'docking'      : [None, None],  # core, res
-                           'parameterize' : None,
-                           'minimization' : None,
-                           'mmgbsa'       : None,
-                           'result'       : None}
-        return _state[pos][key]
+    def get_result(pos, path):
+        with open(path + "/metrics.csv") as f:
+            next(f)
+            result = next(f)
+        state.set(pos, 'result', result, flush=True)
 
 
-    def pstate_set(_state, pos, key, val, flush=False):
-        pos = str(pos)
-        _state[pos][key] = val
-        if flush:
-            pstate_flush(_state)
+    pipe = pipeline.Pipeline([
+        pipeline.Stage('docking',      docking_stage,      workers=n_cpu,
+                       init=docking_init, procs=True,
+                       filt=lambda res: bool(res) and res[0] is not False),
+        pipeline.Stage('parameterize', parameterize_stage, workers=n_cpu,
+                       procs=True),
+        pipeline.Stage('minimization', minimization_stage, workers=n_gpu,
+                       filt=lambda res: res is not False and res >= 500),
+        pipeline.Stage('mmgbsa',       mmgbsa_stage,       workers=n_gpu)])
+
+    stages = [stage.name for stage in pipe.stages]
+
+
+    # feed the positions into the pipeline, at the first stage they still
+    # need - completed positions are skipped without touching the state store
+    def get_items():
+
+        done = state.done()
+
+        for pos in range(smiles_data.shape[0]):
+
+            if pos in done:
+                continue
+
+            path = path_root + str(pos) + "/"
+            item = {'pos'   : pos,
+                    'smiles': smiles_data.iloc[pos, 0],
+                    'name'  : smiles_data.iloc[pos, 1],
+                    'path'  : path}
+
+            if state.get(pos, 'docking')[0] is None:
+                yield 'docking', item
+                continue
+
+            for name in stages[1:]:
+                if state.get(pos, name) is None:
+                    yield name, item
+                    break
+            else:
+                get_result(pos, path)
+
+
+    # stage results are handled in the main thread
+    def result_cb(name, item, res, ok):
+
+        pos = item['pos']
+
+        if name == 'docking' and res is False:
+            res = [False, False]
+
+        state.set(pos, name, res)
+
+        if name == 'docking' and ok:
+            # list the new rank for the WF1 master
+            manifest.add(path_dbase, pos, res[0], item['path'])
+
+        if not ok:
+            # the remaining stages are skipped
+            for key in stages[stages.index(name) + 1:] + ['result']:
+                state.set(pos, key, False)
+            state.flush()
+
+        elif name == stages[-1]:
+            get_result(pos, item['path'])
 
 
-    docker, recept = iface.get_receptr(receptor_file=receptor_file)
     print('=== init')
 
-    for pos in range(smiles_data.shape[0]):
-
-        smiles = smiles_data.iloc[pos, 0]
-        name   = smiles_data.iloc[pos, 1]
-        path   = path_root + str(pos) + "/"
-
-        score, res = pstate_get(state, pos, 'docking')
-        if score is None and res is None:
-            score, res = docking(pos, smiles, path_input, path,
-                                 dbase_name, target_name, docker,
-                                 write=True, recept=recept,
-                                 receptor_file=receptor_file, name=name,
-                                 docking_only=True)
-            pstate_set(state, pos, 'docking', [score, res])
-            if score is False and res is False:
-                pstate_set(state, pos, 'parameterize', False)
-                pstate_set(state, pos, 'minimization', False)
-                pstate_set(state, pos, 'mmgbsa',       False)
-                pstate_set(state, pos, 'result',       False)
-                pstate_flush(state)
-
-        param = pstate_get(state, pos, 'parameterize')
-        if param is None:
-            param = parameterize(pos, path)
-            pstate_set(state, pos, 'parameterize', param)
-            if param is False:
-                pstate_set(state, pos, 'minimization', False)
-                pstate_set(state, pos, 'mmgbsa',       False)
-                pstate_set(state, pos, 'result',       False)
-                pstate_flush(state)
-
-        mscore = pstate_get(state, pos, 'minimization')
-        if mscore is None:
-            mscore = minimization(pos, path, write=True, gpu=True)
-            pstate_set(state, pos, 'minimization', mscore)
-            if mscore is False or mscore < 500:
-                pstate_set(state, pos, 'mmgbsa', False)
-                pstate_set(state, pos, 'result', False)
-                pstate_flush(state)
-
-        escore = pstate_get(state, pos, 'mmgbsa')
-        if escore is None:
-            escore = mmgbsa(pos, path, gpu=True, niters=5000)  # 5ns
-            pstate_set(state, pos, 'mmgbsa', escore)
-            if escore is False:
-                pstate_set(state, pos, 'result', False)
-                pstate_flush(state)
-
-        result = pstate_get(state, pos, 'result')
-        if result is None:
-            with open(path + "/metrics.csv") as f:
-                next(f)
-                result = next(f)
-            pstate_set(state, pos, 'result', result)
-            pstate_flush(state)
-
-      # pprint.pprint(state)
+    try:
+        pipe.run(get_items(), result_cb)
+    finally:
+        pipe.report()
+        state.close()
 
 
 # ------------------------------------------------------------------------------
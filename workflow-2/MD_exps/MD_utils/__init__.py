@@ -1,3 +1,3 @@
 from contact_maps import  contact_maps_from_traj
-from openmm_simulation import openmm_simulate_charmm_nvt, openmm_simulate_amber_nvt, openmm_simulate_amber_fs_pep, openmm_simulate_charmm_npt_z 
-from openmm_reporter import ContactMapReporter
+from openmm_simulation import openmm_simulate_charmm_nvt, openmm_simulate_amber_nvt, openmm_simulate_amber_fs_pep, openmm_simulate_charmm_npt_z, SimulationEngine, PRESETS
+from openmm_reporter import ContactMapReporter, ContactMapReader, FeatureReporter, default_features
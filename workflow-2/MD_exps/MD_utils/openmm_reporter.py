@@ -1,37 +1,337 @@
 import simtk.openmm.app as app
 import simtk.openmm as omm
-import simtk.unit as u 
+import simtk.unit as u
 
-import numpy as np 
-import h5py 
+import numpy as np
+import h5py
+
+from MDAnalysis.lib.distances import self_capped_distance
+
+
+def triu_contacts(positions, cutoff=8.0):
+    """
+    Returns the upper triangle (without diagonal) of the contact map of the
+    given positions, in the order of `self_distance_array`.  Only pairs within
+    the cutoff are searched for (cell list or KD-tree, as chosen by
+    `self_capped_distance`), so that the cost grows about linearly with the
+    number of positions instead of computing all N^2 distances.
+    """
+    n = len(positions)
+    contacts = np.zeros(n * (n - 1) // 2, dtype=bool)
+    pairs = self_capped_distance(positions, cutoff, return_distances=False)
+    if len(pairs):
+        i = pairs.min(axis=1)
+        j = pairs.max(axis=1)
+        contacts[i * n - i * (i + 1) // 2 + j - i - 1] = True
+    return contacts
+
+
+def ca_indices(topology):
+    """
+    Returns the indices of the CA atoms of an OpenMM topology.
+    """
+    return np.array([atom.index for atom in topology.atoms()
+                     if atom.name == 'CA'], dtype=np.int64)
 
-from MDAnalysis.analysis import distances
 
 class ContactMapReporter(object):
-    def __init__(self, file, reportInterval):
+    """
+    Writes the CA contact map (upper triangle, 8 A cutoff) of each reported
+    frame to the dataset `contact_maps_packed` of an h5 file, one row per
+    frame with the contacts packed to bits by `np.packbits`.  The dataset is
+    chunked by rows, and frames are buffered in memory and written every
+    `flushInterval` frames (and on `close`).  The CA atoms are taken from
+    `topology`, so that the dataset is created and the file is in SWMR mode
+    right away - `ContactMapReader` can open it (and follow the running
+    simulation) before the first frame is reported.
+    """
+    def __init__(self, file, reportInterval, topology, flushInterval=100):
         self._file = h5py.File(file, 'w', libver='latest')
-        self._file.swmr_mode = True
-        self._out = self._file.create_dataset('contact_maps', shape=(2,0), maxshape=(None, None))
         self._reportInterval = reportInterval
+        self._flushInterval = flushInterval
+        self._buffer = []
+        self._ca_indices = ca_indices(topology)
+        n_ca = len(self._ca_indices)
+        self._create(n_ca * (n_ca - 1) // 2)
 
     def __del__(self):
-        self._file.close()
+        self.close()
+
+    def close(self):
+        if self._file:
+            self.flush()
+            self._file.close()
+            self._file = None
 
     def describeNextReport(self, simulation):
         steps = self._reportInterval - simulation.currentStep%self._reportInterval
         return (steps, True, False, False, False, None)
 
+    def _create(self, n_pairs):
+        # the file switches to SWMR mode once the dataset exists
+        n_bytes = (n_pairs + 7) // 8
+        self._out = self._file.create_dataset(
+                'contact_maps_packed', shape=(0, n_bytes), dtype=np.uint8,
+                maxshape=(None, n_bytes), chunks=(self._flushInterval, n_bytes))
+        self._out.attrs['n_pairs'] = n_pairs
+        self._file.swmr_mode = True
+
+    def flush(self):
+        if not self._buffer:
+            return
+        n_frames = self._out.shape[0]
+        self._out.resize(n_frames + len(self._buffer), axis=0)
+        self._out[n_frames:] = np.array(self._buffer)
+        self._out.flush()
+        self._buffer = []
+
+    def report(self, simulation, state):
+        positions = state.getPositions(asNumpy=True).value_in_unit(u.angstrom)
+        positions_ca = np.asarray(positions)[self._ca_indices].astype(np.float32)
+        contact_map = triu_contacts(positions_ca, 8.0)
+        self._buffer.append(np.packbits(contact_map))
+        if len(self._buffer) >= self._flushInterval:
+            self.flush()
+
+
+class ContactMapReader(object):
+    """
+    Reads the contact maps written by `ContactMapReporter`, and unpacks them
+    on demand.  Like the former `contact_maps` dataset, the reader has the
+    shape `(n_pairs, n_frames)`, converts to a float32 array of that layout,
+    and `refresh` picks up frames which were written since it was opened.
+    `frames` unpacks a range of frames as rows.  `dataset` selects the
+    contacts of a `FeatureReporter` file.
+    """
+    def __init__(self, file, dataset='contact_maps_packed'):
+        self._file = h5py.File(file, 'r', libver='latest', swmr=True)
+        self._data = self._file[dataset]
+        self.n_pairs = int(self._data.attrs['n_pairs'])
+
+    def close(self):
+        self._file.close()
+
+    def refresh(self):
+        self._data.refresh()
+
+    @property
+    def n_frames(self):
+        return self._data.shape[0]
+
+    @property
+    def shape(self):
+        return (self.n_pairs, self.n_frames)
+
+    def frames(self, start=0, stop=None):
+        packed = self._data[start:stop]
+        return np.unpackbits(packed, axis=1, count=self.n_pairs)
+
+    def __array__(self, dtype=np.float32, copy=None):
+        return self.frames().T.astype(dtype)
+
+
+def kabsch_rmsd(positions, reference):
+    """
+    Returns the RMSD of `positions` to `reference` (both (N, 3)) after the
+    optimal superposition (Kabsch algorithm).
+    """
+    p = positions - positions.mean(axis=0)
+    q = reference - reference.mean(axis=0)
+    v, s, w = np.linalg.svd(np.dot(p.T, q))
+    # correct for a reflection
+    if np.linalg.det(v) * np.linalg.det(w) < 0:
+        s[-1] = -s[-1]
+    msd = (np.sum(p * p) + np.sum(q * q) - 2 * np.sum(s)) / len(p)
+    return np.sqrt(max(msd, 0.0))
+
+
+class ContactsFeature(object):
+    """
+    CA contact maps at one or more cutoffs (A), bit packed like in
+    `ContactMapReporter` - one dataset `contact_maps_packed_<cutoff>` per
+    cutoff.  The pairs within the largest cutoff are searched once per frame.
+    """
+    needs_energy = False
+
+    def __init__(self, cutoffs=(8.0,)):
+        self._cutoffs = sorted(cutoffs)
+
+    def datasets(self, n_ca):
+        n_pairs = n_ca * (n_ca - 1) // 2
+        return {'contact_maps_packed_%g' % cutoff:
+                    (((n_pairs + 7) // 8,), np.uint8,
+                     {'n_pairs': n_pairs, 'cutoff': cutoff})
+                for cutoff in self._cutoffs}
+
+    def compute(self, positions_ca, state):
+        n = len(positions_ca)
+        pairs, dists = self_capped_distance(positions_ca, self._cutoffs[-1])
+        i = pairs.min(axis=1)
+        j = pairs.max(axis=1)
+        idx = i * n - i * (i + 1) // 2 + j - i - 1
+        ret = {}
+        for cutoff in self._cutoffs:
+            contacts = np.zeros(n * (n - 1) // 2, dtype=bool)
+            contacts[idx[dists < cutoff]] = True
+            ret['contact_maps_packed_%g' % cutoff] = np.packbits(contacts)
+        return ret
+
+
+class RMSDFeature(object):
+    """
+    CA RMSD (A) to a reference structure after optimal superposition; the
+    reference is a PDB file (with the same CA atoms as the simulated system)
+    """
+    needs_energy = False
+
+    def __init__(self, ref_pdb):
+        pdb = app.PDBFile(ref_pdb)
+        ca_indices = [atom.index for atom in pdb.topology.atoms()
+                      if atom.name == 'CA']
+        positions = pdb.getPositions(asNumpy=True).value_in_unit(u.angstrom)
+        self._ref = np.asarray(positions)[ca_indices].astype(np.float64)
+        self._ref_pdb = ref_pdb
+
+    def datasets(self, n_ca):
+        if n_ca != len(self._ref):
+            raise ValueError('reference pdb %s has %d CA atoms, the simulated '
+                             'system has %d' % (self._ref_pdb, len(self._ref), n_ca))
+        return {'rmsd': ((), np.float64, {'ref_pdb': self._ref_pdb})}
+
+    def compute(self, positions_ca, state):
+        return {'rmsd': kabsch_rmsd(positions_ca.astype(np.float64), self._ref)}
+
+
+class RgFeature(object):
+    """
+    radius of gyration (A) of the CA atoms
+    """
+    needs_energy = False
+
+    def datasets(self, n_ca):
+        return {'rg': ((), np.float32, {})}
+
+    def compute(self, positions_ca, state):
+        p = positions_ca - positions_ca.mean(axis=0)
+        return {'rg': np.sqrt(np.sum(p * p) / len(p))}
+
+
+class PositionsFeature(object):
+    """
+    raw CA coordinates (A), as float32 point cloud of shape (n_ca, 3)
+    """
+    needs_energy = False
+
+    def datasets(self, n_ca):
+        return {'ca_positions': ((n_ca, 3), np.float32, {})}
+
+    def compute(self, positions_ca, state):
+        return {'ca_positions': positions_ca.astype(np.float32)}
+
+
+class EnergyFeature(object):
+    """
+    potential and kinetic energy (kJ/mol)
+    """
+    needs_energy = True
+
+    def datasets(self, n_ca):
+        return {'energy': ((2,), np.float64, {'columns': 'potential,kinetic'})}
+
+    def compute(self, positions_ca, state):
+        unit = u.kilojoules_per_mole
+        return {'energy': np.array(
+                    [state.getPotentialEnergy().value_in_unit(unit),
+                     state.getKineticEnergy().value_in_unit(unit)])}
+
+
+def default_features(ref_pdb=None, cutoffs=(8.0,)):
+    """
+    Returns the features for `FeatureReporter`: contacts at the given
+    cutoffs, RMSD to `ref_pdb` (if given), radius of gyration, CA coordinates
+    and energies.
+    """
+    features = [ContactsFeature(cutoffs)]
+    if ref_pdb:
+        features.append(RMSDFeature(ref_pdb))
+    features += [RgFeature(), PositionsFeature(), EnergyFeature()]
+    return features
+
+
+class FeatureReporter(object):
+    """
+    Computes several features of each reported frame in one pass, and writes
+    them to one h5 file with one dataset per feature (one row per frame, plus
+    the simulation time in ps in the dataset `time`).  The CA atoms are
+    selected once from `topology`, and each feature gets their positions in
+    A.  Datasets are created right away, chunked by rows, and the file is in
+    SWMR mode before the first frame is reported.  Frames are buffered and
+    written every `flushInterval` frames.
+
+    A feature has a `needs_energy` flag, `datasets(n_ca)` which returns a dict
+    `{dataset: (row_shape, dtype, {attribute: value})}` of the datasets it
+    writes, and `compute(positions_ca, state)` which returns a dict
+    `{dataset: row}`.
+    The bit packed contacts can be read with
+    `ContactMapReader(file, 'contact_maps_packed_<cutoff>')`.
+    """
+    def __init__(self, file, reportInterval, features, topology,
+                 flushInterval=100):
+        self._file = h5py.File(file, 'w', libver='latest')
+        self._reportInterval = reportInterval
+        self._features = features
+        self._flushInterval = flushInterval
+        self._needs_energy = any(f.needs_energy for f in features)
+        self._ca_indices = ca_indices(topology)
+        datasets = {'time': ((), np.float64, {})}
+        for feature in features:
+            datasets.update(feature.datasets(len(self._ca_indices)))
+        self._create(datasets)
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if self._file:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def describeNextReport(self, simulation):
+        steps = self._reportInterval - simulation.currentStep%self._reportInterval
+        return (steps, True, False, False, self._needs_energy, None)
+
+    def _create(self, datasets):
+        # the file switches to SWMR mode once the datasets exist
+        self._out = {}
+        for name, (shape, dtype, attrs) in datasets.items():
+            self._out[name] = self._file.create_dataset(
+                    name, shape=(0,) + shape, dtype=dtype,
+                    maxshape=(None,) + shape,
+                    chunks=(self._flushInterval,) + shape)
+            for key, val in attrs.items():
+                self._out[name].attrs[key] = val
+        self._buffer = {name: [] for name in self._out}
+        self._file.swmr_mode = True
+
+    def flush(self):
+        if not self._buffer['time']:
+            return
+        for name, dset in self._out.items():
+            n_frames = dset.shape[0]
+            dset.resize(n_frames + len(self._buffer[name]), axis=0)
+            dset[n_frames:] = np.array(self._buffer[name])
+            self._buffer[name] = []
+        for dset in self._out.values():
+            dset.flush()
+
     def report(self, simulation, state):
-        ca_indices = []
-        for atom in simulation.topology.atoms():
-            if atom.name == 'CA':
-                ca_indices.append(atom.index)
-        positions = np.array(state.getPositions().value_in_unit(u.angstrom))
-        time = int(np.round(state.getTime().value_in_unit(u.picosecond)))
-        positions_ca = positions[ca_indices].astype(np.float32)
-        distance_matrix = distances.self_distance_array(positions_ca)
-        contact_map = (distance_matrix < 8.0) * 1.0 
-        new_shape = (len(contact_map), self._out.shape[1] + 1) 
-        self._out.resize(new_shape)
-        self._out[:, new_shape[1]-1] =contact_map
-        self._file.flush()
+        positions = state.getPositions(asNumpy=True).value_in_unit(u.angstrom)
+        positions_ca = np.asarray(positions)[self._ca_indices].astype(np.float32)
+        rows = {'time': np.float64(state.getTime().value_in_unit(u.picosecond))}
+        for feature in self._features:
+            rows.update(feature.compute(positions_ca, state))
+        for name, row in rows.items():
+            self._buffer[name].append(row)
+        if len(self._buffer['time']) >= self._flushInterval:
+            self.flush()
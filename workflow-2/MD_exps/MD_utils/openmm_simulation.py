@@ -1,14 +1,276 @@
+import time
+
 import simtk.openmm.app as app
 import simtk.openmm as omm
 import simtk.unit as u
 
 import parmed as pmd
 import random
-from openmm_reporter import ContactMapReporter
+from openmm_reporter import ContactMapReporter, FeatureReporter, default_features
+from system_cache import cached_system
+
+
+# Default configuration of `SimulationEngine`.  A configuration describes the
+# system (force field options), the ensemble (integrator and barostat), the
+# preparation (minimization, initial velocities, equilibration) and the
+# reporters.  The performance related defaults are shared by all workflows:
+#
+#   - mixed precision on CUDA and OpenCL,
+#   - one report interval for all reporters, so that the state is fetched from
+#     the device once per report (rounded to a multiple of the barostat
+#     interval, so that reports are not taken between volume moves and
+#     energy evaluations of the barostat),
+#   - stepping in chunks of `chunk_time`, after which buffered reporters are
+#     flushed and the wall time limit `max_wall` (seconds) is checked.
+DEFAULTS = {
+    # system: `forcefield` files are used if no topology file is given, and
+    # the system is cached under `cache_name` (see `system_cache.py`)
+    'cache_name'        : 'system',
+    'forcefield'        : None,
+    'nonbonded_method'  : app.PME,
+    'cutoff'            : 1.2*u.nanometer,
+    'switch_distance'   : None,
+    'constraints'       : app.HBonds,
+    'implicit_solvent'  : None,
+    # ensemble: Langevin dynamics, barostat None, 'isotropic' or 'z'
+    'temperature'       : 300*u.kelvin,
+    'friction'          : 1/u.picosecond,
+    'dt'                : 0.002*u.picoseconds,
+    'constraint_tolerance': None,
+    'barostat'          : None,
+    'pressure'          : 1*u.bar,
+    'barostat_interval' : 25,
+    # preparation: start from a random frame of a multi-model coordinate file,
+    # minimize, set initial velocities, equilibrate before reporting
+    'random_frame'      : False,
+    'minimize'          : True,
+    'init_temperature'  : 10*u.kelvin,
+    'equilibrate_time'  : 0*u.picoseconds,
+    # platform and stepping
+    'precision'         : 'mixed',
+    'chunk_time'        : 1*u.nanoseconds,
+    'max_wall'          : None,
+    # reporters: any of 'dcd', 'cm', 'features', 'log', 'checkpoint'
+    'reporters'         : ['dcd', 'cm', 'features', 'log', 'checkpoint'],
+    'checkpoint_file'   : 'checkpnt.chk',
+}
+
+# configurations of the former `openmm_simulate_*` functions
+PRESETS = {
+    'charmm_nvt'  : {'cache_name'       : 'charmm',
+                     'switch_distance'  : 1.0*u.nanometer},
+    'amber_nvt'   : {'cache_name'       : 'amber'},
+    'amber_fs_pep': {'cache_name'       : 'amber_fs_pep',
+                     'forcefield'       : ['amber99sbildn.xml', 'amber99_obc.xml'],
+                     'nonbonded_method' : app.CutoffNonPeriodic,
+                     'cutoff'           : 1.0*u.nanometer,
+                     'implicit_solvent' : app.OBC1,
+                     'friction'         : 91.0/u.picosecond,
+                     'constraint_tolerance': 0.00001,
+                     'random_frame'     : True,
+                     'init_temperature' : 300*u.kelvin,
+                     'equilibrate_time' : 100*u.picoseconds},
+    'charmm_npt_z': {'cache_name'       : 'charmm',
+                     'switch_distance'  : 1.0*u.nanometer,
+                     'barostat'         : 'z'},
+    'amber_npt'   : {'cache_name'       : 'amber',
+                     'cutoff'           : 1.0*u.nanometer,
+                     'barostat'         : 'isotropic'},
+}
+
+
+class SimulationEngine(object):
+    """
+    Sets up and runs an OpenMM simulation from a declarative configuration
+    (see `DEFAULTS`), given as preset name (see `PRESETS`) and / or dict of
+    overrides:
+
+        engine = SimulationEngine('charmm_npt_z', {'max_wall': 3600})
+        engine.run(top_file, pdb_file, output_cm='output_cm.h5')
+
+    Systems are cached across runs (see `system_cache.py`).
+    """
+    def __init__(self, preset=None, config=None):
+        self.config = dict(DEFAULTS)
+        if preset:
+            self.config.update(PRESETS[preset])
+        if config:
+            self.config.update(config)
+
+    def create_system(self, top_file, pdb_file):
+        """
+        Returns the system, its topology and the parmed structure of the
+        coordinate file.
+        """
+        cfg = self.config
+        crd = pmd.load_file(pdb_file)
+
+        options = dict(nonbondedMethod=cfg['nonbonded_method'],
+                       nonbondedCutoff=cfg['cutoff'],
+                       constraints=cfg['constraints'])
+        if cfg['switch_distance'] is not None:
+            options['switchDistance'] = cfg['switch_distance']
+
+        if top_file:
+            if cfg['implicit_solvent'] is not None:
+                options['implicitSolvent'] = cfg['implicit_solvent']
+            def build():
+                top = pmd.load_file(top_file, xyz = pdb_file)
+                return top.createSystem(**options), top.topology
+            system, topology = cached_system(cfg['cache_name'], [top_file],
+                                             crd, options, build)
+        else:
+            # the implicit solvent is part of the force field files
+            forcefield_files = cfg['forcefield']
+            assert forcefield_files, 'need a topology file or force field'
+            def build():
+                forcefield = app.ForceField(*forcefield_files)
+                return forcefield.createSystem(crd.topology, **options), \
+                       crd.topology
+            system, topology = cached_system(cfg['cache_name'], [], crd,
+                    dict(options, forcefield=forcefield_files), build)
+
+        if cfg['barostat'] == 'isotropic':
+            system.addForce(omm.MonteCarloBarostat(cfg['pressure'],
+                    cfg['temperature'], cfg['barostat_interval']))
+        elif cfg['barostat'] == 'z':
+            barostat = omm.MonteCarloAnisotropicBarostat(
+                    (1, 1, 1)*cfg['pressure'], cfg['temperature'],
+                    False, False, True)
+            barostat.setFrequency(cfg['barostat_interval'])
+            system.addForce(barostat)
+
+        return system, topology, crd
+
+    def get_platform(self, GPU_index):
+        precision = self.config['precision']
+        try:
+            platform = omm.Platform_getPlatformByName("CUDA")
+            properties = {'DeviceIndex': str(GPU_index), 'CudaPrecision': precision}
+        except Exception:
+            platform = omm.Platform_getPlatformByName("OpenCL")
+            properties = {'DeviceIndex': str(GPU_index), 'OpenCLPrecision': precision}
+        return platform, properties
+
+    def create_simulation(self, top_file, pdb_file, GPU_index=0):
+        """
+        Returns the prepared (minimized, equilibrated) simulation.
+        """
+        cfg = self.config
+        system, topology, crd = self.create_system(top_file, pdb_file)
+
+        integrator = omm.LangevinIntegrator(cfg['temperature'], cfg['friction'],
+                                            cfg['dt'])
+        if cfg['constraint_tolerance'] is not None:
+            integrator.setConstraintTolerance(cfg['constraint_tolerance'])
+
+        platform, properties = self.get_platform(GPU_index)
+        simulation = app.Simulation(topology, system, integrator, platform,
+                                    properties)
+
+        if cfg['random_frame']:
+            # parmed \AA to OpenMM nm
+            simulation.context.setPositions(random.choice(crd.get_coordinates())/10)
+        else:
+            simulation.context.setPositions(crd.positions)
+
+        if cfg['minimize']:
+            simulation.minimizeEnergy()
+        simulation.context.setVelocitiesToTemperature(cfg['init_temperature'],
+                                                      random.randint(1, 10000))
+        if cfg['equilibrate_time'] > 0*u.picoseconds:
+            simulation.step(int(cfg['equilibrate_time'] / cfg['dt']))
+
+        return simulation
+
+    def report_interval(self, report_time):
+        """
+        Returns the report interval in steps, as multiple of the barostat
+        interval if a barostat is used.
+        """
+        steps = max(1, int(round(report_time / self.config['dt'])))
+        if self.config['barostat']:
+            align = self.config['barostat_interval']
+            steps = max(align, int(round(steps / align)) * align)
+        return steps
+
+    def add_reporters(self, simulation, report_freq, output_traj=None,
+                      output_log=None, output_cm=None, output_features=None,
+                      ref_pdb=None):
+        reporters = self.config['reporters']
+        if 'dcd' in reporters and output_traj:
+            simulation.reporters.append(app.DCDReporter(output_traj, report_freq))
+        if 'cm' in reporters and output_cm:
+            simulation.reporters.append(ContactMapReporter(output_cm, report_freq,
+                                                           simulation.topology))
+        if 'features' in reporters and output_features:
+            simulation.reporters.append(FeatureReporter(output_features, report_freq,
+                                                        default_features(ref_pdb),
+                                                        simulation.topology))
+        if 'log' in reporters and output_log:
+            simulation.reporters.append(app.StateDataReporter(output_log,
+                    report_freq, step=True, time=True, speed=True,
+                    potentialEnergy=True, temperature=True, totalEnergy=True))
+        if 'checkpoint' in reporters:
+            simulation.reporters.append(app.CheckpointReporter(
+                    self.config['checkpoint_file'], report_freq))
+
+    def step(self, simulation, nsteps):
+        """
+        Runs `nsteps` steps in chunks, and returns the number of steps done
+        (less than `nsteps` if the wall time limit was reached).
+        """
+        cfg = self.config
+        chunk = max(1, int(cfg['chunk_time'] / cfg['dt']))
+        start = time.time()
+        done = 0
+        while done < nsteps:
+            n = min(chunk, nsteps - done)
+            simulation.step(n)
+            done += n
+            for reporter in simulation.reporters:
+                if hasattr(reporter, 'flush'):
+                    reporter.flush()
+            if cfg['max_wall'] and done < nsteps:
+                elapsed = time.time() - start
+                # stop if the next chunk would not finish in time
+                if elapsed * (done + n) / done > cfg['max_wall']:
+                    if 'checkpoint' in cfg['reporters']:
+                        simulation.saveCheckpoint(cfg['checkpoint_file'])
+                    break
+        return done
+
+    def close(self, simulation):
+        for reporter in simulation.reporters:
+            if hasattr(reporter, 'close'):
+                reporter.close()
+
+    def run(self, top_file, pdb_file, check_point=None, GPU_index=0,
+            output_traj="output.dcd", output_log="output.log", output_cm=None,
+            output_features=None, ref_pdb=None,
+            report_time=10*u.picoseconds, sim_time=10*u.nanoseconds):
+        """
+        Sets up the simulation, adds the reporters, continues from
+        `check_point` (if given), and runs for `sim_time`.  Returns the
+        simulation.
+        """
+        simulation = self.create_simulation(top_file, pdb_file, GPU_index)
+        report_freq = self.report_interval(report_time)
+        self.add_reporters(simulation, report_freq, output_traj=output_traj,
+                           output_log=output_log, output_cm=output_cm,
+                           output_features=output_features, ref_pdb=ref_pdb)
+        if check_point:
+            simulation.loadCheckpoint(check_point)
+        try:
+            self.step(simulation, int(sim_time / self.config['dt']))
+        finally:
+            self.close(simulation)
+        return simulation
 
 
 def openmm_simulate_charmm_nvt(top_file, pdb_file, check_point=None, GPU_index=0,  
         output_traj="output.dcd", output_log="output.log", output_cm=None, 
+        output_features=None, ref_pdb=None,
         report_time=10*u.picoseconds, sim_time=10*u.nanoseconds): 
     """
     Start and run an OpenMM NVT simulation with Langevin integrator at 2 fs 
@@ -42,51 +304,26 @@ def openmm_simulate_charmm_nvt(top_file, pdb_file, check_point=None, GPU_index=0
  
     output_cm : the h5 file contains contact map information
 
+    output_features : the h5 file contains the features of each frame (contact
+        maps, RMSD to ref_pdb, radius of gyration, CA positions and energies)
+
+    ref_pdb : the reference pdb file for the RMSD in output_features
+
     report_time : 10 ps
         The program writes its information to the output every 10 ps by default 
 
     sim_time : 10 ns
         The timespan of the simulation trajectory
     """
-    
-    top = pmd.load_file(top_file, xyz = pdb_file)
-    
-    system = top.createSystem(nonbondedMethod=app.PME, nonbondedCutoff=1.2*u.nanometer,
-                              switchDistance=1.0*u.nanometer, constraints=app.HBonds)
-    dt = 0.002*u.picoseconds
-    integrator = omm.LangevinIntegrator(300*u.kelvin, 1/u.picosecond, dt)
-    
-    try: 
-        platform = omm.Platform_getPlatformByName("CUDA")
-        properties = {'DeviceIndex': str(GPU_index), 'CudaPrecision': 'mixed'} 
-    except Exception: 
-        platform = omm.Platform_getPlatformByName("OpenCL")
-        properties = {'DeviceIndex': str(GPU_index)} 
-    
-    simulation = app.Simulation(top.topology, system, integrator, platform, properties)
-    
-    simulation.context.setPositions(top.positions)
-    
-    simulation.minimizeEnergy()
-    
-    report_freq = int(report_time/dt)
-    simulation.context.setVelocitiesToTemperature(10*u.kelvin, random.randint(1, 10000))
-    simulation.reporters.append(app.DCDReporter(output_traj, report_freq))
-    if output_cm: 
-        simulation.reporters.append(ContactMapReporter(output_cm, report_freq))
-    simulation.reporters.append(app.StateDataReporter(output_log,
-            report_freq, step=True, time=True, speed=True,
-            potentialEnergy=True, temperature=True, totalEnergy=True))
-    simulation.reporters.append(app.CheckpointReporter('checkpnt.chk', report_freq))
-    
-    if check_point: 
-        simulation.loadCheckpoint(check_point)
-    nsteps = int(sim_time/dt)
-    simulation.step(nsteps)
-    
-   
+    SimulationEngine('charmm_nvt').run(top_file, pdb_file, check_point=check_point,
+            GPU_index=GPU_index, output_traj=output_traj, output_log=output_log,
+            output_cm=output_cm, output_features=output_features, ref_pdb=ref_pdb,
+            report_time=report_time, sim_time=sim_time)
+
+
 def openmm_simulate_amber_nvt(top_file, pdb_file, GPU_index=0, 
         output_traj="output.dcd", output_log="output.log", output_cm=None, 
+        output_features=None, ref_pdb=None,
         report_time=10*u.picoseconds, sim_time=10*u.nanoseconds): 
     """
     Start and run an OpenMM NVT simulation with Langevin integrator at 2 fs 
@@ -122,42 +359,15 @@ def openmm_simulate_amber_nvt(top_file, pdb_file, GPU_index=0,
     sim_time : 10 ns
         The timespan of the simulation trajectory
     """
-    
-    top = pmd.load_file(top_file, xyz = pdb_file)
-    
-    system = top.createSystem(nonbondedMethod=app.PME, nonbondedCutoff=1.2*u.nanometer,
-                              constraints=app.HBonds)
-    dt = 0.002*u.picoseconds
-    integrator = omm.LangevinIntegrator(300*u.kelvin, 1/u.picosecond, dt)
-    
-    try: 
-        platform = omm.Platform_getPlatformByName("CUDA")
-        properties = {'DeviceIndex': str(GPU_index), 'CudaPrecision': 'mixed'} 
-    except Exception: 
-        platform = omm.Platform_getPlatformByName("OpenCL")
-        properties = {'DeviceIndex': str(GPU_index)} 
-    
-    simulation = app.Simulation(top.topology, system, integrator, platform, properties)
-    
-    simulation.context.setPositions(top.positions)
-    
-    simulation.minimizeEnergy()
-    
-    report_freq = int(report_time/dt)
-    simulation.context.setVelocitiesToTemperature(10*u.kelvin, random.randint(1, 10000))
-    simulation.reporters.append(app.DCDReporter(output_traj, report_freq))
-    if output_cm:
-        simulation.reporters.append(ContactMapReporter(output_cm, report_freq))
-    simulation.reporters.append(app.StateDataReporter(output_log,
-            report_freq, step=True, time=True, speed=True,
-            potentialEnergy=True, temperature=True, totalEnergy=True))
-    
-    nsteps = int(sim_time/dt)
-    simulation.step(nsteps)
+    SimulationEngine('amber_nvt').run(top_file, pdb_file, check_point=None,
+            GPU_index=GPU_index, output_traj=output_traj, output_log=output_log,
+            output_cm=output_cm, output_features=output_features, ref_pdb=ref_pdb,
+            report_time=report_time, sim_time=sim_time)
 
 
 def openmm_simulate_amber_fs_pep(pdb_file, top_file=None, check_point=None, GPU_index=0,
         output_traj="output.dcd", output_log="output.log", output_cm=None,
+        output_features=None, ref_pdb=None,
         report_time=10*u.picoseconds, sim_time=10*u.nanoseconds):
     """
     Start and run an OpenMM NVT simulation with Langevin integrator at 2 fs 
@@ -187,62 +397,26 @@ def openmm_simulate_amber_fs_pep(pdb_file, top_file=None, check_point=None, GPU_
  
     output_cm : the h5 file contains contact map information
 
+    output_features : the h5 file contains the features of each frame (contact
+        maps, RMSD to ref_pdb, radius of gyration, CA positions and energies)
+
+    ref_pdb : the reference pdb file for the RMSD in output_features
+
     report_time : 10 ps
         The program writes its information to the output every 10 ps by default 
 
     sim_time : 10 ns
         The timespan of the simulation trajectory
     """
-
-    if top_file: 
-        pdb = pmd.load_file(top_file, xyz = pdb_file)
-        system = pdb.createSystem(nonbondedMethod=app.CutoffNonPeriodic, 
-                nonbondedCutoff=1.0*u.nanometer, constraints=app.HBonds, 
-                implicitSolvent=app.OBC1)
-    else: 
-        pdb = pmd.load_file(pdb_file)
-        forcefield = app.ForceField('amber99sbildn.xml', 'amber99_obc.xml')
-        system = forcefield.createSystem(pdb.topology, nonbondedMethod=app.CutoffNonPeriodic, 
-                nonbondedCutoff=1.0*u.nanometer, constraints=app.HBonds)
-
-    dt = 0.002*u.picoseconds
-    integrator = omm.LangevinIntegrator(300*u.kelvin, 91.0/u.picosecond, dt)
-    integrator.setConstraintTolerance(0.00001)
-
-    try:
-        platform = omm.Platform_getPlatformByName("CUDA")
-        properties = {'DeviceIndex': str(GPU_index), 'CudaPrecision': 'mixed'}
-    except Exception:
-        platform = omm.Platform_getPlatformByName("OpenCL")
-        properties = {'DeviceIndex': str(GPU_index)}
-
-    simulation = app.Simulation(pdb.topology, system, integrator, platform, properties)
-
-    simulation.context.setPositions(random.choice(pdb.get_coordinates())/10) #parmed \AA to OpenMM nm
-
-    # equilibrate
-    simulation.minimizeEnergy() 
-    simulation.context.setVelocitiesToTemperature(300*u.kelvin, random.randint(1, 10000))
-    simulation.step(int(100*u.picoseconds / (2*u.femtoseconds)))
-
-    report_freq = int(report_time/dt)
-    simulation.reporters.append(app.DCDReporter(output_traj, report_freq))
-    if output_cm:
-        simulation.reporters.append(ContactMapReporter(output_cm, report_freq))
-    simulation.reporters.append(app.StateDataReporter(output_log,
-            report_freq, step=True, time=True, speed=True,
-            potentialEnergy=True, temperature=True, totalEnergy=True))
-    simulation.reporters.append(app.CheckpointReporter('checkpnt.chk', report_freq))
-
-    if check_point:
-        simulation.loadCheckpoint(check_point)
-    nsteps = int(sim_time/dt)
-    simulation.step(nsteps)
-
+    SimulationEngine('amber_fs_pep').run(top_file, pdb_file, check_point=check_point,
+            GPU_index=GPU_index, output_traj=output_traj, output_log=output_log,
+            output_cm=output_cm, output_features=output_features, ref_pdb=ref_pdb,
+            report_time=report_time, sim_time=sim_time)
 
 
 def openmm_simulate_charmm_npt_z(top_file, pdb_file, check_point=None, GPU_index=0,
         output_traj="output.dcd", output_log="output.log", output_cm=None,
+        output_features=None, ref_pdb=None,
         report_time=10*u.picoseconds, sim_time=10*u.nanoseconds):
     """
     Start and run an OpenMM NVT simulation with Langevin integrator at 2 fs 
@@ -276,53 +450,26 @@ def openmm_simulate_charmm_npt_z(top_file, pdb_file, check_point=None, GPU_index
  
     output_cm : the h5 file contains contact map information
 
+    output_features : the h5 file contains the features of each frame (contact
+        maps, RMSD to ref_pdb, radius of gyration, CA positions and energies)
+
+    ref_pdb : the reference pdb file for the RMSD in output_features
+
     report_time : 10 ps
         The program writes its information to the output every 10 ps by default 
 
     sim_time : 10 ns
         The timespan of the simulation trajectory
     """
-
-    top = pmd.load_file(top_file, xyz = pdb_file)
-
-    system = top.createSystem(nonbondedMethod=app.PME, nonbondedCutoff=1.2*u.nanometer,
-                              switchDistance=1.0*u.nanometer, constraints=app.HBonds)
-    dt = 0.002*u.picoseconds
-    integrator = omm.LangevinIntegrator(300*u.kelvin, 1/u.picosecond, dt)
-
-    system.addForce(omm.MonteCarloAnisotropicBarostat((1, 1, 1)*u.bar, 300*u.kelvin, False, False, True)) 
-
-    try:
-        platform = omm.Platform_getPlatformByName("CUDA")
-        properties = {'DeviceIndex': str(GPU_index), 'CudaPrecision': 'mixed'}
-    except Exception:
-        platform = omm.Platform_getPlatformByName("OpenCL")
-        properties = {'DeviceIndex': str(GPU_index)}
-
-    simulation = app.Simulation(top.topology, system, integrator, platform, properties)
-
-    simulation.context.setPositions(top.positions)
-
-    simulation.minimizeEnergy()
-
-    report_freq = int(report_time/dt)
-    simulation.context.setVelocitiesToTemperature(10*u.kelvin, random.randint(1, 10000))
-    simulation.reporters.append(app.DCDReporter(output_traj, report_freq))
-    if output_cm:
-        simulation.reporters.append(ContactMapReporter(output_cm, report_freq))
-    simulation.reporters.append(app.StateDataReporter(output_log,
-            report_freq, step=True, time=True, speed=True,
-            potentialEnergy=True, temperature=True, totalEnergy=True))
-    simulation.reporters.append(app.CheckpointReporter('checkpnt.chk', report_freq))
-
-    if check_point:
-        simulation.loadCheckpoint(check_point)
-    nsteps = int(sim_time/dt)
-    simulation.step(nsteps)
+    SimulationEngine('charmm_npt_z').run(top_file, pdb_file, check_point=check_point,
+            GPU_index=GPU_index, output_traj=output_traj, output_log=output_log,
+            output_cm=output_cm, output_features=output_features, ref_pdb=ref_pdb,
+            report_time=report_time, sim_time=sim_time)
 
 
 def openmm_simulate_amber_npt(top_file, pdb_file, check_point, GPU_index=0,
         output_traj="output.dcd", output_log="output.log", output_cm=None,
+        output_features=None, ref_pdb=None,
         report_time=10*u.picoseconds, sim_time=10*u.nanoseconds):
     """
     Start and run an OpenMM NVT simulation with Langevin integrator at 2 fs 
@@ -358,39 +505,7 @@ def openmm_simulate_amber_npt(top_file, pdb_file, check_point, GPU_index=0,
     sim_time : 10 ns
         The timespan of the simulation trajectory
     """
-
-    top = pmd.load_file(top_file, xyz = pdb_file)
-
-    system = top.createSystem(nonbondedMethod=app.PME, nonbondedCutoff=1*u.nanometer,
-                              constraints=app.HBonds)
-    dt = 0.002*u.picoseconds
-    integrator = omm.LangevinIntegrator(300*u.kelvin, 1/u.picosecond, dt)
-    system.addForce(omm.MonteCarloBarostat(1*u.bar, 300*u.kelvin))
-
-    try:
-        platform = omm.Platform_getPlatformByName("CUDA")
-        properties = {'DeviceIndex': str(GPU_index), 'CudaPrecision': 'mixed'}
-    except Exception:
-        platform = omm.Platform_getPlatformByName("OpenCL")
-        properties = {'DeviceIndex': str(GPU_index)}
-
-    simulation = app.Simulation(top.topology, system, integrator, platform, properties)
-
-    simulation.context.setPositions(top.positions)
-
-    simulation.minimizeEnergy()
-
-    report_freq = int(report_time/dt)
-    simulation.context.setVelocitiesToTemperature(10*u.kelvin, random.randint(1, 10000))
-    simulation.reporters.append(app.DCDReporter(output_traj, report_freq))
-    if output_cm:
-        simulation.reporters.append(ContactMapReporter(output_cm, report_freq))
-    simulation.reporters.append(app.StateDataReporter(output_log,
-            report_freq, step=True, time=True, speed=True,
-            potentialEnergy=True, temperature=True, totalEnergy=True))
-    simulation.reporters.append(app.CheckpointReporter('checkpnt.chk', report_freq))
-
-    if check_point:
-        simulation.loadCheckpoint(check_point)
-    nsteps = int(sim_time/dt)
-    simulation.step(nsteps)
+    SimulationEngine('amber_npt').run(top_file, pdb_file, check_point=check_point,
+            GPU_index=GPU_index, output_traj=output_traj, output_log=output_log,
+            output_cm=output_cm, output_features=output_features, ref_pdb=ref_pdb,
+            report_time=report_time, sim_time=sim_time)
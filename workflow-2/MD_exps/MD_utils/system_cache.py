@@ -0,0 +1,111 @@
+import os
+import re
+import socket
+import hashlib
+
+import simtk.openmm.app as app
+import simtk.openmm as omm
+
+# Setting up a System (reading the topology with parmed and `createSystem`)
+# takes tens of seconds for solvated systems, and is the same for every MD task
+# of a DeepDriveMD loop, including restarts from outliers: only the
+# coordinates differ.  The System is thus cached on disk as `XmlSerializer`
+# output, together with the topology (as PDB), keyed by a hash of the topology
+# file (and the files it `#include`s), the atoms of the coordinate file and the
+# `createSystem` options.  The
+# cache directory can be set with `$OMM_SYSTEM_CACHE` (set it to an empty
+# string to disable the cache).
+CACHE_DIR = os.environ.get('OMM_SYSTEM_CACHE',
+                           os.path.expanduser('~/.cache/omm_systems'))
+
+
+INCLUDE = re.compile(rb'^\s*#\s*include\s+[<"]([^>"]+)[>"]', re.MULTILINE)
+
+
+def included_files(fname, seen=None):
+    """
+    Returns `fname` and the files it `#include`s (recursively, as for GROMACS
+    topologies), resolved relative to the directory of the including file.
+    Includes which cannot be resolved there (e.g. from `$GMXLIB`) are skipped.
+    """
+    if seen is None:
+        seen = list()
+    fname = os.path.abspath(fname)
+    if fname in seen:
+        return seen
+    seen.append(fname)
+    with open(fname, 'rb') as fin:
+        data = fin.read()
+    for include in INCLUDE.findall(data):
+        path = os.path.join(os.path.dirname(fname), include.decode())
+        if os.path.isfile(path):
+            included_files(path, seen)
+    return seen
+
+
+def system_key(files, structure, options):
+    """
+    Returns a hash of the contents of the given files and the files they
+    include, of the atom and residue names of the parmed `structure` (not its
+    coordinates), and of the options.
+    """
+    h = hashlib.sha1()
+    for fname in files:
+        if not fname:
+            continue
+        for path in included_files(fname):
+            with open(path, 'rb') as fin:
+                h.update(fin.read())
+    for atom in structure.atoms:
+        h.update(('%s:%s\n' % (atom.residue.name, atom.name)).encode())
+    for key in sorted(options):
+        h.update(('%s=%s\n' % (key, options[key])).encode())
+    return h.hexdigest()
+
+
+def cached_system(name, files, structure, options, build, cache_dir=None):
+    """
+    Returns `(system, topology)` for the `structure` from the cache, or from
+    `build()` (which also returns `(system, topology)`) if it is not cached
+    yet - the result is then stored in the cache.  The default periodic box of
+    the system is set to the box of `structure`, so that cached systems can be
+    used for restarts with a different box.
+    """
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+
+    if cache_dir:
+        path = os.path.join(cache_dir, '%s.%s' % (name, system_key(files,
+                                                         structure, options)))
+    if cache_dir and os.path.isfile(path + '.xml') and \
+            os.path.isfile(path + '.pdb'):
+        with open(path + '.xml', 'r') as fin:
+            system = omm.XmlSerializer.deserialize(fin.read())
+        topology = app.PDBFile(path + '.pdb').topology
+
+    else:
+        system, topology = build()
+        if cache_dir:
+            # other tasks (also on other nodes, for a shared file system) may
+            # fill the cache concurrently.  A failure to write the cache is
+            # not fatal: the task continues with the built system.
+            tmp = '%s.%s.%d.tmp' % (path, socket.gethostname(), os.getpid())
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                with open(tmp, 'w') as fout:
+                    app.PDBFile.writeFile(topology, structure.positions, fout,
+                                          keepIds=True)
+                os.rename(tmp, path + '.pdb')
+                with open(tmp, 'w') as fout:
+                    fout.write(omm.XmlSerializer.serialize(system))
+                os.rename(tmp, path + '.xml')
+            except OSError as e:
+                print('cannot cache system in %s: %s' % (path, e))
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+
+    if system.usesPeriodicBoundaryConditions() and structure.box is not None:
+        system.setDefaultPeriodicBoxVectors(*structure.box_vectors)
+        topology.setPeriodicBoxVectors(structure.box_vectors)
+
+    return system, topology
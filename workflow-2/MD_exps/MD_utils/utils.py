@@ -10,9 +10,14 @@ from keras import backend as K
 from molecules.utils.matrix_op import triu_to_full
 
 from CVAE import CVAE
+from openmm_reporter import ContactMapReader
 
 def read_h5py_file(h5_file): 
     cm_h5 = h5py.File(h5_file, 'r', libver='latest', swmr=True)
+    if u'contact_maps_packed' in cm_h5: 
+        # bit packed rows, unpacked on demand
+        cm_h5.close()
+        return ContactMapReader(h5_file)
     return cm_h5[u'contact_maps'] 
 
 def start_rabbit(rabbitmq_log): 
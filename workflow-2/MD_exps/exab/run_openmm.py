@@ -12,6 +12,7 @@ parser = argparse.ArgumentParser()
 parser.add_argument("-f", help="pdb file")
 parser.add_argument("-p", help="topology file")
 parser.add_argument("-c", help="check point file to restart simulation")
+parser.add_argument("-r", help="reference pdb file for the RMSD in the features file")
 
 args = parser.parse_args()
 
@@ -30,6 +31,11 @@ if args.c:
 else:
     check_point = None
 
+if args.r:
+    ref_pdb_file = os.path.abspath(args.r)
+else:
+    ref_pdb_file = None
+
 gpu_index = 0
 
 openmm_simulate_charmm_npt_z(top_file, pdb_file,
@@ -38,6 +44,8 @@ openmm_simulate_charmm_npt_z(top_file, pdb_file,
                            output_traj="output.dcd",
                            output_log="output.log",
                            output_cm='output_cm.h5',
+                           output_features='output_features.h5',
+                           ref_pdb=ref_pdb_file,
                            report_time=50*u.picoseconds,
                            sim_time=10000*u.nanoseconds)
 
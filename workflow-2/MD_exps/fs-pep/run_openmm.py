@@ -10,6 +10,9 @@ parser.add_argument("-p", "--topol", dest='p', help="topology file")
 parser.add_argument("-c", help="check point file to restart simulation")
 parser.add_argument("-l", "--length", default=10, help="how long (ns) the system will be simulated")
 parser.add_argument("-g", "--gpu", default=0, help="id of gpu to use for the simulation")
+parser.add_argument("-r", "--ref", dest="r",
+                    default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdb/fs-peptide.pdb'),
+                    help="reference pdb file for the RMSD in the features file")
 args = parser.parse_args() 
 
 if args.f: 
@@ -26,8 +29,9 @@ if args.c:
     check_point = os.path.abspath(args.c) 
 else: 
     check_point = None 
+
+ref_pdb_file = os.path.abspath(args.r) 
 # pdb_file = os.path.abspath('./pdb/100-fs-peptide-400K.pdb')
-# ref_pdb_file = os.path.abspath('./pdb/fs-peptide.pdb')
 
 gpu_index = 0 # os.environ["CUDA_VISIBLE_DEVICES"]
 
@@ -38,6 +42,8 @@ openmm_simulate_amber_fs_pep(pdb_file,
                              output_traj="output.dcd",
                              output_log="output.log",
                              output_cm='output_cm.h5',
+                             output_features='output_features.h5',
+                             ref_pdb=ref_pdb_file,
                              report_time=50*u.picoseconds,
                              sim_time=float(args.length)*u.nanoseconds)
 
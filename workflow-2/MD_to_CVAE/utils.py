@@ -14,6 +14,14 @@ def triu_to_full(cm0):
 
 def read_h5py_file(h5_file): 
     cm_h5 = h5py.File(h5_file, 'r', libver='latest', swmr=True)
+    if u'contact_maps_packed' in cm_h5: 
+        # bit packed rows (see `ContactMapReporter`): unpack to the former
+        # (n_pairs, n_frames) layout
+        packed = cm_h5[u'contact_maps_packed']
+        n_pairs = int(packed.attrs['n_pairs'])
+        cm_data = np.unpackbits(packed[:], axis=1, count=n_pairs).T
+        cm_h5.close()
+        return cm_data.astype(np.float32)
     return cm_h5[u'contact_maps'] 
 
 
@@ -5,7 +5,7 @@ from glob import glob
 import MDAnalysis as mda
 from utils import read_h5py_file, outliers_from_cvae, cm_to_cvae  
 from utils import predict_from_cvae, outliers_from_latent
-from utils import find_frame, write_pdb_frame, make_dir_p 
+from utils import find_frame, write_pdb_frame, make_dir_p, read_rmsd 
 from  MDAnalysis.analysis.rms import RMSD
 
 # os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3' 
@@ -23,7 +23,7 @@ args = parser.parse_args()
 
 # Pdb file for MDAnalysis 
 pdb_file = os.path.abspath(args.pdb) 
-ref_pdb_file = os.path.abspath(args.ref) 
+ref_pdb_file = os.path.abspath(args.ref) if args.ref else None 
 
 # Find the trajectories and contact maps 
 cm_files_list = sorted(glob(os.path.join(args.md, 'omm_runs_*/*_cm.h5')))
@@ -162,15 +162,31 @@ if DEBUG:
 if DEBUG: 
     print (restart_pdbs)
 
-# rank the restart_pdbs according to their RMSD to local state 
-if ref_pdb_file: 
-    outlier_traj = mda.Universe(restart_pdbs[0], restart_pdbs) 
+# rank the restart_pdbs according to their RMSD to the reference state, as 
+# recorded by the MD runs in their features files (see `FeatureReporter`), the 
+# outlier pdbs are named `<run dir>_<frame>.pdb` 
+restart_rmsds = [] 
+for restart_pdb in restart_pdbs: 
+    run_dir, num_frame = os.path.splitext(os.path.basename(restart_pdb))[0].rsplit('_', 1) 
+    features_file = os.path.join(args.md, run_dir, 'output_features.h5') 
+    restart_rmsds.append(read_rmsd(features_file, int(num_frame))) 
+
+# runs without RMSD record (e.g. older runs): compute the RMSD from the pdbs 
+missing = [i for i, rmsd in enumerate(restart_rmsds) if rmsd is None] 
+if missing and ref_pdb_file: 
+    missing_pdbs = [restart_pdbs[i] for i in missing] 
+    outlier_traj = mda.Universe(missing_pdbs[0], missing_pdbs) 
     ref_traj = mda.Universe(ref_pdb_file) 
     R = RMSD(outlier_traj, ref_traj, select='protein and name CA') 
     R.run()    
+    for i, rmsd in zip(missing, R.rmsd[:,2]): 
+        restart_rmsds[i] = rmsd 
+    missing = [] 
+
+if restart_pdbs and not missing: 
     # Make a dict contains outliers and their RMSD
-    # outlier_pdb_RMSD = dict(zip(restart_pdbs, R.rmsd[:,2]))
-    restart_pdbs = [pdb for _, pdb in sorted(zip(R.rmsd[:,2], restart_pdbs))] 
+    # outlier_pdb_RMSD = dict(zip(restart_pdbs, restart_rmsds))
+    restart_pdbs = [pdb for _, pdb in sorted(zip(restart_rmsds, restart_pdbs))] 
 else: 
     random.shuffle(restart_pdbs) 
 
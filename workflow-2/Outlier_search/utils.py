@@ -20,7 +20,33 @@ def triu_to_full(cm0):
 
 def read_h5py_file(h5_file): 
     cm_h5 = h5py.File(h5_file, 'r', libver='latest', swmr=True)
-    return cm_h5[u'contact_maps'] 
+    if u'contact_maps_packed' in cm_h5: 
+        # bit packed rows (see `ContactMapReporter`): unpack to the former
+        # (n_pairs, n_frames) layout
+        packed = cm_h5[u'contact_maps_packed']
+        n_pairs = int(packed.attrs['n_pairs'])
+        cm_data = np.unpackbits(packed[:], axis=1, count=n_pairs).T
+        cm_h5.close()
+        return cm_data.astype(np.float32)
+    return cm_h5[u'contact_maps']
+
+
+def read_rmsd(features_file, frame_number):
+    """
+    Returns the RMSD of a frame as recorded by `FeatureReporter` in the
+    features file of its MD run, or None if the run has no RMSD record for
+    that frame (no features file, no reference pdb, or frame not yet flushed)
+    """
+    if not os.path.exists(features_file):
+        return None
+    with h5py.File(features_file, 'r', libver='latest', swmr=True) as f_h5:
+        if u'rmsd' not in f_h5:
+            return None
+        rmsd = f_h5[u'rmsd']
+        rmsd.refresh()
+        if frame_number >= rmsd.shape[0]:
+            return None
+        return float(rmsd[frame_number])
 
 
 def cm_to_cvae(cm_data_lists): 